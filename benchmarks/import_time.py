@@ -0,0 +1,92 @@
+"""
+Import time benchmark
+---------------------
+
+Measures, in fresh interpreters, the time to import the package and to
+access its main entry points, and checks that `import pyextinction` alone
+loads neither scipy nor the unit registry.
+
+.. example::
+
+    python benchmarks/import_time.py --repeat 10 --max-import 20
+"""
+import os
+import sys
+import argparse
+import subprocess
+
+#: name -> statements timed after `import pyextinction`
+SCENARIOS = (('import pyextinction', ''),
+             ('Cardelli', 'pyextinction.Cardelli'),
+             ('Calzetti', 'pyextinction.Calzetti'),
+             ('Fitzpatrick99', 'pyextinction.Fitzpatrick99'),
+             ('unit registry', 'pyextinction.unit'))
+
+_template = """
+import time
+t0 = time.perf_counter()
+import pyextinction
+{0}
+t1 = time.perf_counter()
+import sys
+ezunits = sys.modules.get('pyextinction.ezunits')
+print(t1 - t0, 'scipy' in sys.modules, 'unit' in vars(ezunits or sys))
+"""
+
+
+def run_once(statement):
+    """ Time a statement in a new interpreter
+
+    Parameters
+    ----------
+    statement: str
+        python code executed after `import pyextinction`
+
+    Returns
+    -------
+    t: float
+        wall time of the import and statement in seconds
+
+    scipy_loaded: bool
+        True if scipy was imported
+
+    unit_loaded: bool
+        True if the default unit registry was created
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([root] + [p for p in env.get('PYTHONPATH', '').split(os.pathsep) if p])
+    out = subprocess.check_output([sys.executable, '-c', _template.format(statement)], env=env)
+    t, scipy_loaded, unit_loaded = out.decode().split()
+    return float(t), scipy_loaded == 'True', unit_loaded == 'True'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[4])
+    parser.add_argument('--repeat', type=int, default=5, help='number of interpreters per scenario')
+    parser.add_argument('--max-import', type=float, default=None,
+                        help='fail if `import pyextinction` takes more than this many ms')
+    args = parser.parse_args(argv)
+
+    # warm-up: compile the byte code
+    run_once('')
+
+    status = 0
+    for name, statement in SCENARIOS:
+        runs = [run_once(statement) for _ in range(args.repeat)]
+        times = sorted(r[0] for r in runs)
+        median = 1e3 * times[len(times) // 2]
+        print('{0:20s} {1:8.2f} ms (min {2:.2f} ms)'.format(name, median, 1e3 * times[0]))
+        if not statement:
+            _, scipy_loaded, unit_loaded = runs[0]
+            if scipy_loaded or unit_loaded:
+                print('  import pyextinction loaded scipy: {0}, unit registry: {1}'.format(scipy_loaded, unit_loaded))
+                status = 1
+            if (args.max_import is not None) and (median > args.max_import):
+                print('  import time above {0:.2f} ms'.format(args.max_import))
+                status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,285 @@
+"""
+Law evaluation benchmarks
+-------------------------
+
+Times every law for wavelength arrays of 1 to 10^7 values, scalar or array
+Rv, plain or unit-carrying (angstrom, micron, nm) wavelengths and repeated or
+fresh parameter values, together with unit parsing and conversion
+microbenchmarks.  Results (time and peak memory per call) are written as
+JSON so that runs can be compared.
+
+Only the plain law call `law(lamb, Av=..., Rv=...)` and the unit registry
+are required, so that the same script runs on older versions of the
+package: unit benchmarks of missing features are skipped and cases that
+fail are recorded with their error instead of a time.
+
+.. example::
+
+    python benchmarks/laws.py --output before.json
+    python benchmarks/laws.py --max-size 100000 --laws Cardelli Fitzpatrick99
+    python benchmarks/laws.py --compare before.json after.json
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tracemalloc
+import warnings
+import numpy as np
+
+# benchmark the checkout this script belongs to
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+#: law name -> constructor statement (evaluated in the pyextinction namespace)
+LAWS = (('Cardelli', 'Cardelli()'),
+        ('Calzetti', 'Calzetti()'),
+        ('Fitzpatrick99', 'Fitzpatrick99()'),
+        ('Gordon03_SMCBar', 'Gordon03_SMCBar()'),
+        ('MixtureLaw', 'MixtureLaw(Fitzpatrick99(), Gordon03_SMCBar())'))
+
+SIZES = tuple(10 ** k for k in range(8))
+
+#: wavelength inputs: None for plain arrays (in angstrom), unit name otherwise
+INPUTS = (('ndarray', None), ('angstrom', 'angstrom'), ('micron', 'micron'),
+          ('nm', 'nm'))
+
+#: maximum number of values of array Rv results (curves x wavelengths)
+MAX_VALUES = 10 ** 7
+
+
+def timed(func, budget=0.2, max_calls=10000):
+    """ Time per call of func, repeated until budget seconds are spent
+
+    Parameters
+    ----------
+    func: callable
+        function without arguments
+
+    budget: float
+        minimum time spent in seconds (at least one call is made)
+
+    max_calls: int
+        maximum number of calls
+
+    Returns
+    -------
+    t: float
+        best time per call in seconds over the batches of calls
+
+    calls: int
+        total number of calls
+    """
+    calls = 0
+    best = np.inf
+    number = 1
+    start = time.perf_counter()
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(number):
+            func()
+        t1 = time.perf_counter()
+        calls += number
+        best = min(best, (t1 - t0) / number)
+        if (t1 - start >= budget) or (calls >= max_calls):
+            return best, calls
+        if t1 - t0 < 0.01:
+            number *= 2
+
+
+def peak_memory(func):
+    """ Peak memory allocated during one call of func, in bytes """
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        func()
+        return tracemalloc.get_traced_memory()[1] - base
+    finally:
+        tracemalloc.stop()
+
+
+def law_cases(laws, sizes, inputs):
+    """ Law benchmark cases
+
+    Returns
+    -------
+    cases: list
+        (description dict, function without arguments) of each case
+    """
+    import pyextinction
+    from pyextinction import unit
+    names = ('Cardelli', 'Calzetti', 'Fitzpatrick99', 'Gordon03_SMCBar', 'MixtureLaw')
+    namespace = dict((k, getattr(pyextinction, k)) for k in names)
+    rng = np.random.RandomState(0)
+
+    cases = []
+    for law_name, statement in LAWS:
+        if law_name not in laws:
+            continue
+        law = eval(statement, namespace)
+        for size in sizes:
+            lamb_A = np.linspace(1000., 30000., size)
+            for input_name, unit_name in INPUTS:
+                if input_name not in inputs:
+                    continue
+                if unit_name is None:
+                    lamb = lamb_A
+                else:
+                    factor = unit['angstrom'].to(unit_name).magnitude
+                    lamb = (lamb_A * factor) * unit[unit_name]
+                for Rv_mode in ('scalar', 'array'):
+                    ncurves = 1 if Rv_mode == 'scalar' else max(1, min(100, MAX_VALUES // size))
+                    for params in ('repeated', 'fresh'):
+                        desc = dict(group='law', law=law_name, size=size,
+                                    input=input_name, Rv=Rv_mode,
+                                    ncurves=ncurves, params=params)
+                        cases.append((desc, _law_call(law, lamb, Rv_mode,
+                                                      ncurves, params, rng)))
+    return cases
+
+
+def _law_call(law, lamb, Rv_mode, ncurves, params, rng):
+    """ Function evaluating a law for a benchmark case """
+    def draw():
+        if Rv_mode == 'scalar':
+            return float(rng.uniform(2.5, 4.5))
+        return rng.uniform(2.5, 4.5, ncurves)
+
+    if params == 'repeated':
+        Rv = draw()
+        return lambda: law(lamb, Av=1.0, Rv=Rv)
+    return lambda: law(lamb, Av=1.0, Rv=draw())
+
+
+def unit_cases():
+    """ Unit registry parsing and conversion benchmark cases """
+    from pyextinction import unit, helpers
+    lamb = np.linspace(1., 3., 1000)
+    q = lamb * unit['micron']
+
+    def fresh_parse():
+        unit.clear_cache()
+        unit['km / s / Mpc']
+
+    cases = [('parse (cached)', lambda: unit['km / s / Mpc']),
+             ('Quantity.to', lambda: q.to('angstrom')),
+             ('val_in_unit', lambda: helpers.val_in_unit('lamb', q, 'angstrom'))]
+    # features of recent versions only (looked up on the class: older unit
+    # registries parse unknown attributes as unit names)
+    if hasattr(type(unit), 'clear_cache'):
+        cases.append(('parse (fresh)', fresh_parse))
+    if hasattr(type(unit), 'get_conversion_factor'):
+        cases.append(('conversion factor',
+                      lambda: unit.get_conversion_factor('micron', 'angstrom')))
+    if hasattr(helpers, 'magnitude_in_unit'):
+        cases.append(('magnitude_in_unit',
+                      lambda: helpers.magnitude_in_unit('lamb', q, 'angstrom')))
+        cases.append(('magnitude_in_unit (no units)',
+                      lambda: helpers.magnitude_in_unit('lamb', lamb, 'angstrom', 'assume')))
+    return [(dict(group='units', name=name), func) for name, func in cases]
+
+
+def run(cases, budget=0.2, verbose=True):
+    """ Run benchmark cases
+
+    Parameters
+    ----------
+    cases: list
+        (description dict, function) pairs
+
+    budget: float
+        time spent per case in seconds
+
+    Returns
+    -------
+    results: list
+        description dicts completed with time (s), calls and peak_memory
+        (bytes) per call, or with the error of cases that cannot run
+    """
+    results = []
+    for desc, func in cases:
+        try:
+            func()  # warm-up: imports, caches of repeated parameters
+        except Exception as e:
+            results.append(dict(desc, error='{0}: {1}'.format(type(e).__name__, e)))
+            if verbose:
+                print('{0} failed: {1}'.format(desc, results[-1]['error']), file=sys.stderr)
+            continue
+        t, calls = timed(func, budget)
+        r = dict(desc, time=t, calls=calls, peak_memory=peak_memory(func))
+        results.append(r)
+        if verbose:
+            label = ' '.join('{0}={1}'.format(k, v) for k, v in desc.items() if k != 'group')
+            print('{0:90s} {1:12.3f} us {2:12d} B'.format(label, 1e6 * t, r['peak_memory']),
+                  file=sys.stderr)
+    return results
+
+
+def metadata():
+    """ Description of the environment of a run """
+    import pyextinction
+    meta = dict(python=platform.python_version(), numpy=np.__version__,
+                platform=platform.platform(), machine=platform.machine(),
+                date=time.strftime('%Y-%m-%dT%H:%M:%S'))
+    kernels = getattr(pyextinction, 'kernels', None)
+    meta['backend'] = 'numpy' if kernels is None else kernels.get_backend()
+    return meta
+
+
+def _key(r):
+    """ Key identifying a benchmark case in a result file """
+    return tuple(sorted((k, v) for k, v in r.items()
+                        if k not in ('time', 'calls', 'peak_memory', 'error')))
+
+
+def compare(before, after):
+    """ Print the time and memory ratios of two result files """
+    with open(before) as f:
+        old = dict((_key(r), r) for r in json.load(f)['results'])
+    with open(after) as f:
+        new = json.load(f)['results']
+    for r in new:
+        o = old.get(_key(r))
+        if (o is None) or ('error' in o) or ('error' in r):
+            continue
+        label = ' '.join('{0}={1}'.format(k, v) for k, v in _key(r) if k != 'group')
+        print('{0:90s} time x{1:7.3f} memory x{2:7.3f}'.format(
+            label, r['time'] / o['time'], (r['peak_memory'] + 1.) / (o['peak_memory'] + 1.)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[4])
+    parser.add_argument('--laws', nargs='+', default=[k for k, _ in LAWS])
+    parser.add_argument('--max-size', type=int, default=max(SIZES),
+                        help='largest wavelength array')
+    parser.add_argument('--inputs', nargs='+', default=[k for k, _ in INPUTS])
+    parser.add_argument('--budget', type=float, default=0.2, help='seconds per case')
+    parser.add_argument('--no-units', action='store_true', help='skip the unit microbenchmarks')
+    parser.add_argument('--output', default=None, help='JSON file (default: stdout)')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'),
+                        help='compare two result files instead of running')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return 0
+
+    warnings.simplefilter('ignore')
+    sizes = [s for s in SIZES if s <= args.max_size]
+    cases = law_cases(args.laws, sizes, args.inputs)
+    if not args.no_units:
+        cases = unit_cases() + cases
+    results = dict(meta=metadata(), results=run(cases, args.budget))
+
+    if args.output is None:
+        json.dump(results, sys.stdout, indent=1)
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
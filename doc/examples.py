@@ -49,11 +49,12 @@ plt.figure()
 mixture = pyextinction.Fitzpatrick99() + pyextinction.Gordon03_SMCBar()
 
 Rv = 3.1
-f_A_vals = (0.1, 0.25, 0.5, 0.75, 0.9)
+f_A_vals = np.array([0.1, 0.25, 0.5, 0.75, 0.9])
 
-for f_A in f_A_vals:
-        plt.plot(x, mixture(lamb, Rv=Rv, f_A=f_A),
-                 label=r'f$_A$={0:0.2f}'.format(f_A), lw=2)
+# one curve per f_A value, shape (5, len(lamb))
+curves = mixture(lamb, Rv=Rv, f_A=f_A_vals)
+for f_A, curve in zip(f_A_vals, curves):
+        plt.plot(x, curve, label=r'f$_A$={0:0.2f}'.format(f_A), lw=2)
 plt.legend(loc='upper left', frameon=False)
 plt.xlabel(r'Wave number [$\mu$m$^{-1}$]')
 plt.ylabel(r'$A(\lambda) / A(V)$')
@@ -1,6 +1,50 @@
-from .extinction import ExtinctionLaw, MixtureLaw
-from .fitzpatrick import Fitzpatrick99
-from .gordon import Gordon03_SMCBar
-from .cardelli import Cardelli
-from .calzetti import Calzetti
-from .ezunits import unit
+"""
+Common interface to extinction laws
+
+The laws, the unit registry and their dependencies (scipy, ...) are only
+imported on first access, e.g., `pyextinction.Cardelli`.
+"""
+import importlib
+
+#: public name -> submodule defining it
+_lazy = {'ExtinctionLaw': 'extinction',
+         'MixtureLaw': 'extinction',
+         'MultiMixtureLaw': 'extinction',
+         'WavelengthGrid': 'extinction',
+         'GriddedLaw': 'gridded',
+         'BandExtinction': 'bands',
+         'redden_library': 'library',
+         'GridEvaluator': 'parallel',
+         'evaluate_grid': 'parallel',
+         'EvaluationServer': 'server',
+         'EvaluationClient': 'server',
+         'kernels': None,
+         'instrument': None,
+         'stats': 'instrument',
+         'Fitzpatrick99': 'fitzpatrick',
+         'Gordon03_SMCBar': 'gordon',
+         'Cardelli': 'cardelli',
+         'Calzetti': 'calzetti',
+         'unit': 'ezunits',
+         'set_unit_policy': 'helpers',
+         'get_unit_policy': 'helpers',
+         'unit_policy': 'helpers'}
+
+__all__ = list(_lazy)
+
+
+def __getattr__(name):
+    try:
+        module = _lazy[name]
+    except KeyError:
+        raise AttributeError('module {0!r} has no attribute {1!r}'.format(__name__, name))
+    if module is None:
+        value = importlib.import_module('.' + name, __name__)
+    else:
+        value = getattr(importlib.import_module('.' + module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
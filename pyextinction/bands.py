@@ -0,0 +1,243 @@
+"""
+Band-integrated extinction
+--------------------------
+
+:class:`BandExtinction` computes the extinction of photometric bands, i.e.,
+the magnitude change of spectra observed through filters
+
+.. math::
+
+    A_b = -2.5 \\log_{10} \\frac{\\int F_s(\\lambda) T_b(\\lambda)
+          10^{-0.4 A(\\lambda)} \\lambda d\\lambda}
+          {\\int F_s(\\lambda) T_b(\\lambda) \\lambda d\\lambda}
+
+The integration weights of every (spectrum, filter) pair are precomputed
+once, so that the band extinctions of many (Av, Rv, ...) values are a matrix
+product with the transmitted fractions :math:`10^{-0.4 A(\\lambda)}`.
+
+.. example::
+
+    engine = BandExtinction(Fitzpatrick99(), lamb, filters, seds)
+    Ab = engine(Av=Av, Rv=Rv, sed=sed_index)     # (N, nfilters)
+    Ab = engine(Av=Av, Rv=Rv)                    # (N, nseds, nfilters)
+"""
+import hashlib
+import numpy as np
+
+from .extinction import WavelengthGrid
+from .helpers import magnitude_in_unit, LRUCache
+
+__all__ = ['BandExtinction']
+
+
+def trapz_weights(lamb):
+    """ Weights of the trapezoidal rule on sorted abscissa
+
+    Parameters
+    ----------
+    lamb: ndarray
+        sorted abscissa (1-d)
+
+    Returns
+    -------
+    w: ndarray
+        weights such that np.dot(w, y) == np.trapz(y, lamb)
+    """
+    w = np.zeros(len(lamb))
+    if len(lamb) > 1:
+        dl = np.diff(lamb)
+        w[:-1] += 0.5 * dl
+        w[1:] += 0.5 * dl
+    return w
+
+
+class BandExtinction(object):
+    """ Extinction of photometric bands for a library of spectra
+
+    Attributes
+    ----------
+    law: ExtinctionLaw
+        extinction law
+
+    grid: WavelengthGrid
+        wavelengths at which the law is evaluated (the spectrum wavelengths
+        where any filter transmits)
+
+    weights: ndarray
+        normalized integration weights of shape (nseds, nfilters, grid.size)
+
+    tensor_cache: LRUCache
+        class-level cache of the grids and weights indexed by the
+        wavelengths, filters, spectra and photon mode.  The weights do not
+        depend on the law, so that the engines of every law on the same data
+        share them; the law terms are cached per law by the shared grid.
+    """
+
+    tensor_cache = LRUCache(16, name='band_tensors')
+
+    def __init__(self, law, lamb, filters, seds=None, photon=True):
+        """ Constructor
+
+        Parameters
+        ----------
+        law: ExtinctionLaw
+            extinction law
+
+        lamb: ndarray or Quantity
+            wavelengths of the spectra [in Angstroms if no units], sorted
+
+        filters: ndarray or sequence
+            transmission curves, either an array of shape (nfilters,
+            len(lamb)) sampled at lamb, or a sequence of (wavelengths,
+            transmissions) pairs interpolated at lamb (0 outside)
+
+        seds: ndarray, optional
+            spectra of shape (nseds, len(lamb)) or (len(lamb),) (default:
+            a flat spectrum)
+
+        photon: bool
+            if set (default) the integrals are weighted by lambda as for
+            photon counting detectors
+        """
+        self.law = law
+        _lamb = np.ravel(magnitude_in_unit('lamb', lamb, 'angstrom')).astype(float)
+        transmissions = self._transmissions(_lamb, filters)
+        if seds is None:
+            seds = np.ones((1, len(_lamb)))
+        seds = np.atleast_2d(np.asarray(seds, dtype=float))
+        if seds.shape[-1] != len(_lamb):
+            txt = 'Expected "seds" of {0:d} wavelengths, got {1:d} instead.'
+            raise ValueError(txt.format(len(_lamb), seds.shape[-1]))
+
+        key = self._digest(_lamb, transmissions, seds, photon)
+        self.grid, self.weights = self.tensor_cache.get(
+            key, lambda: self._tensors(_lamb, transmissions, seds, photon))
+
+    @property
+    def nfilters(self):
+        """ number of filters """
+        return self.weights.shape[1]
+
+    @property
+    def nseds(self):
+        """ number of spectra """
+        return self.weights.shape[0]
+
+    @staticmethod
+    def _transmissions(lamb, filters):
+        """ Transmission curves sampled at lamb, shape (nfilters, len(lamb)) """
+        if isinstance(filters, np.ndarray) and (filters.ndim == 2):
+            if filters.shape[-1] != len(lamb):
+                txt = 'Expected "filters" of {0:d} wavelengths, got {1:d} instead.'
+                raise ValueError(txt.format(len(lamb), filters.shape[-1]))
+            return np.asarray(filters, dtype=float)
+        T = np.empty((len(filters), len(lamb)))
+        for k, (lamb_f, trans_f) in enumerate(filters):
+            lamb_f = np.ravel(magnitude_in_unit('filter lamb', lamb_f, 'angstrom'))
+            order = np.argsort(lamb_f)
+            T[k] = np.interp(lamb, lamb_f[order], np.ravel(trans_f)[order],
+                             left=0., right=0.)
+        return T
+
+    @staticmethod
+    def _digest(*values):
+        """ Key identifying the inputs of the precomputed tensors """
+        h = hashlib.sha1()
+        for v in values:
+            v = np.ascontiguousarray(v)
+            h.update(str((v.dtype, v.shape)).encode())
+            h.update(v.tobytes())
+        return h.hexdigest()
+
+    @staticmethod
+    def _tensors(lamb, transmissions, seds, photon):
+        """ Wavelength grid and normalized integration weights restricted to
+        the wavelengths where any filter transmits """
+        w = trapz_weights(lamb)
+        if photon:
+            w = w * lamb
+        support = np.flatnonzero(np.any(transmissions != 0, axis=0) & (w != 0))
+        W = seds[:, None, support] * (transmissions[:, support] * w[support])[None]
+        norm = W.sum(-1, keepdims=True)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            W /= norm
+        grid = WavelengthGrid(lamb[support], unit_policy='assume')
+        return grid, W
+
+    def transmitted(self, Av=1., sed=None, **kwargs):
+        """ Fractions of the flux transmitted through each band
+
+        Parameters
+        ----------
+        Av: float or ndarray(dtype=float)
+            desired A(V) (default 1.0)
+
+        sed: int or ndarray(dtype=int), optional
+            index of the spectrum of each parameter value, broadcast against
+            the parameters (default: every spectrum)
+
+        kwargs: dict
+            other parameters of the law (Rv, f_A, ...)
+
+        Returns
+        -------
+        r: ndarray
+            transmitted fractions of shape params.shape + (nfilters,) if sed
+            is given, params.shape + (nseds, nfilters) otherwise
+        """
+        kwargs.pop('Alambda', None)
+        # 10 ** (-0.4 * A(lambda))
+        trans = self.law.function(self.grid, Av=Av, Alambda=True, **kwargs)
+        trans *= -0.4 * np.log(10.)
+        np.exp(trans, out=trans)
+        M = self.grid.size
+
+        if sed is None:
+            lead = trans.shape[:-1]
+            r = np.dot(trans.reshape(-1, M), self.weights.reshape(-1, M).T)
+            return r.reshape(lead + self.weights.shape[:2])
+
+        sed = np.asarray(sed, dtype=int)
+        lead = np.broadcast_shapes(trans.shape[:-1], sed.shape)
+        trans = np.broadcast_to(trans, lead + (M,)).reshape(-1, M)
+        sed = np.broadcast_to(sed, lead).reshape(-1)
+        r = np.empty((len(sed), self.nfilters))
+        # one matrix product per distinct spectrum, on the rows sorted by
+        # spectrum
+        order = np.argsort(sed, kind='stable')
+        values, starts = np.unique(sed[order], return_index=True)
+        stops = np.append(starts[1:], len(sed))
+        for s, i0, i1 in zip(values, starts, stops):
+            ind = order[i0:i1]
+            r[ind] = np.dot(trans[ind], self.weights[s].T)
+        return r.reshape(lead + (self.nfilters,))
+
+    def function(self, Av=1., sed=None, **kwargs):
+        """ Extinction in each band
+
+        Parameters
+        ----------
+        Av: float or ndarray(dtype=float)
+            desired A(V) (default 1.0)
+
+        sed: int or ndarray(dtype=int), optional
+            index of the spectrum of each parameter value, broadcast against
+            the parameters (default: every spectrum)
+
+        kwargs: dict
+            other parameters of the law (Rv, f_A, ...)
+
+        Returns
+        -------
+        Ab: ndarray
+            band extinctions in magnitudes of shape params.shape +
+            (nfilters,) if sed is given, params.shape + (nseds, nfilters)
+            otherwise
+        """
+        r = self.transmitted(Av=Av, sed=sed, **kwargs)
+        np.log10(r, out=r)
+        r *= -2.5
+        return r
+
+    def __call__(self, *args, **kwargs):
+        return self.function(*args, **kwargs)
@@ -1,5 +1,7 @@
 import numpy as np
-from .extinction import ExtinctionLaw, val_in_unit
+from .extinction import ExtinctionLaw
+from . import kernels
+from .helpers import broadcast_parameters, leading_shape, output_buffer
 
 
 class Calzetti(ExtinctionLaw):
@@ -21,50 +23,150 @@ class Calzetti(ExtinctionLaw):
     def __init__(self):
         self.name = 'Calzetti'
 
-    def function(self, lamb, Av=1, Rv=4.05, Alambda=True, **kwargs):
+    def function(self, lamb, Av=1, Rv=4.05, Alambda=True, out=None,
+                 dtype=None, **kwargs):
         """
         Returns Alambda or tau for a Calzetti law Lamb is input in Angstroms
 
         Parameters
         ----------
-        lamb: float or ndarray(dtype=float)
+        lamb: float or ndarray(dtype=float) or WavelengthGrid
             wavelength [in Angstroms] at which evaluate the law.
 
-        Av: float
+        Av: float or ndarray(dtype=float)
             desired A(V) (default 1.0)
 
-        Rv: float
+        Rv: float or ndarray(dtype=float)
             desired R(V) (default 4.05)
 
         Alambda: bool
             if set returns +2.5 * 1. / log(10.) * tau, tau otherwise
 
+        out: ndarray, optional
+            array in which to store the result (shape of the result,
+            C-contiguous)
+
+        dtype: dtype, optional
+            floating point type of the result (default: the one of lamb if
+            floating point, float64 otherwise)
+
+        unit_policy: str, optional
+            handling of wavelengths without units for this call (default:
+            :attr:`unit_policy`)
+
         Returns
         -------
         r: float or ndarray(dtype=float)
             attenuation as a function of wavelength
             depending on Alambda option +2.5*1./log(10.)*tau,  or tau
+            array-valued Av and Rv of shape (N,) give a (N,) + lamb.shape
+            result
         """
-        # handle units
-        _lamb = val_in_unit('lamb', lamb, 'angstrom').magnitude
+        grid = self._asgrid(lamb, dtype, **kwargs)
+        Av, Rv = broadcast_parameters(grid.shape, Av, Rv)
+        if dtype is None:
+            dtype = grid.dtype
+        out, k = output_buffer(out, grid.shape, dtype, leading_shape(1, Av, Rv))
+
+        if self._use_jit() and (Av.ndim == 0) and (Rv.ndim == 0):
+            kernels.get_kernel('calzetti')(grid.lamb, float(Rv), bool(Alambda), k)
+            return out
+
+        k0, inside = grid.terms(self)
+        np.multiply(inside, Rv, out=k)
+        k += k0
+        k *= 0.4
+
+        if not Alambda:
+            np.power(10., k, out=k)
+        return out
+
+    def _scalar(self, lamb, Av, Alambda, Rv=4.05, **kwargs):
+        """ :func:`ExtinctionLaw.scalar` (see :func:`kernels.calzetti_point`) """
+        k = 0.4 * kernels.calzetti_point(lamb, float(Rv))
+        if Alambda:
+            return k
+        return 10. ** k
 
-        if isinstance(_lamb, float) or isinstance(_lamb, np.float_):
-            _lamb = np.asarray([_lamb])
-        else:
-            _lamb = _lamb[:]
+    def _prepare(self, grid):
+        """ Rv independent part of k(lambda) over the validity domain
 
-        _lamb *= 1e-4
+        Parameters
+        ----------
+        grid: WavelengthGrid
+            wavelengths
 
-        x = 1. / _lamb  # wavenumber in um^-1
-        k = np.zeros(np.size(x))
+        Returns
+        -------
+        k0: ndarray
+            k(lambda) - Rv within [0.0912, 2.2] microns, 0 outside
+
+        inside: ndarray
+            1 within [0.0912, 2.2] microns, 0 outside
+        """
+        _lamb = 1e-4 * grid.lamb   # in um
+        x = grid.x                 # wavenumber in um^-1
+        k0 = np.zeros(np.size(x))
 
         ind = (_lamb >= 0.630 ) & (_lamb <= 2.2)
-        k[ind] = 2.659 * (-1.857 + 1.040 * x[ind]) + Rv
+        k0[ind] = 2.659 * (-1.857 + 1.040 * x[ind])
 
         ind = (_lamb >= 0.0912 ) & (_lamb < 0.630)
-        k[ind] = 2.659 * (-2.156 + 1.509 * x[ind] - 0.198 * x[ind] ** 2 + 0.011 * x[ind] ** 3 ) + Rv
+        k0[ind] = 2.659 * (-2.156 + 1.509 * x[ind] - 0.198 * x[ind] ** 2 + 0.011 * x[ind] ** 3 )
+
+        inside = ((_lamb >= 0.0912) & (_lamb <= 2.2))
+        return k0.astype(grid.dtype), inside.astype(grid.dtype)
+
+    def _prepare_domain(self, grid):
+        """ Domain of the law: 0.0912 <= lamb <= 2.2 microns (see
+        :func:`_prepare`) """
+        return grid.terms(self)[1] > 0
+
+    def _prepare_basis(self, grid):
+        """ Basis functions of A(lambda) on the grid: 0.4 * k0 and 0.4 over
+        the validity domain """
+        return 0.4 * np.array(grid.terms(self))
+
+    def basis_coefficients(self, Av=1., Rv=4.05, **kwargs):
+        """ Coefficients of the basis functions (see :func:`basis`)
+
+        Parameters
+        ----------
+        Av: float or ndarray(dtype=float)
+            desired A(V) (default 1.0), does not change the values, as in
+            :func:`function`
+
+        Rv: float or ndarray(dtype=float)
+            desired R(V) (default 4.05)
+
+        Returns
+        -------
+        coeffs: ndarray
+            (1, Rv) of shape broadcast(Av, Rv).shape + (2,)
+        """
+        Av, Rv = np.broadcast_arrays(np.asarray(Av, dtype=float),
+                                     np.asarray(Rv, dtype=float))
+        return np.stack([np.ones_like(Rv), Rv], axis=-1)
+
+    def basis_coefficient_grads(self, Av=1., Rv=4.05, **kwargs):
+        """ Partial derivatives of the coefficients (see
+        :func:`basis_coefficients`)
+
+        Returns
+        -------
+        grads: dict
+            Av: (0, 0), Rv: (0, 1), of shape broadcast(Av, Rv).shape + (2,)
+        """
+        Av, Rv = np.broadcast_arrays(np.asarray(Av, dtype=float),
+                                     np.asarray(Rv, dtype=float))
+        zeros = np.zeros_like(Rv)
+        return {'Av': np.stack([zeros, zeros], axis=-1),
+                'Rv': np.stack([zeros, np.ones_like(Rv)], axis=-1)}
+
+    def _tau(self, r, grads):
+        """ 10 ** (0.4 * k) and its derivatives (see :func:`function`) """
+        np.power(10., r, out=r)
+        for v in grads.values():
+            v *= np.log(10.) * r
+        return r, grads
 
-        if Alambda:
-            return 0.4 * k
-        else:
-            return 10 ** (0.4 * k)
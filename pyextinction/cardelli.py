@@ -1,5 +1,8 @@
+import math
 import numpy as np
-from .extinction import ExtinctionLaw, val_in_unit
+from .extinction import ExtinctionLaw
+from . import kernels
+from .helpers import broadcast_parameters, leading_shape, output_buffer
 
 
 class Cardelli(ExtinctionLaw):
@@ -7,39 +10,141 @@ class Cardelli(ExtinctionLaw):
     def __init__(self):
         self.name = 'Cardelli'
 
-    def function(self, lamb, Av=1., Rv=3.1, Alambda=True, **kwargs):
+    def function(self, lamb, Av=1., Rv=3.1, Alambda=True, out=None,
+                 dtype=None, **kwargs):
         """
         Cardelli extinction Law
 
         Parameters
         ----------
-        lamb: float or ndarray(dtype=float)
+        lamb: float or ndarray(dtype=float) or WavelengthGrid
             wavelength [in Angstroms] at which evaluate the law.
 
-        Av: float
+        Av: float or ndarray(dtype=float)
             desired A(V) (default: 1.0)
 
-        Rv: float
+        Rv: float or ndarray(dtype=float)
             desired R(V) (default: 3.1)
 
         Alambda: bool
             if set returns +2.5*1./log(10.)*tau, tau otherwise
 
+        out: ndarray, optional
+            array in which to store the result (shape of the result,
+            C-contiguous)
+
+        dtype: dtype, optional
+            floating point type of the result (default: the one of lamb if
+            floating point, float64 otherwise)
+
+        unit_policy: str, optional
+            handling of wavelengths without units for this call (default:
+            :attr:`unit_policy`)
+
         Returns
         -------
         r: float or ndarray(dtype=float)
             attenuation as a function of wavelength
             depending on Alambda option +2.5*1./log(10.)*tau,  or tau
+            array-valued Av and Rv of shape (N,) give a (N,) + lamb.shape
+            result
         """
-        _lamb = val_in_unit('lamb', lamb, 'angstrom').magnitude
+        grid = self._asgrid(lamb, dtype, **kwargs)
+        Av, Rv = broadcast_parameters(grid.shape, Av, Rv)
+        if dtype is None:
+            dtype = grid.dtype
+        out, r = output_buffer(out, grid.shape, dtype, leading_shape(1, Av, Rv))
+
+        # Return Extinction vector
+        # Eq 1
+        if (Alambda):
+            scale = Av
+        else:
+            # 1./(2.5 * 1. / np.log(10.)) * ( a + b / Rv ) * Av
+            scale = 0.4 * np.log(10.) * Av
+
+        if self._use_jit() and (Av.ndim == 0) and (Rv.ndim == 0):
+            kernels.get_kernel('cardelli')(grid.x, float(Rv), float(scale), r)
+            return out
+
+        a, b, _ = grid.terms(self)
+        np.divide(b, Rv, out=r)
+        r += a
+        r *= scale
+        return out
 
-        if isinstance(_lamb, float) or isinstance(_lamb, np.float_):
-            _lamb = np.asarray([_lamb])
+    def _scalar(self, lamb, Av, Alambda, Rv=3.1, **kwargs):
+        """ :func:`ExtinctionLaw.scalar` (see :func:`kernels.cardelli_point`) """
+        if Alambda:
+            scale = Av
         else:
-            _lamb = _lamb[:]
+            scale = 0.4 * math.log(10.) * Av
+        return scale * kernels.cardelli_point(1e4 / lamb, float(Rv))
+
+    def _prepare(self, grid):
+        """ Coefficients a(x) and b(x) on the grid (see :func:`_coefficients`)
+        and the domain of the law, 0.3 <= x <= 10 um^-1 """
+        a, b = self._coefficients(grid.x)
+        inside = (grid.x >= 0.3) & (grid.x <= 10.0)
+        return a.astype(grid.dtype, copy=False), b.astype(grid.dtype, copy=False), inside
+
+    def _prepare_domain(self, grid):
+        """ Domain of the law: 0.3 <= x <= 10 um^-1 (see :func:`_prepare`) """
+        return grid.terms(self)[2]
+
+    def _prepare_basis(self, grid):
+        """ Basis functions a(x) and b(x) on the grid """
+        return np.array(grid.terms(self)[:2])
+
+    def basis_coefficients(self, Av=1., Rv=3.1, **kwargs):
+        """ Coefficients of the basis functions a(x), b(x) (see :func:`basis`)
+
+        Parameters
+        ----------
+        Av: float or ndarray(dtype=float)
+            desired A(V) (default 1.0)
+
+        Rv: float or ndarray(dtype=float)
+            desired R(V) (default 3.1)
+
+        Returns
+        -------
+        coeffs: ndarray
+            (Av, Av / Rv) of shape broadcast(Av, Rv).shape + (2,)
+        """
+        Av, Rv = np.broadcast_arrays(np.asarray(Av, dtype=float),
+                                     np.asarray(Rv, dtype=float))
+        return np.stack([Av, Av / Rv], axis=-1)
+
+    def basis_coefficient_grads(self, Av=1., Rv=3.1, **kwargs):
+        """ Partial derivatives of the coefficients (see
+        :func:`basis_coefficients`)
+
+        Returns
+        -------
+        grads: dict
+            Av: (1, 1 / Rv), Rv: (0, -Av / Rv ** 2), of shape
+            broadcast(Av, Rv).shape + (2,)
+        """
+        Av, Rv = np.broadcast_arrays(np.asarray(Av, dtype=float),
+                                     np.asarray(Rv, dtype=float))
+        return {'Av': np.stack([np.ones_like(Rv), 1. / Rv], axis=-1),
+                'Rv': np.stack([np.zeros_like(Rv), -Av / Rv ** 2], axis=-1)}
 
+    def _coefficients(self, x):
+        """ Wavelength dependent coefficients a(x) and b(x) of Eq 1
+
+        Parameters
+        ----------
+        x: ndarray
+            wavenumbers in um^-1 (1-d)
+
+        Returns
+        -------
+        a, b: ndarray, ndarray
+            coefficients such that A(x) / A(V) = a(x) + b(x) / Rv
+        """
         # init variables
-        x = 1.e4 / _lamb  # wavenumber in um^-1
         a = np.zeros(np.size(x))
         b = np.zeros(np.size(x))
         # Infrared (Eq 2a,2b)
@@ -75,10 +180,4 @@ class Cardelli(ExtinctionLaw):
         a[ind] = 0.0
         b[ind] = 0.0
 
-        # Return Extinction vector
-        # Eq 1
-        if (Alambda):
-            return( ( a + b / Rv ) * Av)
-        else:
-            # return( 1./(2.5 * 1. / np.log(10.)) * ( a + b / Rv ) * Av)
-            return( 0.4 * np.log(10.) * ( a + b / Rv ) * Av)
+        return a, b
@@ -7,14 +7,175 @@ Dust Extinction laws
 
     This module is able to handle values with units
 """
-from .helpers import val_in_unit, isNestedInstance
+import numpy as np
+from .helpers import (magnitude_in_unit, isNestedInstance,
+                      broadcast_parameters, leading_shape, output_buffer,
+                      result_dtype, thread_pool)
+from . import kernels
+from . import instrument
 
 __version__ = '1.0'
-__all__ = ['ExtinctionLaw', 'MixtureLaw']
+__all__ = ['ExtinctionLaw', 'MixtureLaw', 'MultiMixtureLaw', 'WavelengthGrid']
+
+#: number of wavelengths per chunk of threaded evaluations (512 kB of
+#: float64, a typical L2 cache size)
+THREAD_CHUNK_SIZE = 2 ** 16
+
+
+class WavelengthGrid(object):
+    """ Wavelengths prepared once for repeated evaluations of extinction laws
+
+    The grid stores the wavelengths in Angstroms, the wavenumbers and, per
+    law, the terms of the law that only depend on wavelength (region indices,
+    powers of x, ...). Any :func:`ExtinctionLaw.function` accepts a grid in
+    place of `lamb`.
+
+    .. example::
+
+        grid = WavelengthGrid(lamb)
+        law = Fitzpatrick99()
+        for Rv in Rv_values:
+            law(grid, Rv=Rv)
+
+    Attributes
+    ----------
+    shape: tuple
+        shape of the input wavelengths
+
+    lamb: ndarray
+        flattened wavelengths in Angstroms (read-only, may be a view of the
+        input array)
+
+    x: ndarray
+        flattened wavenumbers in um^-1
+
+    dtype: dtype
+        floating point type of the law terms and default type of the results
+    """
+    def __init__(self, lamb, dtype=None, unit_policy=None):
+        """ Constructor
+
+        Parameters
+        ----------
+        lamb: float or array_like or Quantity
+            wavelength [in Angstroms if no units] at which evaluate the laws.
+            Any object exposing the buffer protocol (memmap, memoryview,
+            ...) is used without copy if it holds contiguous float64 values
+            and is never modified.
+
+        dtype: dtype
+            floating point type of the results (default: the one of lamb
+            if floating point, float64 otherwise)
+
+        unit_policy: str
+            handling of wavelengths without units (see
+            :func:`helpers.set_unit_policy`)
+        """
+        _lamb = np.asarray(magnitude_in_unit('lamb', lamb, 'angstrom', unit_policy))
+        self.dtype = result_dtype(_lamb if dtype is None else dtype)
+        self.shape = _lamb.shape
+        # read-only view (or converted copy) of the input
+        self.lamb = np.asarray(_lamb, dtype=float).reshape(-1).view()
+        self.lamb.flags.writeable = False
+        self.x = 1.e4 / self.lamb
+        self._terms = {}
+        self._chunks = {}
+
+    def __repr__(self):
+        return 'WavelengthGrid(shape={0})'.format(self.shape)
+
+    def __len__(self):
+        return len(self.lamb)
+
+    @property
+    def size(self):
+        """ number of wavelengths """
+        return len(self.lamb)
+
+    @classmethod
+    def asgrid(cls, lamb, dtype=None, unit_policy=None):
+        """ Return lamb if it is already a grid, a new grid otherwise """
+        if isinstance(lamb, cls):
+            return lamb
+        return cls(lamb, dtype=dtype, unit_policy=unit_policy)
+
+    def chunks(self, size):
+        """ Contiguous chunks of the flattened grid, computed on first use
+
+        Parameters
+        ----------
+        size: int
+            number of wavelengths per chunk (the last one may be larger, up
+            to twice this size)
+
+        Returns
+        -------
+        chunks: list
+            (start, stop, grid) of each chunk, the grids are views of this
+            one and keep their own law terms
+        """
+        try:
+            return self._chunks[size]
+        except KeyError:
+            pass
+        n = max(1, self.size // size)
+        bounds = [k * size for k in range(n)] + [self.size]
+        chunks = []
+        for i0, i1 in zip(bounds[:-1], bounds[1:]):
+            sub = WavelengthGrid(self.lamb[i0:i1], dtype=self.dtype,
+                                 unit_policy='assume')
+            chunks.append((i0, i1, sub))
+        self._chunks[size] = chunks
+        return chunks
+
+    def terms(self, law, name='_prepare'):
+        """ Wavelength dependent terms of a given law, computed on first use
+
+        Parameters
+        ----------
+        law: ExtinctionLaw
+            law for which to get the terms (see :func:`ExtinctionLaw._prepare`)
+
+        name: str
+            name of the law method that computes the terms from the grid
+
+        Returns
+        -------
+        terms: object
+            law specific terms
+        """
+        key = (law.__class__, name)
+        try:
+            return self._terms[key]
+        except KeyError:
+            terms = getattr(law, name)(self)
+            self._terms[key] = terms
+            return terms
 
 
 class ExtinctionLaw(object):
-    """ Template class """
+    """ Template class
+
+    Attributes
+    ----------
+    backend: str
+        evaluation backend of this law, 'numpy', 'numba' or None to use the
+        default one (see :mod:`pyextinction.kernels`)
+
+    unit_policy: str
+        handling of wavelengths without units, one of
+        :data:`helpers.UNIT_POLICIES` or None to use the default one (see
+        :func:`helpers.set_unit_policy`)
+
+    Rv_range: tuple
+        (min, max) values of R(V) accepted by :func:`isvalid`, None for no
+        restriction
+    """
+
+    backend = None
+    unit_policy = None
+    Rv_range = None
+
     def __init__(self):
         self.name = 'None'
 
@@ -30,6 +191,18 @@ class ExtinctionLaw(object):
         lamb: ndarray
             wavelength
 
+        out: ndarray, optional
+            array in which to store the result, it must have the shape of the
+            result and be C-contiguous
+
+        dtype: dtype, optional
+            floating point type of the result (default: the one of lamb if
+            floating point, float64 otherwise)
+
+        unit_policy: str, optional
+            handling of wavelengths without units for this call (default:
+            :attr:`unit_policy`)
+
         Returns
         -------
         val: ndarray
@@ -37,16 +210,383 @@ class ExtinctionLaw(object):
         """
         raise NotImplementedError
 
-    def __call__(self, *args, **kwargs):
-        """ Make the extinction law callable object using :func:`self.function`"""
-        return self.function(*args, **kwargs)
+    def __call__(self, lamb, *args, **kwargs):
+        """ Make the extinction law callable object using :func:`self.function`
 
-    def isvalid(self, *args, **kwargs):
-        """ Check if the current arguments are in the validity domain of the law
-        Must be redefined if any restriction applies to the law
+        Parameters
+        ----------
+        threads: int or concurrent.futures.Executor, optional
+            number of threads (or executor) among which split the
+            wavelengths in chunks of :data:`THREAD_CHUNK_SIZE` values,
+            arrays of less than two chunks are evaluated in the calling
+            thread (see :func:`_threaded`)
         """
+        threads = kwargs.pop('threads', None)
+        if instrument._state['enabled']:
+            return instrument.record_call(self, lamb, threads, args, kwargs)
+        if self._scalar_call(lamb, threads, args, kwargs):
+            return self._evaluate_scalar(lamb, kwargs)
+        return self._evaluate(lamb, threads, *args, **kwargs)
+
+    def _evaluate_scalar(self, lamb, kwargs):
+        """ :func:`scalar` as returned by :func:`__call__` (numpy float64) """
+        return np.float64(self.scalar(lamb, **kwargs))
+
+    def _scalar_call(self, lamb, threads, args, kwargs):
+        """ True if a call can use :func:`scalar`: the law implements it, the
+        wavelength is a Python float (or a 0-d float64 array), the parameters
+        are Python scalar keywords and no threads are requested """
+        if (threads is not None) or args:
+            return False
+        if type(self)._scalar is ExtinctionLaw._scalar:
+            return False
+        if not isinstance(lamb, (float, int)):
+            if not (isinstance(lamb, np.ndarray) and (lamb.shape == ()) and
+                    (lamb.dtype == np.float64)):
+                return False
+        for k, v in kwargs.items():
+            if k == 'unit_policy':
+                continue
+            if (k in ('out', 'dtype')) or not ((v is None) or isinstance(v, (float, int))):
+                return False
         return True
 
+    def scalar(self, lamb, Av=1., Alambda=True, **kwargs):
+        """ Value of the law at a single wavelength for scalar parameters
+
+        Evaluated with `math` module arithmetic on Python floats, without the
+        array allocations of :func:`function`.  Calls of the law with a
+        float (or 0-d array) wavelength and scalar parameters use it and
+        return a numpy float64.
+
+        Parameters
+        ----------
+        lamb: float or Quantity
+            wavelength [in Angstroms if no units]
+
+        Av: float
+            desired A(V) (default 1.0)
+
+        Alambda: bool
+            if set returns +2.5*1./log(10.)*tau, tau otherwise
+
+        unit_policy: str, optional
+            handling of wavelengths without units for this call (default:
+            :attr:`unit_policy`)
+
+        kwargs: dict
+            other scalar parameters of :func:`function` (Rv, f_A, ...)
+
+        Returns
+        -------
+        r: float
+            value of the law, same as :func:`function` to floating point
+            precision
+        """
+        policy = kwargs.pop('unit_policy', None) or self.unit_policy
+        lamb = float(magnitude_in_unit('lamb', lamb, 'angstrom', policy))
+        return self._scalar(lamb, float(Av), Alambda, **kwargs)
+
+    def _scalar(self, lamb, Av, Alambda, **kwargs):
+        """ :func:`scalar` for a wavelength in Angstroms, laws without a
+        dedicated implementation evaluate :func:`function` """
+        return float(self.function(lamb, Av=Av, Alambda=Alambda,
+                                   unit_policy='assume', **kwargs))
+
+    def _evaluate(self, lamb, threads, *args, **kwargs):
+        """ Evaluate :func:`function`, on a pool of threads if requested
+        (see :func:`__call__`) """
+        if (threads is None) or (threads == 1):
+            return self.function(lamb, *args, **kwargs)
+        return self._threaded(lamb, threads, *args, **kwargs)
+
+    def _threaded(self, lamb, threads, *args, **kwargs):
+        """ Evaluate :func:`function` on chunks of the wavelengths with a pool
+        of threads
+
+        The numpy operations of the laws release the GIL, so that chunks are
+        evaluated concurrently.  The first chunk is evaluated in the calling
+        thread to get the shape of the result, the other ones write directly
+        into it.
+
+        Parameters
+        ----------
+        lamb: float or ndarray(dtype=float) or WavelengthGrid
+            wavelength [in Angstroms if no units]
+
+        threads: int or concurrent.futures.Executor
+            number of threads of a shared pool or executor to use
+
+        args, kwargs:
+            arguments of :func:`function`
+
+        Returns
+        -------
+        r: ndarray
+            same as :func:`function`
+        """
+        out = kwargs.pop('out', None)
+        grid = self._asgrid(lamb, kwargs.get('dtype'), kwargs.get('unit_policy'))
+        chunks = grid.chunks(THREAD_CHUNK_SIZE)
+        if len(chunks) < 2:
+            return self.function(grid, *args, out=out, **kwargs)
+
+        ndim = len(grid.shape)
+        if ndim > 1:
+            # the chunks are flat: parameters shaped against the wavelength
+            # axes keep a single one (see broadcast_parameters)
+            for k, v in kwargs.items():
+                if (np.ndim(v) > ndim) and (np.shape(v)[-ndim:] == (1, ) * ndim):
+                    v = np.asarray(v)
+                    kwargs[k] = v.reshape(v.shape[:-ndim] + (1, ))
+
+        i0, i1, first = chunks[0]
+        r0 = self.function(first, *args, **kwargs)
+        lead = r0.shape[:r0.ndim - len(first.shape)]
+        out, r = output_buffer(out, grid.shape, r0.dtype, lead)
+        r[..., i0:i1] = r0.reshape(lead + (-1, ))
+        del r0
+
+        def evaluate(chunk):
+            i0, i1, sub = chunk
+            if lead:
+                r[..., i0:i1] = self.function(sub, *args, **kwargs).reshape(lead + (-1, ))
+            else:
+                self.function(sub, *args, out=r[i0:i1], **kwargs)
+
+        executor = thread_pool(threads)
+        for _ in executor.map(evaluate, chunks[1:]):
+            pass
+        return out
+
+    def _asgrid(self, lamb, dtype=None, unit_policy=None, **kwargs):
+        """ Wavelength grid of a call (see :func:`WavelengthGrid.asgrid`),
+        applying the unit policy of the call or of the law """
+        return WavelengthGrid.asgrid(lamb, dtype, unit_policy or self.unit_policy)
+
+    def _use_jit(self):
+        """ True if the compiled single-pass kernels are to be used """
+        return kernels.use_jit(self.backend)
+
+    def prepare(self, lamb):
+        """ Precompute the wavelength dependent terms of the law
+
+        Parameters
+        ----------
+        lamb: float or ndarray(dtype=float) or WavelengthGrid
+            wavelength [in Angstroms if no units]
+
+        Returns
+        -------
+        grid: WavelengthGrid
+            grid to use in place of lamb in subsequent calls
+        """
+        grid = self._asgrid(lamb)
+        grid.terms(self)
+        return grid
+
+    def _prepare(self, grid):
+        """ Compute the terms of the law that only depend on wavelength
+        Must be redefined by laws that use :class:`WavelengthGrid` terms
+
+        Parameters
+        ----------
+        grid: WavelengthGrid
+            wavelengths
+
+        Returns
+        -------
+        terms: object
+            law specific terms stored by the grid
+        """
+        return None
+
+    def basis(self, lamb):
+        """ Wavelength dependent basis functions of the law
+
+        Laws that are linear in a set of Rv dependent coefficients decompose
+        exactly as
+
+        .. math::
+
+            A(\\lambda) = \\sum_i c_i(A_V, R_V) B_i(\\lambda)
+
+        so that evaluating many (Av, Rv) values on a fixed grid is a matrix
+        product
+
+        .. example::
+
+            B = law.basis(lamb)
+            C = law.basis_coefficients(Av=Av, Rv=Rv)
+            A = np.dot(C, B.reshape(len(B), -1))
+
+        Parameters
+        ----------
+        lamb: float or ndarray(dtype=float) or WavelengthGrid
+            wavelength [in Angstroms if no units]
+
+        Returns
+        -------
+        B: ndarray
+            basis functions, of shape (n,) + lamb.shape
+        """
+        grid = self._asgrid(lamb)
+        B = grid.terms(self, '_prepare_basis')
+        return B.reshape((len(B), ) + grid.shape)
+
+    def basis_coefficients(self, *args, **kwargs):
+        """ Coefficients of the basis functions (see :func:`basis`)
+
+        Returns
+        -------
+        coeffs: ndarray
+            coefficients of shape params.shape + (n,), such that
+            np.dot(coeffs, B) is the law evaluated with Alambda=True
+        """
+        raise NotImplementedError
+
+    def _prepare_basis(self, grid):
+        """ Compute the basis functions on the grid, shape (n, grid.size)
+        Must be redefined by laws that implement :func:`basis`
+        """
+        raise NotImplementedError
+
+    def basis_coefficient_grads(self, *args, **kwargs):
+        """ Partial derivatives of the coefficients of the basis functions
+        (see :func:`basis_coefficients`)
+
+        Returns
+        -------
+        grads: dict
+            parameter name -> derivative of the coefficients, of shape
+            params.shape + (n,)
+        """
+        raise NotImplementedError
+
+    def value_and_grad(self, lamb, Alambda=True, dtype=None, **kwargs):
+        """ Law and its analytic partial derivatives with respect to the
+        parameters
+
+        The law and the derivatives are linear combinations of the basis
+        functions (see :func:`basis`), evaluated together in a single matrix
+        product.
+
+        .. example::
+
+            r, grads = law.value_and_grad(lamb, Av=Av, Rv=Rv)
+            grads['Rv']     # dr / dRv, same shape as r
+
+        Parameters
+        ----------
+        lamb: float or ndarray(dtype=float) or WavelengthGrid
+            wavelength [in Angstroms if no units]
+
+        Alambda: bool
+            if set returns +2.5*1./log(10.)*tau, tau otherwise
+
+        dtype: dtype, optional
+            floating point type of the result (default: the one of lamb if
+            floating point, float64 otherwise)
+
+        unit_policy: str, optional
+            handling of wavelengths without units for this call (default:
+            :attr:`unit_policy`)
+
+        kwargs: dict
+            parameters of :func:`function` (Av, Rv, ...), broadcast as in
+            :func:`function`
+
+        Returns
+        -------
+        r: ndarray
+            law values, same as :func:`function`
+
+        grads: dict
+            parameter name -> partial derivative of r, same shape as r
+        """
+        grid = self._asgrid(lamb, dtype, kwargs.pop('unit_policy', None))
+        if dtype is None:
+            dtype = grid.dtype
+        names = list(kwargs)
+        values = broadcast_parameters(grid.shape, *[kwargs[k] for k in names])
+        params = dict((k, v[..., 0] if np.ndim(v) else v)
+                      for k, v in zip(names, values))
+
+        C = self.basis_coefficients(**params)
+        dC = self.basis_coefficient_grads(**params)
+        names = sorted(dC)
+        lead = np.broadcast_shapes(C.shape[:-1], *[dC[k].shape[:-1] for k in names])
+        stack = np.stack([np.broadcast_to(c, lead + C.shape[-1:])
+                          for c in [C] + [dC[k] for k in names]])
+        B = self.basis(grid)
+        r = np.dot(stack.reshape(-1, len(B)), B.reshape(len(B), -1)).reshape((len(stack), ) + lead + grid.shape)
+        r = r.astype(dtype, copy=False)
+        grads = dict(zip(names, r[1:]))
+        if not Alambda:
+            return self._tau(r[0], grads)
+        return r[0], grads
+
+    def _tau(self, r, grads):
+        """ Convert the output of :func:`value_and_grad` from A(lambda) to
+        tau, in place """
+        scale = 0.4 * np.log(10.)
+        r *= scale
+        for v in grads.values():
+            v *= scale
+        return r, grads
+
+    def isvalid(self, Av=None, Rv=None, **kwargs):
+        """ Check if the current arguments are in the validity domain of the law
+        Must be redefined if any other restriction applies to the law
+
+        Parameters
+        ----------
+        Av: float or ndarray(dtype=float)
+            A(V) values (any finite value is allowed, even <0)
+
+        Rv: float or ndarray(dtype=float)
+            R(V) values, limited to :attr:`Rv_range`
+
+        Returns
+        -------
+        r: bool or ndarray(dtype=bool)
+            True where the values are valid, broadcast shape of the
+            parameters
+        """
+        valid = np.ones((), dtype=bool)
+        if Av is not None:
+            valid = valid & np.isfinite(Av)
+        if Rv is not None:
+            valid = valid & np.isfinite(Rv)
+            if self.Rv_range is not None:
+                with np.errstate(invalid='ignore'):
+                    valid &= (Rv >= self.Rv_range[0]) & (Rv <= self.Rv_range[1])
+        return valid[()]
+
+    def domain(self, lamb):
+        """ Wavelengths at which the law is defined, it is set to 0 elsewhere
+
+        The mask is computed with the other wavelength dependent terms of
+        the law and stored by the grid (see :func:`prepare`).
+
+        Parameters
+        ----------
+        lamb: float or ndarray(dtype=float) or WavelengthGrid
+            wavelength [in Angstroms if no units]
+
+        Returns
+        -------
+        mask: ndarray(dtype=bool)
+            True where the law is defined, of shape lamb.shape
+        """
+        grid = self._asgrid(lamb)
+        return grid.terms(self, '_prepare_domain').reshape(grid.shape)
+
+    def _prepare_domain(self, grid):
+        """ Compute the domain mask on the grid (see :func:`domain`), the law
+        is defined everywhere unless redefined """
+        return np.ones(grid.size, dtype=bool)
+
     def __add__(self, other):
         return MixtureLaw(A=self, B=other)
 
@@ -65,6 +605,9 @@ class MixtureLaw(ExtinctionLaw):
         l = Fitzpatrick99() + Gordon03_SMCBar()
 
     """
+
+    Rv_range = (2.0, 6.0)
+
     def __init__(self, A=None, B=None, name=None):
         """ Constructor
 
@@ -84,45 +627,168 @@ class MixtureLaw(ExtinctionLaw):
         self.name = name or '(' + self.A.name + ', ' + self.B.name + ')'
 
     def function(self, lamb, Av=1, Rv_A=None, Alambda=True, f_A=0.5, Rv_B=None,
-                 Rv=None, **kwargs):
+                 Rv=None, out=None, dtype=None, **kwargs):
         """
         Lamb as to be in Angstroms!!!
 
         Parameters
         ----------
-        lamb: float or ndarray(dtype=float)
+        lamb: float or ndarray(dtype=float) or WavelengthGrid
             wavelength [in Angstroms] at which evaluate the law.
 
-        Av: float
+        Av: float or ndarray(dtype=float)
             desired A(V) (default 1.0)
 
         Alambda: bool
             if set returns +2.5*1./log(10.)*tau, tau otherwise
 
-        f_A: float
+        f_A: float or ndarray(dtype=float)
             set the mixture ratio between the two laws (default 0.5)
 
-        Rv_A: float
+        Rv_A: float or ndarray(dtype=float)
             extinction param. on the Law A
 
-        Rv_B: float
+        Rv_B: float or ndarray(dtype=float)
             extinction param. on the bumpless component
 
-        Rv: float
+        Rv: float or ndarray(dtype=float)
             effective R(V) according to the mixture
 
+        out: ndarray, optional
+            array in which to store the result (shape of the result,
+            C-contiguous)
+
+        dtype: dtype, optional
+            floating point type of the result (default: the one of lamb if
+            floating point, float64 otherwise)
+
+        unit_policy: str, optional
+            handling of wavelengths without units for this call (default:
+            :attr:`unit_policy`)
+
         Returns
         -------
         r: float or ndarray(dtype=float)
             attenuation as a function of wavelength
             depending on Alambda option +2.5*1./log(10.)*tau,  or tau
+            array-valued parameters of shape (N,) give a (N,) + lamb.shape
+            result
 
         .. math::
 
             f_A * A(*args, **kwargs) + (1. - f_A) * B(*args, **kwargs)
         """
-        u_lamb = val_in_unit('lamb', lamb, 'angstrom')
+        grid = self._asgrid(lamb, dtype, **kwargs)
+        if dtype is None:
+            dtype = grid.dtype
+        ndim = len(grid.shape)
+
+        Av, f_A, Rv_A, Rv_B, Rv = broadcast_parameters(grid.shape, Av, f_A,
+                                                       Rv_A, Rv_B, Rv,
+                                                       flat=False)
+        Rv_A, Rv_B = self._component_Rv(Rv, f_A, Rv_A, Rv_B)
+        out, _ = output_buffer(out, grid.shape, dtype,
+                               leading_shape(ndim, Av, f_A, Rv_A, Rv_B))
+
+        # f_A * A + (1 - f_A) * B = f_A * (A - B) + B: each component is
+        # evaluated once per distinct (Av, Rv) and f_A only enters the
+        # final weighting
+        rA = self._component(self.A, grid, Av, Rv_A, Alambda, dtype, out)
+        rB = self._component(self.B, grid, Av, Rv_B, Alambda, dtype)
+        np.subtract(rA, rB, out=out)
+        out *= f_A
+        out += rB
+        return out
+
+    def _scalar(self, lamb, Av, Alambda, f_A=0.5, Rv_A=None, Rv_B=None,
+                Rv=None, **kwargs):
+        """ :func:`ExtinctionLaw.scalar`, the missing Rv of a component is
+        derived as in :func:`_component_Rv` """
+        if Rv_A is None:
+            Rv_A = getattr(self.A, 'Rv', None)
+        if Rv_B is None:
+            Rv_B = getattr(self.B, 'Rv', None)
+        if sum([Rv_A is None, Rv_B is None, Rv is None]) >= 2:
+            raise ValueError('Must provide at least 2 Rv values')
+
+        f_A = float(f_A)
+        if Rv_A is None:
+            Rv_A = Rv if f_A == 0. else 1. / (1. / (Rv * f_A) - (1. - f_A) / (f_A * Rv_B))
+        if Rv_B is None:
+            Rv_B = Rv if f_A == 1. else (1. - f_A) / (1. / Rv - f_A / Rv_A)
+        rA = self.A._scalar(lamb, Av, Alambda, Rv=float(Rv_A))
+        rB = self.B._scalar(lamb, Av, Alambda, Rv=float(Rv_B))
+        return f_A * (rA - rB) + rB
+
+    @staticmethod
+    def _component(law, grid, Av, Rv, Alambda, dtype, out=None):
+        """ Evaluate a component once per distinct (Av, Rv) pair
+
+        Parameters
+        ----------
+        law: ExtinctionLaw
+            component
+
+        grid: WavelengthGrid
+            wavelengths
+
+        Av, Rv: ndarray, ndarray
+            parameters broadcast against the wavelength axes
+
+        Alambda: bool
+            if set returns +2.5*1./log(10.)*tau, tau otherwise
+
+        dtype: dtype
+            floating point type of the result
+
+        out: ndarray, optional
+            array of the mixture result, used if the component has the same
+            shape
+
+        Returns
+        -------
+        r: ndarray
+            component values of shape broadcast(Av, Rv).shape[:-ndim] +
+            grid.shape
+        """
+        ndim = len(grid.shape)
+        lead = leading_shape(ndim, Av, Rv)
+        if (out is not None) and (lead != out.shape[:out.ndim - ndim]):
+            out = None
+
+        size = int(np.prod(lead))
+        if size > 1:
+            # parameter values without the wavelength axes
+            values = [np.asarray(p) for p in (Av, Rv)]
+            values = [p[(Ellipsis, ) + (0, ) * ndim] if p.ndim else p for p in values]
+            pairs = np.stack([np.broadcast_to(p, lead).ravel() for p in values], axis=-1)
+            unique, inverse = np.unique(pairs, axis=0, return_inverse=True)
+            if len(unique) < size:
+                r = law.function(grid, Av=unique[:, 0], Rv=unique[:, 1],
+                                 Alambda=Alambda, dtype=dtype)
+                if out is None:
+                    return r[inverse.ravel()].reshape(lead + grid.shape)
+                np.take(r, inverse.ravel(), axis=0,
+                        out=out.reshape((size, ) + grid.shape))
+                return out
+
+        return law.function(grid, Av=Av, Rv=Rv, Alambda=Alambda, out=out,
+                            dtype=dtype)
+
+    def _component_Rv(self, Rv=None, f_A=0.5, Rv_A=None, Rv_B=None):
+        """ Rv values of the components, the missing one is derived from the
+        effective Rv of the mixture
+
+        Returns
+        -------
+        Rv_A, Rv_B: float or ndarray, float or ndarray
+            R(V) values of component A and B, respectively
 
+        Raises
+        ------
+        ValueError:
+            if less than 2 Rv values are available
+        """
         if Rv_A is None:
             Rv_A = getattr(self.A, 'Rv', None)
 
@@ -132,44 +798,160 @@ class MixtureLaw(ExtinctionLaw):
         if sum([Rv_A is None, Rv_B is None, Rv is None]) >= 2:
             raise ValueError('Must provide at least 2 Rv values')
 
+        # an undetermined component Rv is weighted out, Rv keeps it finite
         if Rv_A is None:
-            Rv_A = self.get_Rv_A(Rv, f_A, Rv_B)
+            Rv_A = self.get_Rv_A(Rv, f_A, Rv_B, undetermined=Rv)
         if Rv_B is None:
-            Rv_B = self.get_Rv_B(Rv, Rv_A, f_A)
+            Rv_B = self.get_Rv_B(Rv, Rv_A, f_A, undetermined=Rv)
+        return Rv_A, Rv_B
+
+    def _prepare(self, grid):
+        """ Prepare the terms of both components """
+        grid.terms(self.A)
+        grid.terms(self.B)
 
-        return (f_A * self.A.function(u_lamb, Av=Av, Rv=Rv_A, Alambda=Alambda)
-                + (1. - f_A) * self.B.function(u_lamb, Av=Av, Alambda=Alambda,
-                                               Rv=Rv_B)
-                )
+    def basis(self, lamb):
+        """ Basis functions of both components stacked (see
+        :func:`ExtinctionLaw.basis`)
+
+        Parameters
+        ----------
+        lamb: float or ndarray(dtype=float) or WavelengthGrid
+            wavelength [in Angstroms if no units]
+
+        Returns
+        -------
+        B: ndarray
+            basis functions, of shape (nA + nB,) + lamb.shape
+        """
+        grid = self._asgrid(lamb)
+        return np.concatenate([self.A.basis(grid), self.B.basis(grid)])
+
+    def basis_coefficients(self, Av=1, Rv=None, f_A=0.5, Rv_A=None,
+                           Rv_B=None, **kwargs):
+        """ Coefficients of the basis functions (see :func:`basis`)
+
+        Parameters
+        ----------
+        Av: float or ndarray(dtype=float)
+            desired A(V) (default 1.0)
+
+        Rv: float or ndarray(dtype=float)
+            effective R(V) according to the mixture
 
-    def isvalid(self, Av=None, Rv=None, f_A=0.5, Rv_A=None, Rv_B=None):
+        f_A: float or ndarray(dtype=float)
+            set the mixture ratio between the two laws (default 0.5)
+
+        Rv_A, Rv_B: float or ndarray(dtype=float)
+            extinction param. on the components
+
+        Returns
+        -------
+        coeffs: ndarray
+            coefficients of shape params.shape + (nA + nB,)
+        """
+        Rv_A, Rv_B = self._component_Rv(Rv, f_A, Rv_A, Rv_B)
+        f_A = np.asarray(f_A, dtype=float)[..., None]
+        cA = f_A * self.A.basis_coefficients(Av=Av, Rv=Rv_A)
+        cB = (1. - f_A) * self.B.basis_coefficients(Av=Av, Rv=Rv_B)
+        lead = np.broadcast_shapes(cA.shape[:-1], cB.shape[:-1])
+        return np.concatenate([np.broadcast_to(cA, lead + cA.shape[-1:]),
+                               np.broadcast_to(cB, lead + cB.shape[-1:])],
+                              axis=-1)
+
+    def basis_coefficient_grads(self, Av=1, Rv=None, f_A=0.5, Rv_A=None,
+                                Rv_B=None, **kwargs):
+        """ Partial derivatives of the coefficients of the basis functions
+        (see :func:`basis_coefficients`)
+
+        The R(V) of a component derived from the effective Rv (see
+        :func:`get_Rv_A`, :func:`get_Rv_B`) is not a parameter: its
+        dependence on Rv, f_A and the other R(V) is included in their
+        derivatives.
+
+        Returns
+        -------
+        grads: dict
+            derivatives of the coefficients with respect to Av, f_A and
+            the 2 R(V) values that define the mixture (among Rv_A, Rv_B and
+            Rv), of shape params.shape + (nA + nB,)
+        """
+        derived_A = (Rv_A is None) and (getattr(self.A, 'Rv', None) is None)
+        derived_B = (Rv_B is None) and (getattr(self.B, 'Rv', None) is None)
+        Rv_A, Rv_B = self._component_Rv(Rv, f_A, Rv_A, Rv_B)
+        Rv_A = np.asarray(Rv_A, dtype=float)[..., None]
+        Rv_B = np.asarray(Rv_B, dtype=float)[..., None]
+        f_A = np.asarray(f_A, dtype=float)[..., None]
+        gA = self.A.basis_coefficient_grads(Av=Av, Rv=Rv_A[..., 0])
+        gB = self.B.basis_coefficient_grads(Av=Av, Rv=Rv_B[..., 0])
+        zA = np.zeros_like(gA['Rv'])
+        zB = np.zeros_like(gB['Rv'])
+
+        def stack(a, b):
+            lead = np.broadcast_shapes(a.shape[:-1], b.shape[:-1])
+            return np.concatenate([np.broadcast_to(a, lead + a.shape[-1:]),
+                                   np.broadcast_to(b, lead + b.shape[-1:])],
+                                  axis=-1)
+
+        # d/dRv_A of a derived Rv_A is divided by f_A, which cancels with
+        # the weight of the component (same for Rv_B and 1 - f_A).  Where
+        # the derived value is undetermined, it is set to Rv and does not
+        # contribute.
+        dA = dB = 0.
+        if derived_A:
+            Rv = np.asarray(Rv, dtype=float)[..., None]
+            hA = gA['Rv'] * (f_A != 0.)
+            dA = hA * Rv_A ** 2 * (1. / Rv_A - 1. / Rv_B)
+            grads = {'Rv': stack(hA * (Rv_A / Rv) ** 2, zB),
+                     'Rv_B': stack(-hA * (1. - f_A) * (Rv_A / Rv_B) ** 2,
+                                   (1. - f_A) * gB['Rv'])}
+        elif derived_B:
+            Rv = np.asarray(Rv, dtype=float)[..., None]
+            hB = gB['Rv'] * (f_A != 1.)
+            dB = hB * Rv_B ** 2 * (1. / Rv_A - 1. / Rv_B)
+            grads = {'Rv': stack(zA, hB * (Rv_B / Rv) ** 2),
+                     'Rv_A': stack(f_A * gA['Rv'],
+                                   -hB * f_A * (Rv_B / Rv_A) ** 2)}
+        else:
+            grads = {'Rv_A': stack(f_A * gA['Rv'], zB),
+                     'Rv_B': stack(zA, (1. - f_A) * gB['Rv'])}
+
+        grads['Av'] = stack(f_A * gA['Av'], (1. - f_A) * gB['Av'])
+        grads['f_A'] = stack(self.A.basis_coefficients(Av=Av, Rv=Rv_A[..., 0]) + dA,
+                             dB - self.B.basis_coefficients(Av=Av, Rv=Rv_B[..., 0]))
+        return grads
+
+    def isvalid(self, Av=None, Rv=None, f_A=0.5, Rv_A=None, Rv_B=None,
+                **kwargs):
         """ Test the validity of an extinction vector (Av, Rv, Rv_A, Rv_B, fbump)
 
         .. math::
             Law = f_A * A(lamb, Av=Av, Rv=Rv_A) + (1. - f_A) * B(lamb, Av=Av, Rv=Rv_B)
 
-        The validity impose :math:`R_V` ranges and  to be a fraction (i.e.,
-        between 0 and 1)
+        The validity impose :math:`R_V` ranges (:attr:`Rv_range`) and  to be
+        a fraction (i.e., between 0 and 1), and the components to be valid.
 
         At least 2 out of the 3 :math:`R_V` values must be provided, the 3rd
-        will be computed if missing.
+        will be computed if missing.  A component R(V) derived where it is
+        undetermined (Rv_A with f_A = 0, Rv_B with f_A = 1) is invalid.
 
         Parameters
         ----------
-        Av: float
-            Av value (any value is allowed, even <0)
+        Av: float or ndarray(dtype=float)
+            Av value (any finite value is allowed, even <0)
 
-        Rv, Rv_A, Rv_B: float, float, float
+        Rv, Rv_A, Rv_B: float or ndarray(dtype=float)
             effective Rv, A component and B component Rv values, respectively.
             At least 2 must be provided.
 
-        f_A: float
+        f_A: float or ndarray(dtype=float)
             Mixture ratio between the two components
 
         Returns
         -------
-        r: bool
-            True, if the values a coherent with the definition.
+        r: bool or ndarray(dtype=bool)
+            True, if the values a coherent with the definition, broadcast
+            shape of the parameters
         """
 
         if Rv_B is None and hasattr(self.B, 'Rv'):
@@ -182,18 +964,31 @@ class MixtureLaw(ExtinctionLaw):
         if sum([Rv_A is None, Rv_B is None, Rv is None]) >= 2:
             return False
 
+        f_A = np.asarray(f_A, dtype=float)
         if Rv_A is None:
             Rv_A = self.get_Rv_A(Rv, f_A, Rv_B=Rv_B)
         if Rv is None:
-            Rv = self.get_Rv(Rv_A, f_A, Rv_B=Rv_B)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                Rv = self.get_Rv(Rv_A, f_A, Rv_B=Rv_B)
         if Rv_B is None:
             Rv_B = self.get_Rv_B(Rv, Rv_A, f_A)
 
-        # f_A is a fraction and any Rv is limited to [2.0, 6.0]
-        return ((0. <= f_A <= 1.) & (2.0 <= Rv_B <= 6.0) &
-                (2.0 <= Rv_A <= 6.0) & (2.0 <= Rv <= 6.0))
-
-    def get_Rv_A(self, Rv, f_A=0.5, Rv_B=None):
+        # f_A is a fraction and any Rv is limited to Rv_range
+        lo, hi = self.Rv_range
+        with np.errstate(invalid='ignore'):
+            valid = (f_A >= 0.) & (f_A <= 1.)
+            for value in (Rv, Rv_A, Rv_B):
+                valid = valid & (value >= lo) & (value <= hi)
+        valid = valid & self.A.isvalid(Av=Av, Rv=Rv_A) & self.B.isvalid(Av=Av, Rv=Rv_B)
+        return np.asarray(valid)[()]
+
+    def domain(self, lamb):
+        """ Wavelengths at which both components are defined (see
+        :func:`ExtinctionLaw.domain`) """
+        grid = self._asgrid(lamb)
+        return self.A.domain(grid) & self.B.domain(grid)
+
+    def get_Rv_A(self, Rv, f_A=0.5, Rv_B=None, undetermined=np.nan):
         """ Returns the equivalent Rv to use in the bump component
             Law = f_A * A (lamb, Av=Av, Rv=Rv_A) + (1. - f_A) * B(lamb, Av=Av, Rv=Rv_B)
 
@@ -206,11 +1001,18 @@ class MixtureLaw(ExtinctionLaw):
                 Rv_A = 1. / (1. / (Rv * f_A) - (1. - f_A) / (f_A * Rv_B))
 
             not that Gordon03_SMCBar has a fixed Rv=2.74
+
+            Parameters broadcast against each other.  Rv_A is undetermined
+            when f_A = 0, the `undetermined` value (NaN by default) is
+            returned in that case.
         """
         if Rv_B is None and hasattr(self.B, 'Rv'):
             Rv_B = self.B.Rv
 
-        return 1. / (1. / (Rv * f_A) - (1. - f_A) / (f_A * Rv_B))
+        f_A = np.asarray(f_A, dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            Rv_A = 1. / (1. / (Rv * f_A) - (1. - f_A) / (f_A * Rv_B))
+        return np.where(f_A == 0., undetermined, Rv_A)[()]
 
     def get_Rv(self, Rv_A=None, f_A=0.5, Rv_B=None):
         """ Returns the equivalent effective Rv according to the mixture
@@ -226,6 +1028,8 @@ class MixtureLaw(ExtinctionLaw):
             1 / Rv = f_A / Rv_A + (1 - f_A) / Rv_B
 
             Rv_A = 1. / (1. / (Rv * f_A) - (1. - f_A) / (f_A * Rv_B))
+
+        Parameters broadcast against each other.
         """
         if Rv_B is None and hasattr(self.B, 'Rv'):
             Rv_B = self.B.Rv
@@ -235,7 +1039,7 @@ class MixtureLaw(ExtinctionLaw):
 
         return 1. / (f_A / Rv_A + (1 - f_A) / Rv_B)
 
-    def get_Rv_B(self, Rv, Rv_A=None, f_A=0.5):
+    def get_Rv_B(self, Rv, Rv_A=None, f_A=0.5, undetermined=np.nan):
         """ Returns the equivalent Rv to use in the bumpless component
 
         .. math::
@@ -248,8 +1052,274 @@ class MixtureLaw(ExtinctionLaw):
             1 / Rv = f_A / Rv_A + (1 - f_A) / Rv_B
 
             Rv_A = 1. / (1. / (Rv * f_A) - (1. - f_A) / (f_A * Rv_B))
+
+        Parameters broadcast against each other.  Rv_B is undetermined when
+        f_A = 1, the `undetermined` value (NaN by default) is returned in
+        that case.
         """
         if Rv_A is None and hasattr(self.A, 'Rv'):
             Rv_A = self.A.Rv
 
-        return (1. - f_A) / (1. / Rv - f_A / Rv_A)
+        f_A = np.asarray(f_A, dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            Rv_B = (1. - f_A) / (1. / Rv - f_A / Rv_A)
+        return np.where(f_A == 1., undetermined, Rv_B)[()]
+
+
+class MultiMixtureLaw(ExtinctionLaw):
+    """
+    Linear combination of N extinction laws with a weight vector
+
+    ..math::
+
+            \\sum_i w_i * law_i(*args, Rv=Rv_i, **kwargs)
+
+    Mixtures given as components (e.g., `l1 + l2 + l3`) are flattened into
+    their N components.  A call evaluates each component once and combines
+    them with a single matrix product when the component curves do not
+    depend on the model.
+
+    .. example::
+
+        l = MultiMixtureLaw(Fitzpatrick99() + Gordon03_SMCBar() + Cardelli())
+        # 2 models, 3 components
+        w = np.array([[0.2, 0.3, 0.5], [0.5, 0.5, 0.]])
+        r = l(lamb, weights=w, Rv=[3.1, None, 2.5])   # shape (2,) + lamb.shape
+
+    Attributes
+    ----------
+    components: tuple
+        component laws
+    """
+    def __init__(self, *components, **kwargs):
+        """ Constructor
+
+        Parameters
+        ----------
+        components: sequence of ExtinctionLaw
+            component laws, mixtures are flattened
+
+        name: str, optional
+            name of the law
+        """
+        laws = []
+        for law in components:
+            laws.extend(self._flatten(law))
+        if not laws:
+            raise ValueError('Expecting ExtinctionLaw instances')
+        self.components = tuple(laws)
+        self.name = kwargs.get('name') or '(' + ', '.join(l.name for l in laws) + ')'
+
+    @classmethod
+    def _flatten(cls, law):
+        """ List of the components of a law (itself if not a mixture) """
+        if isinstance(law, MultiMixtureLaw):
+            return list(law.components)
+        if isinstance(law, MixtureLaw):
+            return cls._flatten(law.A) + cls._flatten(law.B)
+        if not isNestedInstance(law, ExtinctionLaw):
+            raise ValueError('Expecting ExtinctionLaw instances')
+        return [law]
+
+    def __len__(self):
+        return len(self.components)
+
+    def function(self, lamb, weights=None, Av=1, Rv=None, Alambda=True,
+                 out=None, dtype=None, **kwargs):
+        """
+        Lamb as to be in Angstroms!!!
+
+        Parameters
+        ----------
+        lamb: float or ndarray(dtype=float) or WavelengthGrid
+            wavelength [in Angstroms] at which evaluate the law.
+
+        weights: ndarray(dtype=float)
+            weights of the components summing to 1, of shape (..., N) to
+            evaluate many models at once (default: 1 / N each)
+
+        Av: float or ndarray(dtype=float)
+            desired A(V) (default 1.0)
+
+        Rv: sequence or ndarray(dtype=float)
+            R(V) of each component, of length N (None items keep the default
+            of the corresponding law) or of shape (..., N)
+
+        Alambda: bool
+            if set returns +2.5*1./log(10.)*tau, tau otherwise
+
+        out: ndarray, optional
+            array in which to store the result (shape of the result,
+            C-contiguous)
+
+        dtype: dtype, optional
+            floating point type of the result (default: the one of lamb if
+            floating point, float64 otherwise)
+
+        unit_policy: str, optional
+            handling of wavelengths without units for this call (default:
+            :attr:`unit_policy`)
+
+        Returns
+        -------
+        r: float or ndarray(dtype=float)
+            attenuation as a function of wavelength
+            depending on Alambda option +2.5*1./log(10.)*tau,  or tau
+            of shape broadcast(weights.shape[:-1], Av, Rv) + lamb.shape
+        """
+        grid = self._asgrid(lamb, dtype, **kwargs)
+        if dtype is None:
+            dtype = grid.dtype
+        ndim = len(grid.shape)
+
+        weights = self._weights(weights)
+        curves = [law.function(grid, Av=Av, Alambda=Alambda, dtype=dtype, **kw)
+                  for law, kw in zip(self.components, self._component_kwargs(Rv))]
+
+        wlead = weights.shape[:-1]
+        clead = np.broadcast_shapes(*[c.shape[:c.ndim - ndim] for c in curves])
+        out, flat = output_buffer(out, grid.shape, dtype,
+                                  np.broadcast_shapes(wlead, clead))
+
+        if clead == ():
+            # (..., N) x (N, M): one matrix product for all the models
+            C = np.stack([c.reshape(-1) for c in curves])
+            np.matmul(np.broadcast_to(weights, flat.shape[:-1] + weights.shape[-1:]),
+                      C, out=flat)
+            return out
+
+        # model dependent curves: weighted sum of the components
+        out[...] = 0.
+        for k, c in enumerate(curves):
+            out += weights[..., k].reshape(wlead + (1, ) * ndim) * c
+        return out
+
+    def _weights(self, weights=None, check=True):
+        """ Weights as an array of shape (..., N)
+
+        Raises
+        ------
+        ValueError:
+            if the last dimension does not match the number of components,
+            or if check is set and the weights of a model do not sum to 1
+        """
+        n = len(self.components)
+        if weights is None:
+            return np.full(n, 1. / n)
+        weights = np.asarray(weights, dtype=float)
+        if (weights.ndim == 0) or (weights.shape[-1] != n):
+            txt = 'Expecting weights of shape (..., {0:d}), got {1} instead.'
+            raise ValueError(txt.format(n, weights.shape))
+        if check and not np.all(self._normalized(weights)):
+            raise ValueError('Expecting weights summing to 1 for every model.')
+        return weights
+
+    @staticmethod
+    def _normalized(weights):
+        """ True where the weights of shape (..., N) sum to 1 """
+        return np.isclose(weights.sum(axis=-1), 1., rtol=0., atol=1e-8)
+
+    def _component_kwargs(self, Rv=None):
+        """ Keywords of the component calls, one dict per component
+
+        Raises
+        ------
+        ValueError:
+            if the number of Rv values does not match the number of components
+        """
+        n = len(self.components)
+        if Rv is None:
+            return [{} for _ in range(n)]
+        if isinstance(Rv, np.ndarray):
+            Rv = list(np.moveaxis(Rv, -1, 0)) if Rv.ndim else [Rv] * n
+        if len(Rv) != n:
+            txt = 'Expecting {0:d} Rv values, got {1:d} instead.'
+            raise ValueError(txt.format(n, len(Rv)))
+        return [{} if r is None else {'Rv': r} for r in Rv]
+
+    def isvalid(self, weights=None, Av=None, Rv=None, **kwargs):
+        """ Test the validity of the weights and of the components parameters
+
+        Parameters
+        ----------
+        weights: ndarray(dtype=float)
+            weights of the components, of shape (..., N), each within [0, 1]
+            and summing to 1
+
+        Av: float or ndarray(dtype=float)
+            Av value (any finite value is allowed, even <0)
+
+        Rv: sequence or ndarray(dtype=float)
+            R(V) of each component (see :func:`function`)
+
+        Returns
+        -------
+        r: bool or ndarray(dtype=bool)
+            True where the values are valid, broadcast shape of the
+            parameters (without the component axis of weights)
+        """
+        weights = self._weights(weights, check=False)
+        with np.errstate(invalid='ignore'):
+            valid = np.all((weights >= 0.) & (weights <= 1.), axis=-1)
+        valid &= self._normalized(weights)
+        for law, kw in zip(self.components, self._component_kwargs(Rv)):
+            valid = valid & law.isvalid(Av=Av, **kw)
+        return np.asarray(valid)[()]
+
+    def domain(self, lamb):
+        """ Wavelengths at which all components are defined (see
+        :func:`ExtinctionLaw.domain`) """
+        grid = self._asgrid(lamb)
+        mask = np.ones(grid.shape, dtype=bool)
+        for law in self.components:
+            mask &= law.domain(grid)
+        return mask
+
+    def _prepare(self, grid):
+        """ Prepare the terms of all components """
+        for law in self.components:
+            grid.terms(law)
+
+    def basis(self, lamb):
+        """ Basis functions of all components stacked (see
+        :func:`ExtinctionLaw.basis`)
+
+        Parameters
+        ----------
+        lamb: float or ndarray(dtype=float) or WavelengthGrid
+            wavelength [in Angstroms if no units]
+
+        Returns
+        -------
+        B: ndarray
+            basis functions, of shape (n_1 + ... + n_N,) + lamb.shape
+        """
+        grid = self._asgrid(lamb)
+        return np.concatenate([law.basis(grid) for law in self.components])
+
+    def basis_coefficients(self, weights=None, Av=1, Rv=None, **kwargs):
+        """ Coefficients of the basis functions (see :func:`basis`)
+
+        Parameters
+        ----------
+        weights: ndarray(dtype=float)
+            weights of the components, of shape (..., N)
+
+        Av: float or ndarray(dtype=float)
+            desired A(V) (default 1.0)
+
+        Rv: sequence or ndarray(dtype=float)
+            R(V) of each component (see :func:`function`)
+
+        Returns
+        -------
+        coeffs: ndarray
+            coefficients of shape params.shape + (n_1 + ... + n_N,)
+        """
+        weights = self._weights(weights)
+        coeffs = [weights[..., k, None] * law.basis_coefficients(Av=Av, **kw)
+                  for k, (law, kw) in enumerate(zip(self.components,
+                                                    self._component_kwargs(Rv)))]
+        lead = np.broadcast_shapes(*[c.shape[:-1] for c in coeffs])
+        return np.concatenate([np.broadcast_to(c, lead + c.shape[-1:])
+                               for c in coeffs], axis=-1)
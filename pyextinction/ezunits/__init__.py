@@ -12,11 +12,24 @@
     :license: BSD, see LICENSE for more details.
 """
 
-from .pint import UnitRegistry, DimensionalityError, UnitsContainer, UndefinedUnitError, logger, __version__
+import threading
 
-# load a default registery.
-## Example sage unit['m * s **-1']
-unit = UnitRegistry()
+from .pint import UnitRegistry, DimensionalityError, UnitsContainer, UndefinedUnitError, UnitConverter, logger, __version__
+
+_lock = threading.Lock()
+
+
+def __getattr__(name):
+    """Load the default registry `unit` on first access.
+    ## Example sage unit['m * s **-1']
+    """
+    if name != 'unit':
+        raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+    with _lock:
+        if 'unit' not in globals():
+            # load a default registery.
+            globals()['unit'] = UnitRegistry()
+    return globals()['unit']
 
 
 def hasUnit(val):
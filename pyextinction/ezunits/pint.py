@@ -19,13 +19,18 @@ __version__ = '0.1'
 import os
 import sys
 import copy
+import json
 import math
+import hashlib
 import logging
+import tempfile
 import operator
+import threading
 import functools
 import itertools
 
-from collections import Iterable
+from collections import OrderedDict
+from collections.abc import Iterable
 
 from io import BytesIO
 from numbers import Number
@@ -165,6 +170,17 @@ def _definitions_from_file(filename):
             yield name, value, aliases, modifiers
 
 
+def default_cache_folder():
+    """Folder of the registry snapshots: $EZUNITS_CACHE_DIR if set,
+    $XDG_CACHE_HOME/pyextinction/ezunits or ~/.cache/pyextinction/ezunits otherwise.
+    """
+    folder = os.environ.get('EZUNITS_CACHE_DIR')
+    if folder:
+        return folder
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'pyextinction', 'ezunits')
+
+
 def _solve_dependencies(dependencies):
     """Solve a dependency graph.
 
@@ -446,6 +462,10 @@ class UnitRegistry(object):
                      Empty to load the default definition file.
                      None to leave the UnitRegistry empty.
     :param force_ndarray: convert any input, scalar or not to a numpy.ndarray.
+    :param cache_folder: folder of the snapshots of the resolved definitions
+                         (see `add_from_file`). Empty for the default folder
+                         (see `default_cache_folder`). None to always parse
+                         the definition file.
     """
 
     #: Map unit name (string) to unit value (Quantity), and unit alias to canonical unit name
@@ -457,13 +477,34 @@ class UnitRegistry(object):
     #: Map suffix name (string) to canonical , and unit alias to canonical unit name
     _SUFFIXES = AliasDict({'': None, 's': ''})
 
-    def __init__(self, filename='', force_ndarray=False):
+    #: Map parsed expression (string) to (magnitude, UnitsContainer), most recently used last
+    _PARSE_CACHE = OrderedDict()
+
+    #: Maximum number of expressions kept in the parse cache (0 disables it)
+    parse_cache_size = 256
+
+    #: Map (source units, destination units) to the conversion factor, most recently used last
+    _FACTOR_CACHE = OrderedDict()
+
+    #: Maximum number of conversion factors kept in the cache (0 disables it)
+    factor_cache_size = 1024
+
+    #: Hits and misses of the parse and conversion factor caches
+    _CACHE_STATS = dict(parse_hits=0, parse_misses=0, factor_hits=0, factor_misses=0)
+
+    #: Lock guarding the caches and their counters, registries may be used by many threads
+    _CACHE_LOCK = threading.Lock()
+
+    #: Version of the snapshot format (see `add_from_file`)
+    _SNAPSHOT_VERSION = 1
+
+    def __init__(self, filename='', force_ndarray=False, cache_folder=''):
         self.Quantity = _build_quantity_class(self, force_ndarray)
         self._definition_files = []
         if filename == '':
-            self.add_from_file(os.path.join(os.path.dirname(__file__), 'default_en.txt'))
+            self.add_from_file(os.path.join(os.path.dirname(__file__), 'default_en.txt'), cache_folder)
         elif filename is not None:
-            self.add_from_file(filename)
+            self.add_from_file(filename, cache_folder)
 
     def __getattr__(self, item):
         return self.Quantity(1, item)
@@ -471,9 +512,106 @@ class UnitRegistry(object):
     def __getitem__(self, item):
         return self._parse_expression(item)
 
+    def clear_cache(self):
+        """Forget the parsed expressions and conversion factors, needed when
+        definitions change.
+        """
+        with self._CACHE_LOCK:
+            self._PARSE_CACHE.clear()
+            self._FACTOR_CACHE.clear()
+
+    def _cache_get(self, cache, key, name):
+        """Return (True, value) if key is in the cache, (False, None)
+        otherwise, and count the hit or miss under the name of the cache.
+        """
+        with self._CACHE_LOCK:
+            try:
+                value = cache[key]
+            except KeyError:
+                self._CACHE_STATS[name + '_misses'] += 1
+                return False, None
+            cache.move_to_end(key)
+            self._CACHE_STATS[name + '_hits'] += 1
+            return True, value
+
+    def _cache_set(self, cache, key, value, maxsize):
+        """Store a value, dropping the least recently used entries beyond
+        maxsize.
+        """
+        if maxsize <= 0:
+            return
+        with self._CACHE_LOCK:
+            cache[key] = value
+            cache.move_to_end(key)
+            while len(cache) > maxsize:
+                cache.popitem(last=False)
+
+    def cache_info(self, reset=False):
+        """Return the hits and misses of the parse and conversion factor
+        caches.
+
+        :param reset: set the counters to zero after reading them.
+        :rtype: dict
+        """
+        with self._CACHE_LOCK:
+            info = dict(self._CACHE_STATS, parse_size=len(self._PARSE_CACHE),
+                        factor_size=len(self._FACTOR_CACHE))
+            if reset:
+                for key in self._CACHE_STATS:
+                    self._CACHE_STATS[key] = 0
+        return info
+
+    def converter(self, src, dst):
+        """Return a converter of magnitudes from src to dst units.
+
+        :param src: source units.
+        :type src: str, Quantity or UnitsContainer.
+        :param dst: destination units.
+        :type dst: str, Quantity or UnitsContainer.
+        :rtype: UnitConverter
+        """
+        src, dst = self._as_units(src), self._as_units(dst)
+        return UnitConverter(src, dst, self.get_conversion_factor(src, dst))
+
+    def get_conversion_factor(self, src, dst):
+        """Return the scalar factor converting magnitudes from src to dst
+        units, computed once per pair of units (see `factor_cache_size`).
+
+        :param src: source units.
+        :type src: str, Quantity or UnitsContainer.
+        :param dst: destination units.
+        :type dst: str, Quantity or UnitsContainer.
+        :raises DimensionalityError: if the units are not compatible.
+        """
+        src, dst = self._as_units(src), self._as_units(dst)
+        key = (frozenset(src.items()), frozenset(dst.items()))
+        found, factor = self._cache_get(self._FACTOR_CACHE, key, 'factor')
+        if found:
+            return factor
+
+        factor = self.Quantity(1, src / dst).convert_to_reference()
+        if not factor.unitless:
+            raise DimensionalityError(src, dst,
+                                      self.Quantity(1, src).dimensionality,
+                                      self.Quantity(1, dst).dimensionality)
+        self._cache_set(self._FACTOR_CACHE, key, factor.magnitude, self.factor_cache_size)
+        return factor.magnitude
+
+    def _as_units(self, units):
+        """Return the UnitsContainer of a string, Quantity or UnitsContainer.
+        """
+        if isinstance(units, UnitsContainer):
+            return units
+        if isinstance(units, string_types):
+            units = self._parse_expression(units)
+        if isinstance(units, self.Quantity):
+            return units._units
+        raise TypeError('units must be of type str, Quantity or UnitsContainer; not {}.'.format(type(units)))
+
     def add_unit(self, name, value, aliases=tuple(), **modifiers):
         """Add unit to the registry.
         """
+        self.clear_cache()
         if not isinstance(value, self.Quantity):
             value = self.Quantity(value, **modifiers)
 
@@ -487,6 +625,7 @@ class UnitRegistry(object):
     def add_prefix(self, name, value, aliases=tuple()):
         """Add prefix to the registry.
         """
+        self.clear_cache()
 
         if not isinstance(value, NUMERIC_TYPES):
             value = eval(value, {'__builtins__': None}, {})
@@ -495,10 +634,27 @@ class UnitRegistry(object):
         for ndx, alias in enumerate(aliases):
             self._PREFIXES.add_alias(alias.strip(), name, not ndx)
 
-    def add_from_file(self, filename):
+    def add_from_file(self, filename, cache_folder=None):
         """Add units and prefixes defined in a definition text file.
+
+        When loading into an empty registry with a cache folder, the resolved
+        definitions are read from a snapshot keyed by the hash of the file,
+        or saved to it after parsing the file.
+
+        :param filename: path of the units definition file.
+        :param cache_folder: folder of the snapshots. Empty for the default
+                             folder (see `default_cache_folder`). None to
+                             always parse the file.
         """
+        self.clear_cache()
         self._definition_files.append(filename)
+
+        snapshot = None
+        if cache_folder is not None and not self._UNITS:
+            snapshot = self._snapshot_path(filename, cache_folder or default_cache_folder())
+            if self._load_snapshot(snapshot):
+                return
+
         pending = dict()
         dependencies = dict()
         conv = dict()
@@ -537,6 +693,84 @@ class UnitRegistry(object):
                 if not unit_name in self._UNITS:
                     self.add_unit(unit_name, *pending[unit_name])
 
+        if snapshot is not None:
+            self._save_snapshot(snapshot)
+
+    def _snapshot_path(self, filename, cache_folder):
+        """Return the snapshot path of a definition file, named after the
+        hash of its content.
+        """
+        digest = hashlib.sha1()
+        digest.update('{} {}\n'.format(__version__, self._SNAPSHOT_VERSION).encode('utf-8'))
+        with open(filename, 'rb') as fp:
+            digest.update(fp.read())
+        return os.path.join(cache_folder, 'units-{}.json'.format(digest.hexdigest()))
+
+    def _save_snapshot(self, path):
+        """Write the definitions of the registry to a snapshot file.
+        Failures are logged and ignored.
+        """
+        def magnitude(value):
+            return value.item() if hasattr(value, 'item') else value
+
+        units = {}
+        for name, value in self._UNITS.items():
+            if isinstance(value, string_types):
+                units[name] = value
+            else:
+                units[name] = [magnitude(value._magnitude), dict(value._units)]
+        state = {'version': self._SNAPSHOT_VERSION,
+                 'units': units,
+                 'unit_aliases': self._UNITS.preferred_alias,
+                 'prefixes': dict(self._PREFIXES),
+                 'prefix_aliases': self._PREFIXES.preferred_alias}
+        try:
+            folder = os.path.dirname(path)
+            if not os.path.isdir(folder):
+                os.makedirs(folder)
+            # write then rename: concurrent processes never read a partial file
+            fd, tmp = tempfile.mkstemp(dir=folder, suffix='.tmp')
+            with os.fdopen(fd, 'w') as fp:
+                json.dump(state, fp)
+            os.replace(tmp, path)
+        except (OSError, IOError, TypeError, ValueError) as ex:
+            logger.debug("Cannot save unit snapshot '{}' {}".format(path, ex))
+
+    def _load_snapshot(self, path):
+        """Restore the definitions of the registry from a snapshot file.
+        The whole snapshot is read and checked before the registry is
+        changed, so that a missing, outdated or corrupt file leaves it
+        untouched.
+
+        :return: True if the snapshot was loaded.
+        """
+        try:
+            with open(path) as fp:
+                state = json.load(fp)
+            if state.get('version') != self._SNAPSHOT_VERSION:
+                raise ValueError('snapshot version {!r}'.format(state.get('version')))
+            units = {}
+            for name, value in state['units'].items():
+                if isinstance(value, string_types):
+                    units[name] = value
+                else:
+                    magnitude, container = value
+                    units[name] = self.Quantity(magnitude, UnitsContainer(container))
+            unit_aliases = dict(state['unit_aliases'])
+            prefixes = {}
+            for name, value in state['prefixes'].items():
+                prefixes[name] = value if isinstance(value, string_types) else float(value)
+            prefix_aliases = dict(state['prefix_aliases'])
+        except (OSError, IOError, ValueError, KeyError, TypeError, IndexError, AttributeError) as ex:
+            logger.debug("Cannot load unit snapshot '{}' {}".format(path, ex))
+            return False
+
+        self._UNITS.update(units)
+        self._UNITS.preferred_alias.update(unit_aliases)
+        self._PREFIXES.update(prefixes)
+        self._PREFIXES.preferred_alias.update(prefix_aliases)
+        return True
+
     def get_alias(self, name):
         """Return the preferred alias for a unit
         """
@@ -619,11 +853,28 @@ class UnitRegistry(object):
 
     def _parse_expression(self, input):
         """Parse expression mathematical units and return a quantity object.
+
+        Parsed expressions are cached (see `parse_cache_size`), each call
+        returns a new quantity.
         """
 
         if not input:
             return self.Quantity(1)
 
+        found, entry = self._cache_get(self._PARSE_CACHE, input, 'parse')
+        if not found:
+            result = self._eval_expression(input)
+            if self.parse_cache_size <= 0:
+                return result
+            entry = (result._magnitude, result._units)
+            self._cache_set(self._PARSE_CACHE, input, entry, self.parse_cache_size)
+        magnitude, units = entry
+        return self.Quantity(copy.copy(magnitude), copy.copy(units))
+
+    def _eval_expression(self, input):
+        """Tokenize and evaluate an expression (see `_parse_expression`).
+        """
+
         gen = _tokenize(input)
         result = []
         unknown = set()
@@ -674,6 +925,35 @@ class UnitRegistry(object):
                                          'U_': UnitsContainer})
 
 
+class UnitConverter(object):
+    """Conversion of magnitudes between two units with a single multiplication.
+
+    Obtained from :meth:`UnitRegistry.converter`.
+
+    :param src: source units.
+    :type src: UnitsContainer.
+    :param dst: destination units.
+    :type dst: UnitsContainer.
+    :param factor: conversion factor from src to dst.
+    """
+
+    def __init__(self, src, dst, factor):
+        self.src = src
+        self.dst = dst
+        self.factor = factor
+
+    def __repr__(self):
+        return "<UnitConverter('{}' -> '{}', {})>".format(self.src, self.dst, self.factor)
+
+    def __call__(self, value):
+        """Return value converted to the destination units.
+
+        :param value: magnitude(s) in source units.
+        :type value: any numeric type or ndarray.
+        """
+        return value * self.factor
+
+
 def _build_quantity_class(registry, force_ndarray):
     """Create a Quantity Class.
     """
@@ -806,14 +1086,11 @@ def _build_quantity_class(registry, force_ndarray):
             if self._units == other._units:
                 return self.__class__(self._magnitude, other)
 
-            factor = self.__class__(1, self.units / other.units)
-            factor = factor.convert_to_reference()
-
-            if not factor.unitless:
-                raise DimensionalityError(self.units, other.units,
-                                          self.dimensionality, other.dimensionality)
+            factor = self._REGISTRY.get_conversion_factor(self._units, other._units)
 
-            self._magnitude *= factor.magnitude
+            # rebinds the magnitude: arrays shared with the caller (or
+            # read-only ones) are never written
+            self._magnitude = self._magnitude * factor
             self._units = copy.copy(other._units)
             return self
 
@@ -823,9 +1100,14 @@ def _build_quantity_class(registry, force_ndarray):
             :param other: destination units.
             :type other: Quantity or str.
             """
-            ret = copy.copy(self)
-            ret.ito(other)
-            return ret
+            if isinstance(other, string_types):
+                other = self._REGISTRY._parse_expression(other)
+
+            if self._units == other._units:
+                return copy.copy(self)
+
+            factor = self._REGISTRY.get_conversion_factor(self._units, other._units)
+            return self.__class__(self._magnitude * factor, copy.copy(other._units))
 
         def _convert_to_reference(self, input_units):
 
@@ -1192,8 +1474,12 @@ def _build_quantity_class(registry, force_ndarray):
     return _Quantity
 
 
-_DEFAULT_REGISTRY = UnitRegistry()
+#: registry used to unpickle quantities, created on first use
+_DEFAULT_REGISTRY = None
 
 
 def _build_quantity(value, units):
+    global _DEFAULT_REGISTRY
+    if _DEFAULT_REGISTRY is None:
+        _DEFAULT_REGISTRY = UnitRegistry()
     return _DEFAULT_REGISTRY.Quantity(value, units)
@@ -1,7 +1,11 @@
+import math
 import numpy as np
-from scipy import interpolate
 
-from .extinction import ExtinctionLaw, val_in_unit
+from .extinction import ExtinctionLaw
+from . import kernels
+from . import instrument
+from .helpers import (broadcast_parameters, leading_shape, output_buffer,
+                      LRUCache, spline_basis)
 
 
 class Fitzpatrick99(ExtinctionLaw):
@@ -13,91 +17,362 @@ class Fitzpatrick99(ExtinctionLaw):
 
 
     .. [1999PASP..111...63F] http://adsabs.harvard.edu/abs/1999PASP..111...63F
+
+    Attributes
+    ----------
+    spline_cache: LRUCache
+        optical/NIR spline representations indexed by Rv
     """
-    def __init__(self):
+
+    #: powers of Rv in the linear decomposition of A(lambda)/A(V)
+    #: (see :func:`basis`)
+    basis_powers = (-2, -1, 0, 1, 2, 3)
+
+    #: optical/NIR spline anchors in A(lambda)/E(B-V) as polynomials of Rv
+    #: (lowest order first), from fm_unred.pro
+    _opir_polynomials = ((0.0, ),
+                         (0.0, 0.26469 / 3.1),
+                         (0.0, 0.82925 / 3.1),
+                         (-4.22809e-01, 1.00270, 2.13572e-04),
+                         (-5.13540e-02, 1.00216, -7.35778e-05),
+                         (7.00127e-01, 1.00184, -3.32598e-05),
+                         (1.19456, 1.01707, -5.46959e-03, 7.97809e-04, -4.45636e-05))
+
+    def __init__(self, cache_size=128):
+        """
+        Parameters
+        ----------
+        cache_size: int
+            number of Rv values for which the optical/NIR spline is kept in
+            memory (0 disables the cache)
+        """
         self.name = 'Fitzpatrick99'
+        self.spline_cache = LRUCache(cache_size, name='spline')
 
-    def function(self, lamb, Av=1, Rv=3.1, Alambda=True, **kwargs):
+    def function(self, lamb, Av=1, Rv=3.1, Alambda=True, out=None,
+                 dtype=None, **kwargs):
         """
         Fitzpatrick99 extinction Law
         Lamb is input in Anstroms
 
         Parameters
         ----------
-        lamb: float or ndarray(dtype=float)
+        lamb: float or ndarray(dtype=float) or WavelengthGrid
             wavelength [in Angstroms] at which evaluate the law.
 
-        Av: float
+        Av: float or ndarray(dtype=float)
             desired A(V) (default 1.0)
 
-        Rv: float
+        Rv: float or ndarray(dtype=float)
             desired R(V) (default 3.1)
 
         Alambda: bool
             if set returns +2.5*1./log(10.)*tau, tau otherwise
 
+        out: ndarray, optional
+            array in which to store the result (shape of the result,
+            C-contiguous)
+
+        dtype: dtype, optional
+            floating point type of the result (default: the one of lamb if
+            floating point, float64 otherwise)
+
+        unit_policy: str, optional
+            handling of wavelengths without units for this call (default:
+            :attr:`unit_policy`)
+
         Returns
         -------
         r: float or ndarray(dtype=float)
             attenuation as a function of wavelength
             depending on Alambda option +2.5*1./log(10.)*tau,  or tau
+            array-valued Av and Rv of shape (N,) give a (N,) + lamb.shape
+            result
         """
-        _lamb = val_in_unit('lamb', lamb, 'angstrom').magnitude
+        grid = self._asgrid(lamb, dtype, **kwargs)
+        Av, Rv = broadcast_parameters(grid.shape, Av, Rv)
+        if dtype is None:
+            dtype = grid.dtype
+        out, k = output_buffer(out, grid.shape, dtype, leading_shape(1, Av, Rv))
 
-        if isinstance(_lamb, float) or isinstance(_lamb, np.float_):
-            _lamb = np.asarray([_lamb])
+        if (Alambda):
+            scale = Av
         else:
-            _lamb = _lamb[:]
+            scale = Av * (np.log(10.) * 0.4)
 
+        if Rv.ndim:
+            # many curves: linear combination of the basis functions
+            M = self._monomials(Rv[..., 0])
+            B = grid.terms(self, '_prepare_basis')
+            if M.shape[:-1] == k.shape[:-1]:
+                np.matmul(M, B, out=k)
+                k *= scale
+            else:
+                np.multiply(np.dot(M, B), scale, out=k)
+        elif self._use_jit() and (Av.ndim == 0):
+            self._kernel(grid, float(Rv), float(scale), k)
+        elif (Av.ndim == 0):
+            self._curve(grid, Rv, k)
+            k *= scale
+        else:
+            np.multiply(self._curve(grid, Rv), scale, out=k)
+        return out
+
+    def _curve(self, grid, Rv, out=None):
+        """ A(lambda)/A(V) for a single Rv value
+
+        Parameters
+        ----------
+        grid: WavelengthGrid
+            wavelengths
+
+        Rv: float
+            R(V) value
+
+        out: ndarray, optional
+            array of size grid.size in which to store the result
+
+        Returns
+        -------
+        k: ndarray
+            A(lambda)/A(V) on the flattened grid
+        """
+        t = grid.terms(self)
+
+        c4 = 0.41
+
+        if out is None:
+            k = np.zeros(grid.size)
+        else:
+            k = out
+            k[...] = 0.
+
+        # compute the UV portion of A(lambda)/E(B-V)
+        # including the FUV portion
+        if len(t['uv']):
+            k[t['uv']] = self._uv(t['x_uv'], Rv, t['drude_uv']) + c4 * t['fuv'] + Rv
+
+        # Optical/NIR portion
+        if len(t['opt']):
+            from scipy import interpolate
+            k[t['opt']] = interpolate.splev(t['x_opt'], self._spline(Rv))
+
+        # convert from A(lambda)/E(B-V) to A(lambda)/A(V)
+        k /= Rv
+        return k
+
+    def _kernel(self, grid, Rv, scale, out):
+        """ scale * A(lambda)/A(V) for a single Rv value with the compiled
+        single-pass kernel (see :func:`kernels.uv_spline`), stored in out
+        """
         c2 = -0.824 + 4.717 / Rv
         c1 = 2.030 - 3.007 * c2
-        c3 = 3.23
-        c4 = 0.41
+        t, c, _ = self._spline(Rv)
+        kernels.get_kernel('uv_spline')(grid.x, 10000.0 / 2700., c1 + Rv, c2,
+                                        3.23, 0.41, 4.596, 0.99, t, c,
+                                        scale / Rv, out)
+
+    def _scalar(self, lamb, Av, Alambda, Rv=3.1, **kwargs):
+        """ :func:`ExtinctionLaw.scalar` (see :func:`kernels.uv_spline_point`) """
+        Rv = float(Rv)
+        if Alambda:
+            scale = Av
+        else:
+            scale = Av * (math.log(10.) * 0.4)
+        c2 = -0.824 + 4.717 / Rv
+        c1 = 2.030 - 3.007 * c2
+        t, c, _ = self._spline(Rv)
+        k = kernels.uv_spline_point(1e4 / lamb, 10000.0 / 2700., c1 + Rv, c2,
+                                    3.23, 0.41, 4.596, 0.99, t, c)
+        return scale * k / Rv
+
+    def _prepare(self, grid):
+        """ Rv independent terms of the law on the grid
+
+        Parameters
+        ----------
+        grid: WavelengthGrid
+            wavelengths
+
+        Returns
+        -------
+        terms: dict
+            uv, opt: indices of the UV and optical/NIR wavelengths
+            x_uv, x_opt: wavenumbers of these wavelengths
+            drude_uv: Drude profile at x_uv (see :func:`_drude`)
+            fuv: FUV curvature at x_uv (0 below 5.9 um^-1)
+        """
+        x = grid.x
+        xcutuv = 10000.0 / 2700.
+        uv = np.flatnonzero(x >= xcutuv)
+        opt = np.flatnonzero(x < xcutuv)
+        x_uv = x[uv]
+        y = np.clip(x_uv - 5.9, 0., None)
+        return dict(uv=uv, opt=opt, x_uv=x_uv, x_opt=x[opt],
+                    drude_uv=self._drude(x_uv),
+                    fuv=0.5392 * (y ** 2) + 0.05644 * (y ** 3))
+
+    def _prepare_basis(self, grid):
+        """ Basis functions of A(lambda)/A(V) on the grid, one per power of
+        Rv in :attr:`basis_powers`
+
+        In the UV, k / Rv = 1 + (u0 + c4 * F) / Rv + u1 / Rv ** 2 (see
+        :func:`_uv_terms`).  The optical/NIR cubic spline is linear in its
+        anchor values, which are polynomials of Rv.
+        """
+        t = grid.terms(self)
+        powers = list(self.basis_powers)
+        B = np.zeros((len(powers), grid.size))
+
+        u0, u1 = self._uv_terms(t['x_uv'], t['drude_uv'])
+        B[powers.index(0), t['uv']] = 1.
+        B[powers.index(-1), t['uv']] = u0 + 0.41 * t['fuv']
+        B[powers.index(-2), t['uv']] = u1
+
+        if len(t['opt']):
+            xk = self._anchors()
+            W = np.zeros((len(xk), len(powers)))
+            # anchor / Rv: polynomial of degree d contributes to Rv ** (d - 1)
+            for j, coeffs in enumerate(self._opir_polynomials):
+                for d, c in enumerate(coeffs):
+                    W[j, powers.index(d - 1)] = c
+            # UV anchors: (u0 + u1 / Rv + Rv) / Rv
+            u0, u1 = self._uv_terms(xk[-2:])
+            W[-2:, powers.index(0)] = 1.
+            W[-2:, powers.index(-1)] = u0
+            W[-2:, powers.index(-2)] = u1
+            B[:, t['opt']] = np.dot(W.T, spline_basis(xk, t['x_opt']))
+
+        return B
+
+    def _monomials(self, Rv):
+        """ Powers of Rv matching :attr:`basis_powers`, shape Rv.shape + (n,) """
+        Rv = np.asarray(Rv, dtype=float)[..., None]
+        return Rv ** np.array(self.basis_powers, dtype=float)
+
+    def basis_coefficients(self, Av=1., Rv=3.1, **kwargs):
+        """ Coefficients of the basis functions (see :func:`basis`)
+
+        Parameters
+        ----------
+        Av: float or ndarray(dtype=float)
+            desired A(V) (default 1.0)
+
+        Rv: float or ndarray(dtype=float)
+            desired R(V) (default 3.1)
+
+        Returns
+        -------
+        coeffs: ndarray
+            coefficients of shape broadcast(Av, Rv).shape + (n,)
+        """
+        return np.asarray(Av, dtype=float)[..., None] * self._monomials(Rv)
+
+    def basis_coefficient_grads(self, Av=1., Rv=3.1, **kwargs):
+        """ Partial derivatives of the coefficients (see
+        :func:`basis_coefficients`)
+
+        Returns
+        -------
+        grads: dict
+            Av: Rv ** p, Rv: Av * p * Rv ** (p - 1) for p in
+            :attr:`basis_powers`, of shape broadcast(Av, Rv).shape + (n,)
+        """
+        Av = np.asarray(Av, dtype=float)[..., None]
+        p = np.array(self.basis_powers, dtype=float)
+        M = self._monomials(Rv)
+        dM = p * M / np.asarray(Rv, dtype=float)[..., None]
+        return {'Av': np.broadcast_to(M, np.broadcast_shapes(Av.shape, M.shape)),
+                'Rv': Av * dM}
+
+    @staticmethod
+    def _drude(x):
+        """ Drude profile of the 2175 A bump (x0 = 4.596, gamma = 0.99) """
         x0 = 4.596
         gamma = 0.99
+        return ((x) ** 2) / ( ((x) ** 2 - (x0 ** 2)) ** 2 + (gamma ** 2) * ((x) ** 2 ))
 
-        x = 1.e4 / _lamb
-        k = np.zeros(np.size(x))
+    def _uv_terms(self, x, drude=None):
+        """ Rv independent terms of the UV portion
 
-        # compute the UV portion of A(lambda)/E(B-V)
-        xcutuv = 10000.0 / 2700.
-        xspluv = 10000.0 / np.array([2700., 2600.])
-        yspluv = c1 + (c2 * xspluv) + c3 * ((xspluv) ** 2) / ( ((xspluv) ** 2 - (x0 ** 2)) ** 2 + (gamma ** 2) * ((xspluv) ** 2 ))
-        ind = (x >= xcutuv)
+        With c2 = -0.824 + 4.717 / Rv and c1 = 2.030 - 3.007 * c2,
+        c1 + c2 * x + c3 * D(x) = u0(x) + u1(x) / Rv
 
-        if True in ind:
-            k[ind] = c1 + (c2 * x[ind]) + c3 * ((x[ind]) ** 2) / ( ((x[ind]) ** 2 - (x0 ** 2)) ** 2 + (gamma ** 2) * ((x[ind]) ** 2 ))
+        Parameters
+        ----------
+        x: ndarray
+            wavenumbers in um^-1
 
-            # FUV portion
-            fuvind = np.where(x >= 5.9)
-            k[fuvind] += c4 * (0.5392 * ((x[fuvind] - 5.9) ** 2) + 0.05644 * ((x[fuvind] - 5.9) ** 3))
+        drude: ndarray, optional
+            precomputed Drude profile at x
 
-            k[ind] += Rv
-            yspluv += Rv
+        Returns
+        -------
+        u0, u1: ndarray, ndarray
+            terms of order 0 and -1 in Rv
+        """
+        if drude is None:
+            drude = self._drude(x)
+        c3 = 3.23
+        u0 = 2.030 + 3.007 * 0.824 - 0.824 * x + c3 * drude
+        u1 = 4.717 * (x - 3.007)
+        return u0, u1
 
-        # Optical/NIR portion
+    def _uv(self, x, Rv, drude=None):
+        """ UV portion of A(lambda)/E(B-V) without the FUV curvature and the
+        Rv offset
 
-        ind = x < xcutuv
-        if True in ind:
-            xsplopir = np.zeros(7)
-            xsplopir[0] = 0.0
-            xsplopir[1: 7] = 10000.0 / np.array([26500.0, 12200.0, 6000.0, 5470.0, 4670.0, 4110.0])
+        Parameters
+        ----------
+        x: ndarray
+            wavenumbers in um^-1
 
-            ysplopir = np.zeros(7)
-            ysplopir[0: 3] = np.array([0.0, 0.26469, 0.82925]) * Rv / 3.1
+        Rv: float or ndarray(dtype=float)
+            R(V) values broadcastable against x
 
-            ysplopir[3: 7] = np.array([np.poly1d([2.13572e-04, 1.00270, -4.22809e-01])(Rv),
-                                       np.poly1d([-7.35778e-05, 1.00216, -5.13540e-02])(Rv),
-                                       np.poly1d([-3.32598e-05, 1.00184,  7.00127e-01])(Rv),
-                                       np.poly1d([ 1.19456, 1.01707, -5.46959e-03, 7.97809e-04, -4.45636e-05][::-1])(Rv)])
+        drude: ndarray, optional
+            precomputed Drude profile at x
 
-            tck = interpolate.splrep(np.hstack([xsplopir, xspluv]), np.hstack([ysplopir, yspluv]), k=3)
-            k[ind] = interpolate.splev(x[ind], tck)
+        Returns
+        -------
+        k: ndarray
+            c1 + c2 * x + c3 * D(x, x0, gamma)
+        """
+        u0, u1 = self._uv_terms(x, drude)
+        return u0 + u1 / Rv
 
-        # convert from A(lambda)/E(B-V) to A(lambda)/A(V)
-        k /= Rv
+    def _anchors(self):
+        """ Wavenumbers of the optical/NIR spline anchors, the last two are
+        in the UV """
+        xsplopir = np.zeros(7)
+        xsplopir[0] = 0.0
+        xsplopir[1: 7] = 10000.0 / np.array([26500.0, 12200.0, 6000.0, 5470.0, 4670.0, 4110.0])
+        xspluv = 10000.0 / np.array([2700., 2600.])
+        return np.hstack([xsplopir, xspluv])
 
-        if (Alambda):
-            return(k * Av)
-        else:
-            return(k * Av * (np.log(10.) * 0.4))
+    def _spline(self, Rv):
+        """ Cubic spline representation of the optical/NIR portion of
+        A(lambda)/E(B-V)
+
+        Parameters
+        ----------
+        Rv: float
+            R(V) value
+
+        Returns
+        -------
+        tck: tuple
+            spline representation (see :func:`scipy.interpolate.splrep`)
+        """
+        Rv = float(Rv)
+        return self.spline_cache.get(Rv, lambda: self._splrep(Rv))
+
+    def _splrep(self, Rv):
+        """ Fit the optical/NIR spline for a given Rv (see :func:`_spline`) """
+        from scipy import interpolate
+        xk = self._anchors()
+        yspluv = self._uv(xk[-2:], Rv) + Rv
+        ysplopir = np.array([np.polyval(coeffs[::-1], Rv) for coeffs in self._opir_polynomials])
+        tck = interpolate.splrep(xk, np.hstack([ysplopir, yspluv]), k=3)
+        instrument.record('spline_fit', self.name, Rv=Rv)
+        return tck
@@ -1,7 +1,11 @@
+import math
 import numpy as np
-from scipy import interpolate
 
-from .extinction import ExtinctionLaw, val_in_unit
+from .extinction import ExtinctionLaw
+from . import kernels
+from . import instrument
+from .helpers import (broadcast_parameters, leading_shape, output_buffer,
+                      LRUCache, spline_basis)
 
 
 class Gordon03_SMCBar(ExtinctionLaw):
@@ -16,90 +20,363 @@ class Gordon03_SMCBar(ExtinctionLaw):
     ----------
     Rv: float
         desired default R(V), can be replaced during calling sequences
+
+    spline_cache: LRUCache
+        optical/NIR spline representations indexed by Rv
     """
-    def __init__(self, Rv=2.74):
+
+    #: powers of Rv in the linear decomposition of A(lambda)/A(V)
+    #: (see :func:`basis`)
+    basis_powers = (0, -1)
+
+    def __init__(self, Rv=2.74, cache_size=128):
         """
         Parameters
         ----------
         Rv: float
             desired R(V) (default internal value given at initialization)
+
+        cache_size: int
+            number of Rv values for which the optical/NIR spline is kept in
+            memory (0 disables the cache)
         """
         self.name = 'Gordon et al. 2003 SMCBar'
         self.Rv = Rv
+        self.spline_cache = LRUCache(cache_size, name='spline')
 
-    def function(self, lamb, Av=1, Rv=None, Alambda=True,  **kwargs):
+    def function(self, lamb, Av=1, Rv=None, Alambda=True, out=None,
+                 dtype=None, **kwargs):
         """
         Lamb is input in Anstroms
         Note that Rv is not given as a variable in the paper of reference
 
         Parameters
         ----------
-        lamb: float or ndarray(dtype=float)
+        lamb: float or ndarray(dtype=float) or WavelengthGrid
             wavelength [in Angstroms] at which evaluate the law.
 
-        Av: float
+        Av: float or ndarray(dtype=float)
             desired A(V) (default 1.0)
 
-        Rv: float
+        Rv: float or ndarray(dtype=float)
             desired R(V) (default internal value given at initialization)
 
         Alambda: bool
             if set returns +2.5*1./log(10.)*tau, tau otherwise
 
+        out: ndarray, optional
+            array in which to store the result (shape of the result,
+            C-contiguous)
+
+        dtype: dtype, optional
+            floating point type of the result (default: the one of lamb if
+            floating point, float64 otherwise)
+
+        unit_policy: str, optional
+            handling of wavelengths without units for this call (default:
+            :attr:`unit_policy`)
+
         Returns
         -------
         r: float or ndarray(dtype=float)
             attenuation as a function of wavelength
             depending on Alambda option +2.5*1./log(10.)*tau,  or tau
+            array-valued Av and Rv of shape (N,) give a (N,) + lamb.shape
+            result
         """
-        _lamb = val_in_unit('lamb', lamb, 'angstrom').magnitude
+        if Rv is None:
+            Rv = self.Rv
+
+        grid = self._asgrid(lamb, dtype, **kwargs)
+        Av, Rv = broadcast_parameters(grid.shape, Av, Rv)
+        if dtype is None:
+            dtype = grid.dtype
+        out, k = output_buffer(out, grid.shape, dtype, leading_shape(1, Av, Rv))
 
-        if isinstance(_lamb, float) or isinstance(_lamb, np.float_):
-            _lamb = np.asarray([_lamb])
+        if (Alambda):
+            scale = Av
         else:
-            _lamb = _lamb[:]
+            scale = Av * (np.log(10.) * 0.4)
 
-        if Rv is None:
-            Rv = self.Rv
+        if Rv.ndim:
+            # many curves: linear combination of the basis functions
+            M = self._monomials(Rv[..., 0])
+            B = grid.terms(self, '_prepare_basis')
+            if M.shape[:-1] == k.shape[:-1]:
+                np.matmul(M, B, out=k)
+                k *= scale
+            else:
+                np.multiply(np.dot(M, B), scale, out=k)
+        elif self._use_jit() and (Av.ndim == 0):
+            self._kernel(grid, float(Rv), float(scale), k)
+        elif (Av.ndim == 0):
+            self._curve(grid, Rv, k)
+            k *= scale
+        else:
+            np.multiply(self._curve(grid, Rv), scale, out=k)
+        return out
+
+    def _curve(self, grid, Rv, out=None):
+        """ A(lambda)/A(V) for a single Rv value
+
+        Parameters
+        ----------
+        grid: WavelengthGrid
+            wavelengths
+
+        Rv: float
+            R(V) value
+
+        out: ndarray, optional
+            array of size grid.size in which to store the result
+
+        Returns
+        -------
+        k: ndarray
+            A(lambda)/A(V) on the flattened grid
+        """
+        t = grid.terms(self)
+
+        c4 = 0.461 / Rv
 
+        if out is None:
+            k = np.zeros(grid.size)
+        else:
+            k = out
+            k[...] = 0.
+
+        # UV part
+        if len(t['uv']):
+            k[t['uv']] = self._uv(t['x_uv'], Rv, t['drude_uv']) + c4 * t['fuv']
+
+        # Opt/NIR part
+        if len(t['opt']):
+            from scipy import interpolate
+            k[t['opt']] = interpolate.splev(t['x_opt'], self._spline(Rv))
+
+        return k
+
+    def _kernel(self, grid, Rv, scale, out):
+        """ scale * A(lambda)/A(V) for a single Rv value with the compiled
+        single-pass kernel (see :func:`kernels.uv_spline`), stored in out
+        """
         c1 = -4.959 / Rv
         c2 = 2.264 / Rv
         c3 = 0.389 / Rv
         c4 = 0.461 / Rv
+        t, c, _ = self._spline(Rv)
+        kernels.get_kernel('uv_spline')(grid.x, 10000.0 / 2700., 1.0 + c1, c2,
+                                        c3, c4, 4.6, 1.0, t, c, scale, out)
+
+    def _scalar(self, lamb, Av, Alambda, Rv=None, **kwargs):
+        """ :func:`ExtinctionLaw.scalar` (see :func:`kernels.uv_spline_point`) """
+        Rv = float(self.Rv if Rv is None else Rv)
+        if Alambda:
+            scale = Av
+        else:
+            scale = Av * (math.log(10.) * 0.4)
+        t, c, _ = self._spline(Rv)
+        k = kernels.uv_spline_point(1e4 / lamb, 10000.0 / 2700., 1.0 - 4.959 / Rv,
+                                    2.264 / Rv, 0.389 / Rv, 0.461 / Rv, 4.6, 1.0,
+                                    t, c)
+        return scale * k
+
+    def _prepare(self, grid):
+        """ Rv independent terms of the law on the grid
+
+        Parameters
+        ----------
+        grid: WavelengthGrid
+            wavelengths
+
+        Returns
+        -------
+        terms: dict
+            uv, opt: indices of the UV and optical/NIR wavelengths
+            x_uv, x_opt: wavenumbers of these wavelengths
+            drude_uv: Drude profile at x_uv (see :func:`_drude`)
+            fuv: FUV curvature at x_uv (0 below 5.9 um^-1)
+        """
+        x = grid.x
+        xcutuv = 10000.0 / 2700.
+        uv = np.flatnonzero(x >= xcutuv)
+        opt = np.flatnonzero(x < xcutuv)
+        x_uv = x[uv]
+        y = np.clip(x_uv - 5.9, 0., None)
+        return dict(uv=uv, opt=opt, x_uv=x_uv, x_opt=x[opt],
+                    drude_uv=self._drude(x_uv),
+                    fuv=0.5392 * (y ** 2) + 0.05644 * (y ** 3))
+
+    def _prepare_basis(self, grid):
+        """ Basis functions of A(lambda)/A(V) on the grid, one per power of
+        Rv in :attr:`basis_powers`
+
+        In the UV, k = 1 + (u1 + c4 * F) / Rv (see :func:`_uv_terms`).  The
+        optical/NIR cubic spline is linear in its anchor values, which only
+        depend on Rv through the two UV anchors.
+        """
+        t = grid.terms(self)
+        B = np.zeros((2, grid.size))
+
+        u0, u1 = self._uv_terms(t['x_uv'], t['drude_uv'])
+        B[0, t['uv']] = u0
+        B[1, t['uv']] = u1 + 0.461 * t['fuv']
+
+        if len(t['opt']):
+            xk, ysplopir = self._anchors()
+            u0, u1 = self._uv_terms(xk[-2:])
+            W = np.zeros((len(xk), 2))
+            W[:-2, 0] = ysplopir
+            W[-2:, 0] = u0
+            W[-2:, 1] = u1
+            B[:, t['opt']] = np.dot(W.T, spline_basis(xk, t['x_opt']))
+
+        return B
+
+    def _monomials(self, Rv):
+        """ Powers of Rv matching :attr:`basis_powers`, shape Rv.shape + (n,) """
+        Rv = np.asarray(Rv, dtype=float)[..., None]
+        return Rv ** np.array(self.basis_powers, dtype=float)
+
+    def basis_coefficients(self, Av=1., Rv=None, **kwargs):
+        """ Coefficients of the basis functions (see :func:`basis`)
+
+        Parameters
+        ----------
+        Av: float or ndarray(dtype=float)
+            desired A(V) (default 1.0)
+
+        Rv: float or ndarray(dtype=float)
+            desired R(V) (default internal value given at initialization)
+
+        Returns
+        -------
+        coeffs: ndarray
+            coefficients of shape broadcast(Av, Rv).shape + (n,)
+        """
+        if Rv is None:
+            Rv = self.Rv
+        return np.asarray(Av, dtype=float)[..., None] * self._monomials(Rv)
+
+    def basis_coefficient_grads(self, Av=1., Rv=None, **kwargs):
+        """ Partial derivatives of the coefficients (see
+        :func:`basis_coefficients`)
+
+        Returns
+        -------
+        grads: dict
+            Av: Rv ** p, Rv: Av * p * Rv ** (p - 1) for p in
+            :attr:`basis_powers`, of shape broadcast(Av, Rv).shape + (n,)
+        """
+        if Rv is None:
+            Rv = self.Rv
+        Av = np.asarray(Av, dtype=float)[..., None]
+        p = np.array(self.basis_powers, dtype=float)
+        M = self._monomials(Rv)
+        dM = p * M / np.asarray(Rv, dtype=float)[..., None]
+        return {'Av': np.broadcast_to(M, np.broadcast_shapes(Av.shape, M.shape)),
+                'Rv': Av * dM}
+
+    @staticmethod
+    def _drude(x):
+        """ Drude profile of the 2175 A bump (x0 = 4.6, gamma = 1.0) """
         x0 = 4.6
         gamma = 1.0
+        return ((x) ** 2) / ( ((x) ** 2 - (x0 ** 2)) ** 2 + (gamma ** 2) * ((x) ** 2 ))
 
-        x = 1.e4 / _lamb
-        k = np.zeros(np.size(x))
+    def _uv_terms(self, x, drude=None):
+        """ Rv independent terms of the UV portion
 
-        # UV part
-        xcutuv = 10000.0 / 2700.
+        With c1 = -4.959 / Rv, c2 = 2.264 / Rv and c3 = 0.389 / Rv,
+        1 + c1 + c2 * x + c3 * D(x) = u0(x) + u1(x) / Rv
+
+        Parameters
+        ----------
+        x: ndarray
+            wavenumbers in um^-1
+
+        drude: ndarray, optional
+            precomputed Drude profile at x
+
+        Returns
+        -------
+        u0, u1: ndarray, ndarray
+            terms of order 0 and -1 in Rv
+        """
+        if drude is None:
+            drude = self._drude(x)
+        u0 = np.ones(np.shape(x))
+        u1 = -4.959 + 2.264 * x + 0.389 * drude
+        return u0, u1
+
+    def _uv(self, x, Rv, drude=None):
+        """ UV portion of A(lambda)/A(V) without the FUV curvature
+
+        Parameters
+        ----------
+        x: ndarray
+            wavenumbers in um^-1
+
+        Rv: float or ndarray(dtype=float)
+            R(V) values broadcastable against x
+
+        drude: ndarray, optional
+            precomputed Drude profile at x
+
+        Returns
+        -------
+        k: ndarray
+            1 + c1 + c2 * x + c3 * D(x, x0, gamma)
+        """
+        u0, u1 = self._uv_terms(x, drude)
+        return u0 + u1 / Rv
+
+    def _anchors(self):
+        """ Optical/NIR spline anchors, the last two wavenumbers are in the
+        UV and their values depend on Rv (see :func:`_uv`)
+
+        Returns
+        -------
+        xk: ndarray
+            anchor wavenumbers in um^-1
+
+        ysplopir: ndarray
+            values at the optical/NIR anchors (all but the last two)
+        """
+        xsplopir = np.zeros(9)
+        xsplopir[0] = 0.0
+        xsplopir[1: 10] = 1.0 / np.array([2.198, 1.65, 1.25, 0.81, 0.65, 0.55, 0.44, 0.37])
         xspluv = 10000.0 / np.array([2700., 2600.])
-        yspluv = 1.0 + c1 + (c2 * xspluv) + c3 * ((xspluv) ** 2) / ( ((xspluv) ** 2 - (x0 ** 2)) ** 2 + (gamma ** 2) * ((xspluv) ** 2 ))
 
-        ind = np.where(x >= xcutuv)
-        if np.size(ind) > 0:
-            k[ind] = 1.0 + c1 + (c2 * x[ind]) + c3 * ((x[ind]) ** 2) / ( ((x[ind]) ** 2 - (x0 ** 2)) ** 2 + (gamma ** 2) * ((x[ind]) ** 2 ))
+        # Values directly from Gordon et al. (2003)
+        # ysplopir =  np.array([0.0,0.016,0.169,0.131,0.567,0.801,1.00,1.374,1.672])
+        # K & J values adjusted to provide a smooth, non-negative cubic spline interpolation
+        ysplopir = np.array([0.0, 0.11, 0.169, 0.25, 0.567, 0.801, 1.00, 1.374, 1.672])
 
-            ind = np.where(x >= 5.9)
-            k[ind] += c4 * (0.5392 * ((x[ind] - 5.9) ** 2) + 0.05644 * ((x[ind] - 5.9) ** 3))
+        return np.hstack([xsplopir, xspluv]), ysplopir
 
-        # Opt/NIR part
-        ind = np.where(x < xcutuv)
-        if np.size(ind) > 0:
-            xsplopir = np.zeros(9)
-            xsplopir[0] = 0.0
-            xsplopir[1: 10] = 1.0 / np.array([2.198, 1.65, 1.25, 0.81, 0.65, 0.55, 0.44, 0.37])
+    def _spline(self, Rv):
+        """ Cubic spline representation of the optical/NIR portion of
+        A(lambda)/A(V)
 
-            # Values directly from Gordon et al. (2003)
-            # ysplopir =  np.array([0.0,0.016,0.169,0.131,0.567,0.801,1.00,1.374,1.672])
-            # K & J values adjusted to provide a smooth, non-negative cubic spline interpolation
-            ysplopir = np.array([0.0, 0.11, 0.169, 0.25, 0.567, 0.801, 1.00, 1.374, 1.672])
+        Parameters
+        ----------
+        Rv: float
+            R(V) value
 
-            tck = interpolate.splrep(np.hstack([xsplopir, xspluv]), np.hstack([ysplopir, yspluv]), k=3)
-            k[ind] = interpolate.splev(x[ind], tck)
+        Returns
+        -------
+        tck: tuple
+            spline representation (see :func:`scipy.interpolate.splrep`)
+        """
+        Rv = float(Rv)
+        return self.spline_cache.get(Rv, lambda: self._splrep(Rv))
 
-        if (Alambda):
-            return(k * Av)
-        else:
-            return(k * Av * (np.log(10.) * 0.4 ))
+    def _splrep(self, Rv):
+        """ Fit the optical/NIR spline for a given Rv (see :func:`_spline`) """
+        from scipy import interpolate
+        xk, ysplopir = self._anchors()
+        yspluv = self._uv(xk[-2:], Rv)
+        tck = interpolate.splrep(xk, np.hstack([ysplopir, yspluv]), k=3)
+        instrument.record('spline_fit', self.name, Rv=Rv)
+        return tck
@@ -0,0 +1,397 @@
+"""
+Precomputed law grids
+---------------------
+
+:class:`GriddedLaw` tabulates a law on a (Rv, wavelength) grid, or a
+(Rv_A, f_A, wavelength) grid for a :class:`MixtureLaw`, and evaluates it by
+linear interpolation instead of the analytic expressions.  A mixture is
+linear in f_A, so that the interpolation in f_A is exact and the default
+f_A nodes are (0, 1).
+
+The table can be stored in a `.npy` file that is memory-mapped read-only on
+load: processes of a node that use the same file share its pages through the
+OS page cache.
+
+.. example::
+
+    lamb = np.linspace(1000., 30000., 5000)
+    Rv = np.linspace(2., 6., 81)
+    law = GriddedLaw(Fitzpatrick99(), lamb, Rv, filename='f99.npy')
+    law.max_error          # maximum absolute error on A(lambda)/A(V)
+    law(lamb, Av=Av, Rv=Rv_values)
+
+.. note::
+
+    The table holds A(lambda) / A(V), the values are scaled by Av and tau is
+    obtained as 0.4 * log(10) * A(lambda).  Laws that are not linear in Av
+    (Calzetti with Alambda=False) are not reproduced with Alambda=False.
+"""
+import os
+import tempfile
+import numpy as np
+
+from .extinction import ExtinctionLaw, MixtureLaw
+from .helpers import broadcast_parameters, leading_shape, output_buffer
+
+__all__ = ['GriddedLaw']
+
+#: number of R(V) nodes spanning the Rv_range of a law when no nodes are given
+DEFAULT_RV_NODES = 41
+
+
+def _axis_weights(axis, values):
+    """ Linear interpolation indices and weights along a sorted axis
+
+    Parameters
+    ----------
+    axis: ndarray
+        sorted node values
+
+    values: ndarray
+        values to interpolate at, clipped to the axis range
+
+    Returns
+    -------
+    i0, i1: ndarray, ndarray
+        indices of the bracketing nodes
+
+    t: ndarray
+        weight of node i1
+    """
+    n = len(axis)
+    i0 = np.clip(np.searchsorted(axis, values, side='right') - 1, 0, max(n - 2, 0))
+    i1 = np.minimum(i0 + 1, n - 1)
+    dx = axis[i1] - axis[i0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.where(dx > 0, (values - axis[i0]) / np.where(dx > 0, dx, 1.), 0.)
+    return i0, i1, np.clip(t, 0., 1.)
+
+
+class GriddedLaw(ExtinctionLaw):
+    """ Law tabulated on a grid and evaluated by linear interpolation
+
+    Attributes
+    ----------
+    law_name: str
+        name of the tabulated law
+
+    lamb: ndarray
+        wavelength nodes in Angstroms (sorted)
+
+    law: ExtinctionLaw
+        tabulated law
+
+    Rv_nodes: ndarray
+        R(V) nodes (sorted), Rv_A nodes for a MixtureLaw
+
+    f_A_nodes: ndarray or None
+        f_A nodes (sorted) of a tabulated MixtureLaw
+
+    table: ndarray or memmap
+        A(lambda) / A(V) of shape (len(Rv_nodes), [len(f_A_nodes),] len(lamb))
+
+    max_error: float
+        maximum absolute error of the interpolation on A(lambda) / A(V)
+        against the analytic law, measured between the nodes
+
+    Rv: float
+        default R(V) (the one of the tabulated law if any)
+    """
+    def __init__(self, law, lamb=None, Rv=None, f_A=None, filename=None,
+                 dtype=float, check_error=True):
+        """ Tabulate a law, or load it from filename if the file exists and
+        matches the requested nodes
+
+        Parameters
+        ----------
+        law: ExtinctionLaw
+            law to tabulate
+
+        lamb: ndarray
+            wavelength nodes [in Angstroms if no units] (not needed to load a
+            file)
+
+        Rv: ndarray
+            R(V) nodes, Rv_A nodes for a MixtureLaw (Rv_B is the default
+            one of its B component), default: :data:`DEFAULT_RV_NODES`
+            nodes over the Rv_range of the law if it has one
+
+        f_A: ndarray
+            f_A nodes of a MixtureLaw (default: (0, 1))
+
+        filename: str
+            path of the .npy table, the nodes are stored next to it in a
+            .axes.npz file
+
+        dtype: dtype
+            floating point type of the table
+
+        check_error: bool
+            set to measure :attr:`max_error` when tabulating
+        """
+        self.name = 'Gridded ' + law.name
+        self.law = law
+        self.law_name = law.name
+        self.Rv = getattr(law, 'Rv', None)
+        self.filename = filename
+
+        if (filename is not None) and os.path.isfile(filename) and self._load(filename, lamb, Rv, f_A):
+            return
+
+        if lamb is None:
+            raise ValueError('lamb nodes are required to tabulate a law')
+        if Rv is None:
+            if law.Rv_range is None:
+                txt = 'Rv nodes are required to tabulate {0:s}, it has no Rv_range'
+                raise ValueError(txt.format(law.name))
+            Rv = np.linspace(law.Rv_range[0], law.Rv_range[1], DEFAULT_RV_NODES)
+        if isinstance(law, MixtureLaw):
+            if getattr(law.B, 'Rv', None) is None:
+                txt = ('Tabulating {0:s} requires a B component with a default Rv '
+                       '(Rv_B), the table spans Rv_A and f_A')
+                raise ValueError(txt.format(law.name))
+            if f_A is None:
+                f_A = (0., 1.)
+
+        self.lamb = np.sort(np.ravel(law._asgrid(lamb).lamb))
+        self.Rv_nodes = np.sort(np.atleast_1d(np.asarray(Rv, dtype=float)))
+        self.f_A_nodes = None if f_A is None else np.sort(np.atleast_1d(np.asarray(f_A, dtype=float)))
+        self.table = self._tabulate(law, dtype, filename)
+        self.max_error = self._measure_error(law) if check_error else np.nan
+        if filename is not None:
+            self._save_axes(filename)
+
+    @property
+    def Rv_range(self):
+        """ R(V) range covered by the table """
+        return (self.Rv_nodes[0], self.Rv_nodes[-1])
+
+    @staticmethod
+    def _axes_filename(filename):
+        """ Name of the file storing the nodes of a table """
+        return os.path.splitext(filename)[0] + '.axes.npz'
+
+    def _load(self, filename, lamb=None, Rv=None, f_A=None):
+        """ Memory-map a table, returns False if its nodes do not match the
+        requested ones """
+        try:
+            axes = np.load(self._axes_filename(filename))
+        except (OSError, IOError):
+            return False
+
+        f_A_nodes = axes['f_A'] if axes['f_A'].size else None
+        requested = (('lamb', lamb, axes['lamb']), ('Rv', Rv, axes['Rv']),
+                     ('f_A', f_A, f_A_nodes))
+        for name, value, stored in requested:
+            if value is None:
+                continue
+            if name == 'lamb':
+                value = self._asgrid(value).lamb
+            if (stored is None) or not np.array_equal(np.sort(np.ravel(value)), stored):
+                return False
+        if str(axes['law']) != self.law_name:
+            return False
+
+        self.lamb = axes['lamb']
+        self.Rv_nodes = axes['Rv']
+        self.f_A_nodes = f_A_nodes
+        self.max_error = float(axes['max_error'])
+        self.table = np.load(filename, mmap_mode='r')
+        return True
+
+    def _save_axes(self, filename):
+        """ Store the nodes of the table next to it """
+        np.savez(self._axes_filename(filename), lamb=self.lamb, Rv=self.Rv_nodes,
+                 f_A=(np.empty(0) if self.f_A_nodes is None else self.f_A_nodes),
+                 law=self.law_name, max_error=self.max_error)
+
+    def _shape(self):
+        """ Shape of the table """
+        if self.f_A_nodes is None:
+            return (len(self.Rv_nodes), len(self.lamb))
+        return (len(self.Rv_nodes), len(self.f_A_nodes), len(self.lamb))
+
+    def _tabulate(self, law, dtype, filename=None):
+        """ Evaluate the law on the nodes, one R(V) at a time, directly into
+        the file if any (written to a temporary file and renamed once
+        complete) """
+        grid = law._asgrid(self.lamb)
+        if filename is None:
+            table = np.empty(self._shape(), dtype=dtype)
+            tmp = None
+        else:
+            folder = os.path.dirname(os.path.abspath(filename))
+            fd, tmp = tempfile.mkstemp(dir=folder, suffix='.npy')
+            os.close(fd)
+            table = np.lib.format.open_memmap(tmp, mode='w+', dtype=dtype,
+                                              shape=self._shape())
+
+        for k, Rv in enumerate(self.Rv_nodes):
+            law.function(grid, Av=1., out=table[k], **self._law_kwargs(Rv, self.f_A_nodes))
+
+        if tmp is None:
+            return table
+        table.flush()
+        del table
+        os.replace(tmp, filename)
+        return np.load(filename, mmap_mode='r')
+
+    def _measure_error(self, law):
+        """ Maximum absolute difference with the law at the wavelength nodes
+        and between them, for parameters between the nodes (at the nodes of
+        axes with a single node) """
+        def midpoints(nodes):
+            return 0.5 * (nodes[1:] + nodes[:-1]) if len(nodes) > 1 else nodes
+
+        lamb = np.sort(np.hstack([self.lamb, midpoints(self.lamb)]))
+        grid = law._asgrid(lamb)
+        err = 0.
+        f_A = None if self.f_A_nodes is None else midpoints(self.f_A_nodes)
+        for Rv in midpoints(self.Rv_nodes):
+            kwargs = self._law_kwargs(Rv, f_A)
+            ref = law.function(grid, Av=1., **kwargs)
+            val = self.function(grid, Av=1., **kwargs)
+            err = max(err, float(np.nanmax(np.abs(val - ref))))
+        return err
+
+    def _law_kwargs(self, Rv, f_A=None):
+        """ Parameters of the tabulated law for a node of the table """
+        if self.f_A_nodes is None:
+            return dict(Rv=Rv)
+        return dict(Rv_A=Rv, f_A=f_A)
+
+    @staticmethod
+    def _lerp(lo, hi, t):
+        """ (1 - t) * lo + t * hi along the rows with a single temporary """
+        r = hi - lo
+        r *= np.asarray(t)[..., None]
+        r += lo
+        return r
+
+    def function(self, lamb, Av=1., Rv=None, Alambda=True, f_A=None,
+                 Rv_A=None, out=None, dtype=None, **kwargs):
+        """
+        Interpolate the tabulated law, wavelengths and parameters outside of
+        the nodes are clipped to the table
+
+        Parameters
+        ----------
+        lamb: float or ndarray(dtype=float) or WavelengthGrid
+            wavelength [in Angstroms] at which evaluate the law.
+
+        Av: float or ndarray(dtype=float)
+            desired A(V) (default 1.0)
+
+        Rv: float or ndarray(dtype=float)
+            desired R(V) (default: the one of the tabulated law)
+
+        Alambda: bool
+            if set returns +2.5*1./log(10.)*tau, tau otherwise
+
+        f_A: float or ndarray(dtype=float)
+            mixture ratio of a tabulated MixtureLaw (default 0.5)
+
+        Rv_A: float or ndarray(dtype=float)
+            R(V) of the A component of a tabulated MixtureLaw, Rv is then the
+            effective R(V) of the mixture (see :func:`MixtureLaw.get_Rv_A`)
+
+        out: ndarray, optional
+            array in which to store the result (shape of the result,
+            C-contiguous)
+
+        dtype: dtype, optional
+            floating point type of the result (default: the one of lamb if
+            floating point, float64 otherwise)
+
+        unit_policy: str, optional
+            handling of wavelengths without units for this call (default:
+            :attr:`unit_policy`)
+
+        Returns
+        -------
+        r: float or ndarray(dtype=float)
+            attenuation as a function of wavelength
+            depending on Alambda option +2.5*1./log(10.)*tau,  or tau
+            array-valued parameters of shape (N,) give a (N,) + lamb.shape
+            result
+        """
+        if self.f_A_nodes is None:
+            f_A = None
+        else:
+            if f_A is None:
+                f_A = 0.5
+            if Rv_A is None:
+                if Rv is None:
+                    raise ValueError('Rv or Rv_A is required')
+                Rv_A = self.law.get_Rv_A(Rv, f_A, undetermined=Rv)
+            Rv = Rv_A
+        if Rv is None:
+            Rv = self.Rv
+        if Rv is None:
+            raise ValueError('Rv is required')
+
+        grid = self._asgrid(lamb, dtype, **kwargs)
+        if dtype is None:
+            dtype = grid.dtype
+        Av, Rv, f_A = broadcast_parameters(grid.shape, Av, Rv, f_A)
+        out, r = output_buffer(out, grid.shape, dtype,
+                               leading_shape(1, Av, Rv, f_A))
+
+        # rows of the table interpolated in R(V) (and f_A)
+        i0, i1, t = _axis_weights(self.Rv_nodes, Rv[..., 0] if Rv.ndim else Rv)
+        if f_A is None:
+            rows = self._lerp(self.table[i0], self.table[i1], t)
+        else:
+            j0, j1, u = _axis_weights(self.f_A_nodes, f_A[..., 0] if f_A.ndim else f_A)
+            rows = self._lerp(self._lerp(self.table[i0, j0], self.table[i0, j1], u),
+                              self._lerp(self.table[i1, j0], self.table[i1, j1], u), t)
+
+        # interpolation in wavelength, unless evaluated at the nodes
+        if (grid.size == len(self.lamb)) and np.array_equal(grid.lamb, self.lamb):
+            r[...] = rows
+        else:
+            k0, k1, w = _axis_weights(self.lamb, grid.lamb)
+            np.add((1. - w) * rows[..., k0], w * rows[..., k1], out=r)
+
+        if (Alambda):
+            r *= Av
+        else:
+            r *= Av * (np.log(10.) * 0.4)
+        return out
+
+    def isvalid(self, Av=None, Rv=None, f_A=None, Rv_A=None, **kwargs):
+        """ Check if the parameters are finite and within the nodes of the
+        table
+
+        Parameters
+        ----------
+        Av: float or ndarray(dtype=float)
+            A(V) values (any finite value is allowed, even <0)
+
+        Rv: float or ndarray(dtype=float)
+            R(V) values, effective R(V) of a tabulated MixtureLaw
+
+        f_A: float or ndarray(dtype=float)
+            mixture ratios of a tabulated MixtureLaw (default 0.5)
+
+        Rv_A: float or ndarray(dtype=float)
+            R(V) of the A component of a tabulated MixtureLaw, replaces Rv
+
+        Returns
+        -------
+        r: bool or ndarray(dtype=bool)
+            True where the values are valid, broadcast shape of the
+            parameters
+        """
+        if self.f_A_nodes is None:
+            return ExtinctionLaw.isvalid(self, Av=Av, Rv=Rv)
+
+        if f_A is None:
+            f_A = 0.5
+        f_A = np.asarray(f_A, dtype=float)
+        if (Rv_A is None) and (Rv is not None):
+            Rv_A = self.law.get_Rv_A(Rv, f_A)
+        valid = ExtinctionLaw.isvalid(self, Av=Av, Rv=Rv_A)
+        with np.errstate(invalid='ignore'):
+            valid = valid & (f_A >= self.f_A_nodes[0]) & (f_A <= self.f_A_nodes[-1])
+        return np.asarray(valid)[()]
@@ -1,8 +1,16 @@
 """
 This is a first collection of tools making the design easier
 """
+import sys
+import atexit
 import warnings
-from .ezunits import unit, hasUnit
+import threading
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+import numpy as np
+from . import ezunits
+from .ezunits import hasUnit
 
 
 def isNestedInstance(obj, cl):
@@ -54,13 +62,73 @@ def type_checker(name, obj, tp):
         raise TypeError(txt.format(name, str(tp.__name__), str(type(obj).__name__)))
 
 
-def warning_on_one_line(message, category, filename, lineno, file=None,
-                        line=None):
-    return " {0:s}:{1:d} {2:s}:{3:s}".format(filename, lineno,
-                                             category.__name__, str(message))
+#: policies for values given without explicit units
+#:   'warn': assume the default unit and warn at every call
+#:   'warn_once': assume the default unit and warn once per variable and unit
+#:   'strict': raise a ValueError
+#:   'assume': silently assume the default unit
+UNIT_POLICIES = ('warn', 'warn_once', 'strict', 'assume')
 
+_unit_config = {'policy': 'warn'}
+_unit_local = threading.local()
+_warned = set()
+_warned_lock = threading.Lock()
 
-def missing_units_warning(name, defaultunit):
+
+def _check_unit_policy(policy):
+    """ Raise a ValueError if policy is not in :data:`UNIT_POLICIES` """
+    if policy not in UNIT_POLICIES:
+        txt = 'Unknown unit policy "{0}", expecting one of {1}'
+        raise ValueError(txt.format(policy, UNIT_POLICIES))
+
+
+def set_unit_policy(policy):
+    """ Set the default handling of values without explicit units
+
+    Parameters
+    ----------
+    policy: str
+        one of :data:`UNIT_POLICIES`
+
+    Raises
+    ------
+    ValueError:
+        if the policy is unknown
+    """
+    _check_unit_policy(policy)
+    _unit_config['policy'] = policy
+
+
+def get_unit_policy():
+    """ Current handling of values without explicit units, the one set by
+    :func:`unit_policy` in this thread if any, the default one otherwise """
+    return getattr(_unit_local, 'policy', None) or _unit_config['policy']
+
+
+@contextmanager
+def unit_policy(policy):
+    """ Context manager changing the unit policy of the current thread
+
+    .. example::
+
+        with unit_policy('assume'):
+            r = law(lamb)
+
+    Parameters
+    ----------
+    policy: str
+        one of :data:`UNIT_POLICIES`
+    """
+    _check_unit_policy(policy)
+    previous = getattr(_unit_local, 'policy', None)
+    _unit_local.policy = policy
+    try:
+        yield
+    finally:
+        _unit_local.policy = previous
+
+
+def missing_units_warning(name, defaultunit, policy=None):
     """ Warn if any unit is missing
 
     Parameters
@@ -71,18 +139,47 @@ def missing_units_warning(name, defaultunit):
     defaultunit: str
         default unit definition
 
+    policy: str
+        one of :data:`UNIT_POLICIES` (default: :func:`get_unit_policy`)
+
     Raises
     ------
     warning: warnings.warn
         warn if units are assumed
+    ValueError:
+        if the policy is 'strict'
     """
-    warnings.formatwarning = warning_on_one_line
-    msg = 'Variable {0:s} does not have explicit units. Assuming `{1:s}`\n'
-    # stacklevel makes the correct code reference
-    warnings.warn(msg.format(name, defaultunit), stacklevel=4)
+    policy = policy or get_unit_policy()
+    if policy == 'assume':
+        return
+    msg = 'Variable {0:s} does not have explicit units. Assuming `{1:s}`'
+    if policy == 'strict':
+        raise ValueError('Variable {0:s} does not have explicit units.'.format(name))
+    if policy == 'warn_once':
+        with _warned_lock:
+            if (name, defaultunit) in _warned:
+                return
+            _warned.add((name, defaultunit))
+    # refer to the code calling the package
+    warnings.warn(msg.format(name, defaultunit), stacklevel=_caller_stacklevel())
+
 
+def _caller_stacklevel():
+    """ stacklevel of a warning issued by the calling function that points
+    to the first frame outside of this package, whatever the call chain """
+    package = __name__.split('.')[0]
+    level = 2
+    frame = sys._getframe(2)
+    while frame is not None:
+        name = frame.f_globals.get('__name__', '')
+        if (name != package) and not name.startswith(package + '.'):
+            break
+        frame = frame.f_back
+        level += 1
+    return level
 
-def val_in_unit(varname, value, defaultunit):
+
+def val_in_unit(varname, value, defaultunit, policy=None):
     """ check units and convert to defaultunit or create the unit information
 
     Parameters
@@ -96,6 +193,10 @@ def val_in_unit(varname, value, defaultunit):
     defaultunit: str
         default units is unitless
 
+    policy: str
+        handling of unitless values, one of :data:`UNIT_POLICIES`
+        (default: :func:`get_unit_policy`)
+
     Returns
     -------
     quantity: ezunits.Quantity
@@ -113,7 +214,378 @@ def val_in_unit(varname, value, defaultunit):
     <Quantity(0.5, 'degree')>
     """
     if not hasUnit(value):
-        missing_units_warning(varname, defaultunit)
-        return value * unit[defaultunit]
+        missing_units_warning(varname, defaultunit, policy)
+        return value * ezunits.unit[defaultunit]
     else:
         return value.to(defaultunit)
+
+
+def magnitude_in_unit(varname, value, defaultunit, policy=None):
+    """ Magnitude of a value in defaultunit, see :func:`val_in_unit`
+
+    Neither value nor its magnitude are ever copied or modified when no
+    conversion is needed: unitless values are returned as they are, without
+    building a Quantity.
+
+    Parameters
+    ----------
+    varname: str
+        name of the variable
+
+    value: value
+        value of the variable, which may be unitless
+
+    defaultunit: str
+        default units is unitless
+
+    policy: str
+        handling of unitless values, one of :data:`UNIT_POLICIES`
+        (default: :func:`get_unit_policy`)
+
+    Returns
+    -------
+    magnitude: value
+        value in defaultunit without units
+    """
+    if not hasUnit(value):
+        missing_units_warning(varname, defaultunit, policy)
+        return value
+    factor = ezunits.unit.get_conversion_factor(value.units, defaultunit)
+    if factor == 1:
+        return value.magnitude
+    return value.magnitude * factor
+
+
+def broadcast_parameters(shape, *params, **kwargs):
+    """ Reshape law parameters to broadcast against a flattened wavelength array
+
+    Scalars are left as 0-d arrays.  Array parameters are considered to index
+    curves: a parameter of shape ``(N,)`` (or already shaped to broadcast
+    against the wavelengths, e.g., ``(N, 1)`` for 1-d wavelengths) gives ``N``
+    curves.  Trailing singleton axes are only taken as wavelength axes when
+    the parameter has more dimensions than the wavelengths, so that ``(1,)``
+    gives one curve.
+
+    Parameters
+    ----------
+    shape: tuple
+        shape of the wavelength input
+
+    params: sequence
+        parameter values (float, ndarray or None)
+
+    flat: bool
+        if set (default) the parameters broadcast against the flattened
+        wavelengths, against an array of the given shape otherwise.
+
+    Returns
+    -------
+    params: list
+        None values are kept, scalars are 0-d arrays and array values are of
+        shape ``lead + (1,)`` (``lead + (1,) * len(shape)`` if not flat) so
+        that they broadcast against the wavelengths.
+
+    Example
+    -------
+    >>> Av, Rv = broadcast_parameters((5,), 1., [2.5, 3.1, 4.])
+    >>> Av.shape, Rv.shape
+    ((), (3, 1))
+    """
+    flat = kwargs.pop('flat', True)
+    ndim = len(shape)
+    trailing = (1,) if flat else (1,) * ndim
+    r = []
+    for p in params:
+        if p is None:
+            r.append(p)
+            continue
+        p = np.asarray(p, dtype=float)
+        if p.ndim == 0:
+            r.append(p)
+            continue
+        if ndim and (p.ndim > ndim) and (p.shape[-ndim:] == (1,) * ndim):
+            lead = p.shape[:-ndim]
+        else:
+            lead = p.shape
+        r.append(p.reshape(lead + trailing))
+    return r
+
+
+def leading_shape(ndim, *params):
+    """ Shape of the parameter (curve) axes of a law result
+
+    Parameters
+    ----------
+    ndim: int
+        number of trailing wavelength axes of the parameters, 1 if they are
+        broadcast against flattened wavelengths
+
+    params: sequence
+        parameters returned by :func:`broadcast_parameters` (None are ignored)
+
+    Returns
+    -------
+    lead: tuple
+        broadcast shape of the parameters without the wavelength axes
+    """
+    s = np.broadcast_shapes(*[np.shape(p) for p in params if p is not None])
+    return s[:max(len(s) - ndim, 0)]
+
+
+def output_buffer(out, shape, dtype, lead=()):
+    """ Output array of a law evaluation and its view against the flattened
+    wavelengths
+
+    Parameters
+    ----------
+    out: ndarray or None
+        caller supplied output array, allocated if None
+
+    shape: tuple
+        shape of the wavelength input
+
+    dtype: dtype
+        data type of the allocated array (ignored if out is provided)
+
+    lead: tuple
+        shape of the parameter axes (see :func:`leading_shape`)
+
+    Returns
+    -------
+    out: ndarray
+        output array of shape lead + shape
+
+    flat: ndarray
+        view of out with shape lead + (M,)
+
+    Raises
+    ------
+    ValueError:
+        if out does not have the expected shape or is not C-contiguous
+    """
+    shape = tuple(lead) + tuple(shape)
+    if out is None:
+        out = np.empty(shape, dtype=dtype)
+    elif out.shape != shape:
+        txt = 'Expected "out" of shape {0}, got {1} instead.'
+        raise ValueError(txt.format(shape, out.shape))
+    elif not out.flags.c_contiguous:
+        raise ValueError('Expected a C-contiguous "out" array.')
+    size = int(np.prod(shape[len(lead):]))
+    return out, out.reshape(tuple(lead) + (size, ))
+
+
+def result_dtype(value):
+    """ Floating point data type preserving the one of value
+
+    Parameters
+    ----------
+    value: ndarray or dtype
+        input data or data type
+
+    Returns
+    -------
+    dtype: dtype
+        dtype of value if floating point, float64 otherwise
+    """
+    if not isinstance(value, (type, str, np.dtype)):
+        # scalar types (e.g., np.float32) have a dtype attribute descriptor
+        value = getattr(value, 'dtype', value)
+    dtype = np.dtype(value)
+    if np.issubdtype(dtype, np.floating):
+        return dtype
+    return np.dtype(float)
+
+
+_thread_pools = {}
+_thread_pools_lock = threading.Lock()
+
+
+def thread_pool(threads):
+    """ Executor running tasks on a given number of threads
+
+    Parameters
+    ----------
+    threads: int or concurrent.futures.Executor
+        number of threads of a pool shared by every call with the same
+        number, or an executor returned as is
+
+    Returns
+    -------
+    executor: concurrent.futures.Executor
+        executor to submit the tasks to
+    """
+    if not isinstance(threads, (int, np.integer)):
+        return threads
+    threads = int(threads)
+    with _thread_pools_lock:
+        if threads not in _thread_pools:
+            from concurrent.futures import ThreadPoolExecutor
+            _thread_pools[threads] = ThreadPoolExecutor(threads, thread_name_prefix='pyextinction')
+        return _thread_pools[threads]
+
+
+@atexit.register
+def shutdown_thread_pools():
+    """ Shut down the pools of :func:`thread_pool` once their tasks are done,
+    called at exit.  Later calls of :func:`thread_pool` create new pools. """
+    with _thread_pools_lock:
+        pools = list(_thread_pools.values())
+        _thread_pools.clear()
+    for pool in pools:
+        pool.shutdown(wait=True)
+
+
+#: every LRUCache instance (see :func:`cache_stats`)
+_caches = weakref.WeakSet()
+
+
+def cache_stats():
+    """ Hits, misses and sizes of the live :class:`LRUCache` instances summed
+    by cache name
+
+    Returns
+    -------
+    stats: dict
+        name -> dict(hits, misses, size, count)
+    """
+    r = {}
+    for cache in list(_caches):
+        s = r.setdefault(cache.name, dict(hits=0, misses=0, size=0, count=0))
+        s['hits'] += cache.hits
+        s['misses'] += cache.misses
+        s['size'] += len(cache)
+        s['count'] += 1
+    return r
+
+
+class LRUCache(object):
+    """ Bounded least-recently-used cache with hit/miss counters
+
+    Attributes
+    ----------
+    maxsize: int
+        maximum number of stored entries (0 disables the cache)
+
+    name: str
+        name under which the counters are reported (see :func:`cache_stats`)
+
+    hits: int
+        number of lookups served from the cache
+
+    misses: int
+        number of lookups that required a computation
+
+    Example
+    -------
+    >>> cache = LRUCache(2)
+    >>> cache.get(3.1, lambda: 3.1 ** 2)
+    9.610000000000001
+    >>> cache.hits, cache.misses
+    (0, 1)
+    """
+    def __init__(self, maxsize=128, name='cache'):
+        self.maxsize = int(maxsize)
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        _caches.add(self)
+
+    def __getstate__(self):
+        # the lock cannot be pickled; the entries are rebuilt on demand
+        state = self.__dict__.copy()
+        del state['_lock']
+        state['_data'] = OrderedDict()
+        state['hits'] = state['misses'] = 0
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        _caches.add(self)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __repr__(self):
+        txt = 'LRUCache(maxsize={0:d}, size={1:d}, hits={2:d}, misses={3:d})'
+        return txt.format(self.maxsize, len(self), self.hits, self.misses)
+
+    def get(self, key, func):
+        """ Return the cached value of key or compute it with func()
+
+        Parameters
+        ----------
+        key: hashable
+            entry key
+
+        func: callable
+            function without arguments that computes the value on a miss
+
+        Returns
+        -------
+        value: object
+            cached or newly computed value
+        """
+        with self._lock:
+            try:
+                value = self._data[key]
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            except KeyError:
+                self.misses += 1
+
+        value = func()
+        if self.maxsize > 0:
+            with self._lock:
+                self._data[key] = value
+                self._data.move_to_end(key)
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+        return value
+
+    def clear(self):
+        """ Remove every entry and reset the counters """
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+def spline_basis(xk, x, k=3):
+    """ Interpolating spline through anchors (xk, yk) as a linear map of yk
+
+    An interpolating spline with fixed anchor positions is linear in the
+    anchor values, so that ``splev(x, splrep(xk, yk)) == yk.dot(S)``
+
+    Parameters
+    ----------
+    xk: ndarray
+        anchor positions
+
+    x: ndarray
+        positions at which evaluate the spline
+
+    k: int
+        degree of the spline (default: 3)
+
+    Returns
+    -------
+    S: ndarray
+        matrix of shape (len(xk), len(x)), the splines through each unit
+        anchor vector.
+    """
+    from scipy import interpolate
+    n = len(xk)
+    S = np.empty((n, np.size(x)))
+    for j in range(n):
+        yk = np.zeros(n)
+        yk[j] = 1.
+        S[j] = interpolate.splev(x, interpolate.splrep(xk, yk, k=k))
+    return S
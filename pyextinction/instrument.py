@@ -0,0 +1,192 @@
+"""
+Instrumentation
+---------------
+
+Counters of the law evaluations, disabled by default.  When enabled, every
+call of a law records the number of calls and of values computed, the time
+spent handling the wavelengths (units conversion, grid) and evaluating the
+law, and the spline fits of the Fitzpatrick99 and Gordon03_SMCBar laws.
+Events can also be sent to callbacks (tracing sinks).
+
+.. example::
+
+    from pyextinction import instrument
+    instrument.enable()
+    law(lamb, Rv=Rv)
+    pyextinction.stats()['laws']['Fitzpatrick99']
+    # {'calls': 1, 'elements': 5000, 'time_units': ..., 'time_law': ...}
+
+    instrument.add_sink(print)      # every event as a dict
+
+When disabled, the cost of the instrumentation is a dictionary lookup per
+call.
+"""
+import sys
+import time
+import threading
+
+from .helpers import cache_stats
+
+__all__ = ['enable', 'disable', 'is_enabled', 'reset', 'stats', 'add_sink',
+           'remove_sink', 'record_call', 'record']
+
+_state = {'enabled': False}
+_lock = threading.Lock()
+_laws = {}
+_counters = {}
+_sinks = []
+
+
+def enable():
+    """ Start recording the law evaluations """
+    _state['enabled'] = True
+
+
+def disable():
+    """ Stop recording the law evaluations (the counters are kept) """
+    _state['enabled'] = False
+
+
+def is_enabled():
+    """ True if the law evaluations are recorded """
+    return _state['enabled']
+
+
+def reset():
+    """ Set every counter to zero, including the cache counters of the unit
+    registry if loaded """
+    with _lock:
+        _laws.clear()
+        _counters.clear()
+    registry = _unit_registry()
+    if registry is not None:
+        registry.cache_info(reset=True)
+
+
+def add_sink(callback):
+    """ Register a function called with every recorded event
+
+    Parameters
+    ----------
+    callback: callable
+        function of one argument, a dict with at least the 'event' key
+        ('call' or 'spline_fit', ...)
+    """
+    with _lock:
+        _sinks.append(callback)
+
+
+def remove_sink(callback):
+    """ Unregister a function added by :func:`add_sink` """
+    with _lock:
+        _sinks.remove(callback)
+
+
+def _emit(event):
+    """ Send an event to the sinks """
+    for sink in list(_sinks):
+        sink(event)
+
+
+def record(name, law=None, **info):
+    """ Count an event (e.g., 'spline_fit') if the instrumentation is enabled
+
+    Parameters
+    ----------
+    name: str
+        event name, counted in stats()['counters']
+
+    law: str, optional
+        name of the law emitting the event
+
+    info: dict
+        details sent to the sinks
+    """
+    if not _state['enabled']:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + 1
+    if _sinks:
+        _emit(dict(info, event=name, law=law))
+
+
+def record_call(law, lamb, threads, args, kwargs):
+    """ Evaluate a law as :func:`ExtinctionLaw.__call__` and record it
+
+    Parameters
+    ----------
+    law: ExtinctionLaw
+        law to evaluate
+
+    lamb: float or ndarray or Quantity or WavelengthGrid
+        wavelengths
+
+    threads: int or Executor or None
+        threads option of the call
+
+    args, kwargs:
+        arguments of :func:`ExtinctionLaw.function`
+
+    Returns
+    -------
+    r: ndarray or numpy.float64
+        value of the law, the same as :func:`ExtinctionLaw.__call__`
+    """
+    t0 = time.perf_counter()
+    if law._scalar_call(lamb, threads, args, kwargs):
+        # same dispatch as ExtinctionLaw.__call__, the scalar path converts
+        # the wavelength as part of the evaluation
+        t1 = t0
+        r = law._evaluate_scalar(lamb, kwargs)
+    else:
+        grid = law._asgrid(lamb, kwargs.get('dtype'), kwargs.get('unit_policy'))
+        t1 = time.perf_counter()
+        r = law._evaluate(grid, threads, *args, **kwargs)
+    t2 = time.perf_counter()
+
+    name = getattr(law, 'name', law.__class__.__name__)
+    size = getattr(r, 'size', 1)
+    with _lock:
+        s = _laws.get(name)
+        if s is None:
+            s = _laws[name] = dict(calls=0, elements=0, time_units=0., time_law=0.)
+        s['calls'] += 1
+        s['elements'] += size
+        s['time_units'] += t1 - t0
+        s['time_law'] += t2 - t1
+    if _sinks:
+        _emit(dict(event='call', law=name, size=size, shape=getattr(r, 'shape', ()),
+                   time_units=t1 - t0, time_law=t2 - t1))
+    return r
+
+
+def _unit_registry():
+    """ Default unit registry if already created (never creates it) """
+    ezunits = sys.modules.get(__package__ + '.ezunits')
+    if ezunits is None:
+        return None
+    return vars(ezunits).get('unit')
+
+
+def stats():
+    """ Snapshot of the counters
+
+    Returns
+    -------
+    stats: dict
+        enabled: True if the instrumentation is enabled
+        laws: law name -> dict(calls, elements, time_units, time_law), times
+              in seconds
+        counters: event name -> count (spline_fit, ...)
+        caches: cache name -> dict(hits, misses, size, count) of the live
+                caches (see :func:`helpers.cache_stats`)
+        units: hits and misses of the unit registry caches (empty if the
+               registry is not loaded)
+    """
+    with _lock:
+        laws = dict((k, dict(v)) for k, v in _laws.items())
+        counters = dict(_counters)
+    registry = _unit_registry()
+    units = registry.cache_info() if registry is not None else {}
+    return dict(enabled=_state['enabled'], laws=laws, counters=counters,
+                caches=cache_stats(), units=units)
@@ -0,0 +1,314 @@
+"""
+Single-pass evaluation kernels
+------------------------------
+
+The NumPy implementation of the laws scans the wavelength array once per
+region and creates many temporary arrays.  The kernels below walk the
+wavenumbers once, branch per element and use Horner evaluation of the
+polynomials.  They are compiled with `numba` when it is installed, the NumPy
+implementation of each law remains the reference and the fallback.
+
+The backend is selected globally with :func:`set_backend` or per law through
+the `backend` attribute of :class:`ExtinctionLaw`.
+
+The per-wavelength functions (`*_point`) called by the kernels are plain
+Python and also implement :func:`ExtinctionLaw.scalar`.  The kernels are
+compiled with their own compiled copies of them, the module functions are
+never replaced.
+
+.. example::
+
+    from pyextinction import kernels
+    kernels.set_backend('numba')
+
+    law = Fitzpatrick99()
+    law.backend = 'numpy'   # this law keeps the NumPy implementation
+
+.. note::
+
+    Kernels only apply to scalar (Av, Rv) calls; array-valued parameters use
+    the vectorized NumPy paths.
+"""
+import types
+from importlib.util import find_spec
+
+__all__ = ['set_backend', 'get_backend', 'HAS_NUMBA', 'BACKENDS']
+
+#: available backends
+BACKENDS = ('numpy', 'numba')
+
+#: True if numba can be imported
+HAS_NUMBA = find_spec('numba') is not None
+
+_config = {'backend': 'numpy'}
+_compiled = {}
+
+#: globals of the compiled functions: numba resolves the globals of a
+#: function at compile time, the kernels find the compiled helpers there while
+#: the module keeps the Python ones (used by the scalar evaluation)
+_jit_globals = {}
+
+#: helper functions called by the kernels, compiled with them
+_dependencies = {'cardelli': ('cardelli_point', ),
+                 'calzetti': ('calzetti_point', ),
+                 'uv_spline': ('_splev3', 'uv_spline_point')}
+
+
+def set_backend(name):
+    """ Select the default evaluation backend of the laws
+
+    Parameters
+    ----------
+    name: str
+        'numpy' or 'numba'
+
+    Raises
+    ------
+    ValueError:
+        if the backend is unknown
+    ImportError:
+        if 'numba' is requested but not installed
+    """
+    if name not in BACKENDS:
+        raise ValueError('Unknown backend "{0:s}", expecting one of {1}'.format(name, BACKENDS))
+    if name == 'numba' and not HAS_NUMBA:
+        raise ImportError('The numba backend requires the numba package')
+    _config['backend'] = name
+
+
+def get_backend():
+    """ Current default evaluation backend """
+    return _config['backend']
+
+
+def use_jit(backend=None):
+    """ Check if compiled kernels are to be used
+
+    Parameters
+    ----------
+    backend: str
+        backend requested by a law, None for the default one
+
+    Returns
+    -------
+    r: bool
+        True if the resolved backend is 'numba' and numba is available
+    """
+    return ((backend or _config['backend']) == 'numba') and HAS_NUMBA
+
+
+def get_kernel(name):
+    """ Return a compiled kernel, compiling it on first use
+
+    Parameters
+    ----------
+    name: str
+        name of the kernel function in this module (e.g., 'cardelli')
+
+    Returns
+    -------
+    kernel: callable
+        numba compiled function if numba is installed, the python function
+        otherwise
+    """
+    try:
+        return _compiled[name]
+    except KeyError:
+        func = globals()[name]
+        if HAS_NUMBA:
+            for dep in _dependencies.get(name, ()):
+                if not hasattr(_jit_globals.get(dep), 'py_func'):
+                    _jit(dep)
+            func = _jit(name)
+        _compiled[name] = func
+        return func
+
+
+def _jit(name):
+    """ Compile a function of this module with numba in the namespace of the
+    compiled functions (see :data:`_jit_globals`) """
+    import numba
+    if not _jit_globals:
+        _jit_globals.update(globals())
+    func = globals()[name]
+    func = types.FunctionType(func.__code__, _jit_globals, func.__name__,
+                              func.__defaults__, func.__closure__)
+    func.__doc__ = globals()[name].__doc__
+    _jit_globals[name] = numba.njit(cache=True, nogil=True)(func)
+    return _jit_globals[name]
+
+
+def _splev3(t, c, x):
+    """ Evaluate a cubic B-spline (t, c, 3) at x with de Boor's algorithm
+
+    Values outside the knot range are extrapolated from the first or last
+    polynomial piece, as :func:`scipy.interpolate.splev` does.
+    """
+    n = len(t)
+    # find i such that t[i] <= x < t[i + 1], 3 <= i <= n - 5
+    lo = 3
+    hi = n - 5
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if t[mid] <= x:
+            lo = mid
+        else:
+            hi = mid - 1
+    i = lo
+    d0 = c[i - 3]
+    d1 = c[i - 2]
+    d2 = c[i - 1]
+    d3 = c[i]
+    a = (x - t[i]) / (t[i + 3] - t[i])
+    d3 = (1. - a) * d2 + a * d3
+    a = (x - t[i - 1]) / (t[i + 2] - t[i - 1])
+    d2 = (1. - a) * d1 + a * d2
+    a = (x - t[i - 2]) / (t[i + 1] - t[i - 2])
+    d1 = (1. - a) * d0 + a * d1
+    a = (x - t[i]) / (t[i + 2] - t[i])
+    d3 = (1. - a) * d2 + a * d3
+    a = (x - t[i - 1]) / (t[i + 1] - t[i - 1])
+    d2 = (1. - a) * d1 + a * d2
+    a = (x - t[i]) / (t[i + 1] - t[i])
+    return (1. - a) * d2 + a * d3
+
+
+def cardelli_point(x, Rv):
+    """ Cardelli, Clayton, and Mathis (1989) A(x)/A(V) = a(x) + b(x) / Rv at
+    a single wavenumber x in um^-1 (0 outside [0.3, 10]) """
+    if (x >= 0.3) and (x < 1.1):
+        # Infrared (Eq 2a,2b)
+        y = x ** 1.61
+        a = 0.574 * y
+        b = -0.527 * y
+    elif (x >= 1.1) and (x < 3.3):
+        # Optical & Near IR (Eq 3a, 3b)
+        y = x - 1.82
+        a = 1. + y * (0.17699 + y * (-0.50447 + y * (-0.02427 + y * (0.72085 + y * (0.01979 + y * (-0.77530 + y * 0.32999))))))
+        b = y * (1.41338 + y * (2.28305 + y * (1.07233 + y * (-5.38434 + y * (-0.62251 + y * (5.30260 + y * -2.09002))))))
+    elif (x >= 3.3) and (x < 8.0):
+        # UV (Eq 4a, 4b)
+        a = 1.752 - 0.316 * x - 0.104 / ((x - 4.67) ** 2 + 0.341)
+        b = -3.090 + 1.825 * x + 1.206 / ((x - 4.62) ** 2 + 0.263)
+        if x >= 5.9:
+            y = x - 5.9
+            a += y * y * (-0.04473 - 0.009779 * y)
+            b += y * y * (0.21300 + 0.120700 * y)
+    elif (x >= 8.0) and (x <= 10.0):
+        # Far UV (Eq 5a, 5b)
+        y = x - 8.
+        a = -1.073 + y * (-0.628 + y * (0.137 - 0.070 * y))
+        b = 13.670 + y * (4.257 + y * (0.420 + 0.374 * y))
+    else:
+        a = 0.
+        b = 0.
+    return a + b / Rv
+
+
+def cardelli(x, Rv, scale, out):
+    """ Cardelli, Clayton, and Mathis (1989) in a single pass
+
+    out = scale * (a(x) + b(x) / Rv)
+
+    Parameters
+    ----------
+    x: ndarray
+        wavenumbers in um^-1 (1-d)
+
+    Rv: float
+        R(V) value
+
+    scale: float
+        Av, multiplied by 0.4 * log(10) for tau
+
+    out: ndarray
+        output array, same size as x
+    """
+    for i in range(len(x)):
+        out[i] = scale * cardelli_point(x[i], Rv)
+
+
+def calzetti_point(lamb, Rv):
+    """ Calzetti et al. (2000) k(lambda) at a single wavelength in Angstroms
+    (0 outside [0.0912, 2.2] microns) """
+    li = 1e-4 * lamb
+    x = 1. / li
+    if (li >= 0.630) and (li <= 2.2):
+        return 2.659 * (-1.857 + 1.040 * x) + Rv
+    elif (li >= 0.0912) and (li < 0.630):
+        return 2.659 * (-2.156 + x * (1.509 + x * (-0.198 + 0.011 * x))) + Rv
+    return 0.
+
+
+def calzetti(lamb, Rv, Alambda, out):
+    """ Calzetti et al. (2000) in a single pass
+
+    Parameters
+    ----------
+    lamb: ndarray
+        wavelengths in Angstroms (1-d)
+
+    Rv: float
+        R(V) value
+
+    Alambda: bool
+        if set returns 0.4 * k, 10 ** (0.4 * k) otherwise
+
+    out: ndarray
+        output array, same size as lamb
+    """
+    for i in range(len(lamb)):
+        k = calzetti_point(lamb[i], Rv)
+        if Alambda:
+            out[i] = 0.4 * k
+        else:
+            out[i] = 10 ** (0.4 * k)
+
+
+def uv_spline_point(x, xcut, c0, c2, c3, c4, x0, gamma, t, c):
+    """ FM-like laws at a single wavenumber x in um^-1 (see
+    :func:`uv_spline`) """
+    if x >= xcut:
+        x2 = x * x
+        v = c0 + c2 * x + c3 * x2 / ((x2 - x0 * x0) ** 2 + gamma * gamma * x2)
+        if x >= 5.9:
+            y = x - 5.9
+            v += c4 * y * y * (0.5392 + 0.05644 * y)
+        return v
+    elif x < xcut:
+        return _splev3(t, c, x)
+    return 0.
+
+
+def uv_spline(x, xcut, c0, c2, c3, c4, x0, gamma, t, c, scale, out):
+    """ FM-like laws in a single pass: parametrized UV portion and cubic
+    spline in the optical/NIR (Fitzpatrick99, Gordon03_SMCBar)
+
+    out = scale * (c0 + c2 * x + c3 * D(x, x0, gamma) + c4 * F(x)) for
+    x >= xcut, scale * splev(x, (t, c, 3)) otherwise.
+
+    Parameters
+    ----------
+    x: ndarray
+        wavenumbers in um^-1 (1-d)
+
+    xcut: float
+        UV cut
+
+    c0, c2, c3, c4: float
+        UV coefficients (c0 includes any constant offset)
+
+    x0, gamma: float
+        Drude profile parameters
+
+    t, c: ndarray, ndarray
+        knots and coefficients of the optical/NIR cubic spline
+
+    scale: float
+        global multiplicative factor
+
+    out: ndarray
+        output array, same size as x
+    """
+    for i in range(len(x)):
+        out[i] = scale * uv_spline_point(x[i], xcut, c0, c2, c3, c4, x0, gamma, t, c)
@@ -0,0 +1,133 @@
+"""
+Reddening of spectral libraries
+-------------------------------
+
+:func:`redden_library` applies an extinction law to spectra read and written
+by chunks of rows, so that libraries larger than memory (memory-mapped
+`.npy` files, HDF5 datasets, ...) are processed with a bounded memory.
+
+.. example::
+
+    redden_library(Fitzpatrick99(), lamb, 'library.npy', Av=Av, Rv=Rv,
+                   out='reddened.npy')
+"""
+import numpy as np
+
+from .extinction import WavelengthGrid
+
+__all__ = ['redden_library']
+
+#: default size in bytes of the chunks of rows processed at once
+CHUNK_BYTES = 64 * 2 ** 20
+
+
+def _open(source, mode='r', shape=None, dtype=None):
+    """ Array from a .npy filename (memory-mapped) or the source itself """
+    if not isinstance(source, str):
+        return source
+    if mode == 'r':
+        return np.load(source, mmap_mode='r')
+    return np.lib.format.open_memmap(source, mode='w+', shape=shape, dtype=dtype)
+
+
+def redden_library(law, lamb, flux, Av=1., out=None, chunksize=None,
+                   chunk_bytes=CHUNK_BYTES, **kwargs):
+    """ Redden spectra by chunks: out = flux * 10 ** (-0.4 * A(lambda))
+
+    Every chunk of rows is read from flux, the law is evaluated once per
+    distinct parameter set of the chunk and the result is written to out.
+    The memory used is a few times the size of a chunk.
+
+    Parameters
+    ----------
+    law: ExtinctionLaw
+        extinction law (any law, including mixtures)
+
+    lamb: ndarray or Quantity or WavelengthGrid
+        wavelengths of the spectra [in Angstroms if no units], shape (M,)
+
+    flux: array_like or str
+        spectra of shape (N, M), any object supporting slicing of rows
+        (ndarray, memmap, HDF5 dataset, ...) or the name of a .npy file
+        (memory-mapped)
+
+    Av: float or ndarray(dtype=float)
+        A(V) of each spectrum, scalar or shape (N,)
+
+    out: array_like or str, optional
+        output of shape (N, M), any object supporting assignment of rows or
+        the name of a .npy file created as a memory-map (default: an array
+        in memory)
+
+    chunksize: int, optional
+        number of rows per chunk (default: set by chunk_bytes)
+
+    chunk_bytes: int
+        approximate size of a chunk of flux in bytes
+
+    kwargs: dict
+        other parameters of the law (Rv, f_A, Rv_A, ...), scalar or shape
+        (N,)
+
+    Returns
+    -------
+    out: array_like
+        reddened spectra (flushed if memory-mapped)
+    """
+    flux = _open(flux)
+    N, M = flux.shape
+    dtype = np.result_type(flux.dtype, np.float32)
+    if out is None:
+        out = np.empty((N, M), dtype=dtype)
+    else:
+        out = _open(out, 'w+', (N, M), dtype)
+    if tuple(out.shape) != (N, M):
+        txt = 'Expected "out" of shape {0}, got {1} instead.'
+        raise ValueError(txt.format((N, M), tuple(out.shape)))
+
+    grid = WavelengthGrid.asgrid(lamb)
+    if grid.size != M:
+        txt = 'Expected {0:d} wavelengths, got {1:d} instead.'
+        raise ValueError(txt.format(M, grid.size))
+
+    # per spectrum parameters, scalars are passed to the law unchanged
+    params = dict((k, v) for k, v in kwargs.items() if v is not None)
+    params['Av'] = Av
+    names = [k for k, v in params.items() if np.ndim(v)]
+    for k in names:
+        params[k] = np.broadcast_to(np.asarray(params[k], dtype=float), (N,))
+    fixed = dict((k, v) for k, v in params.items() if k not in names)
+
+    if chunksize is None:
+        chunksize = max(1, int(chunk_bytes // (M * np.dtype(dtype).itemsize)))
+
+    buf = np.empty((min(chunksize, N), M), dtype=dtype)
+    trans = None
+    scale = -0.4 * np.log(10.)
+    for i0 in range(0, N, chunksize):
+        i1 = min(i0 + chunksize, N)
+        if names or trans is None:
+            if names:
+                values = np.stack([params[k][i0:i1] for k in names], axis=-1)
+                # one law evaluation per distinct parameter set
+                values, inverse = np.unique(values, axis=0, return_inverse=True)
+                current = dict(zip(names, values.T))
+                current.update(fixed)
+            else:
+                inverse = None
+                current = fixed
+            trans = law.function(grid, Alambda=True, dtype=dtype, **current)
+            trans = trans.reshape(-1, M)
+            trans *= scale
+            np.exp(trans, out=trans)
+
+        chunk = buf[:i1 - i0]
+        if (inverse is None) or (len(trans) == 1):
+            np.multiply(flux[i0:i1], trans[0], out=chunk)
+        else:
+            np.multiply(flux[i0:i1], trans[np.ravel(inverse)], out=chunk)
+        out[i0:i1] = chunk
+
+    if hasattr(out, 'flush'):
+        out.flush()
+    return out
@@ -0,0 +1,272 @@
+"""
+Parallel grid evaluation
+------------------------
+
+:class:`GridEvaluator` evaluates a law on the cartesian product of parameter
+axes (Av x Rv x f_A x ... x lambda) with a pool of processes.  The law is
+sent once to every worker, the parameter space is split into contiguous
+shards of a fixed number of points and the workers write their shards
+directly into a shared memory output array.
+
+.. example::
+
+    with GridEvaluator(MixtureLaw(Fitzpatrick99(), Gordon03_SMCBar()),
+                       max_workers=64) as ev:
+        r = ev.evaluate(lamb, Av=Av, Rv=Rv, f_A=f_A)   # (nAv, nRv, nf_A, M)
+        np.save('grid.npy', r)
+
+The arrays returned by :func:`GridEvaluator.evaluate` live in shared memory
+and are only valid until the evaluator is closed; :func:`evaluate_grid`
+returns a copy.
+"""
+import math
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+
+from .extinction import WavelengthGrid
+from .helpers import magnitude_in_unit
+
+__all__ = ['GridEvaluator', 'evaluate_grid', 'shard_ranges']
+
+
+def shard_ranges(size, chunksize):
+    """ Deterministic split of range(size) into contiguous shards
+
+    Parameters
+    ----------
+    size: int
+        number of points
+
+    chunksize: int
+        number of points per shard (the last one may be smaller)
+
+    Returns
+    -------
+    shards: list
+        (start, stop) of each shard
+    """
+    chunksize = max(1, int(chunksize))
+    return [(i0, min(i0 + chunksize, size)) for i0 in range(0, size, chunksize)]
+
+
+# state of a worker process: the law and the wavelength grids (with their
+# shared memory blocks) indexed by block name
+_worker = {}
+
+
+def _init_worker(law):
+    """ Initialize a worker with the law (unpickled once per worker) """
+    _worker.clear()
+    _worker['law'] = law
+    _worker['grids'] = {}
+
+
+def _grid(name, size):
+    """ Wavelength grid of a worker stored in a shared block, built on first
+    use so that the law terms are computed once per worker """
+    grids = _worker['grids']
+    if name not in grids:
+        shm = shared_memory.SharedMemory(name=name)
+        lamb = np.ndarray((size, ), dtype=float, buffer=shm.buf)
+        grids.clear()
+        grids[name] = (shm, WavelengthGrid(lamb, unit_policy='assume'))
+    return grids[name][1]
+
+
+def _evaluate_shard(task):
+    """ Evaluate the law on a shard of the parameter space and write it into
+    the shared output """
+    (out_name, dtype, lamb_name, M, names, axes, i0, i1, kwargs) = task
+    law = _worker['law']
+    grid = _grid(lamb_name, M)
+    shape = tuple(len(a) for a in axes)
+    size = int(np.prod(shape))
+
+    if names:
+        # parameters with an explicit curve axis: one curve per point, even
+        # for a single point
+        index = np.unravel_index(np.arange(i0, i1), shape)
+        params = dict((k, np.asarray(a)[i].reshape(-1, 1))
+                      for k, a, i in zip(names, axes, index))
+    else:
+        params = {}
+    params.update(kwargs)
+
+    shm = shared_memory.SharedMemory(name=out_name)
+    try:
+        out = np.ndarray((size, M), dtype=dtype, buffer=shm.buf)
+        target = out[i0:i1] if names else out[0]
+        law.function(grid, out=target, dtype=dtype, **params)
+        del out, target
+    finally:
+        shm.close()
+    return i1 - i0
+
+
+class GridEvaluator(object):
+    """ Evaluate a law on parameter grids with a pool of processes
+
+    Attributes
+    ----------
+    law: ExtinctionLaw
+        law to evaluate (any subclass, including MixtureLaw)
+
+    max_workers: int
+        number of worker processes
+
+    chunksize: int or None
+        number of parameter points per task (default: about 4 tasks per
+        worker)
+    """
+    def __init__(self, law, max_workers=None, chunksize=None, mp_context=None):
+        """ Constructor
+
+        Parameters
+        ----------
+        law: ExtinctionLaw
+            law to evaluate, pickled once per worker
+
+        max_workers: int
+            number of worker processes (default: number of processors)
+
+        chunksize: int
+            number of parameter points per task (default: about 4 tasks per
+            worker)
+
+        mp_context: multiprocessing context, optional
+            context used to start the workers
+        """
+        self.law = law
+        self.chunksize = chunksize
+        self._executor = ProcessPoolExecutor(max_workers=max_workers,
+                                             mp_context=mp_context,
+                                             initializer=_init_worker,
+                                             initargs=(law, ))
+        self.max_workers = self._executor._max_workers
+        self._blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _shared(self, shape, dtype):
+        """ New shared memory block and its array view """
+        size = max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        self._blocks.append(shm)
+        return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+    def evaluate(self, lamb, Alambda=True, dtype=float, chunksize=None,
+                 **params):
+        """ Evaluate the law on the cartesian product of the parameter axes
+
+        Parameters
+        ----------
+        lamb: ndarray or Quantity
+            wavelengths [in Angstroms if no units], flattened
+
+        Alambda: bool
+            if set returns +2.5*1./log(10.)*tau, tau otherwise
+
+        dtype: dtype
+            floating point type of the result
+
+        chunksize: int
+            number of parameter points per task (default:
+            :attr:`chunksize`)
+
+        params: dict
+            parameter axes of the law (Av, Rv, f_A, ...): 1-d arrays span an
+            axis of the grid in the given order, scalars are passed unchanged
+
+        Returns
+        -------
+        r: ndarray
+            result of shape (len(axis_1), ..., len(axis_n), M) in shared
+            memory, (M,) without parameter axes, valid until :func:`close`
+        """
+        _lamb = np.ravel(magnitude_in_unit('lamb', lamb, 'angstrom')).astype(float)
+        M = len(_lamb)
+        names = [k for k, v in params.items() if np.ndim(v)]
+        axes = [np.ravel(np.asarray(params[k], dtype=float)) for k in names]
+        kwargs = dict((k, v) for k, v in params.items() if k not in names)
+        kwargs['Alambda'] = Alambda
+        shape = tuple(len(a) for a in axes)
+        size = int(np.prod(shape))
+
+        lamb_shm, lamb_buf = self._shared((M, ), float)
+        lamb_buf[:] = _lamb
+        out_shm, out = self._shared(shape + (M, ), dtype)
+
+        chunksize = chunksize or self.chunksize
+        if chunksize is None:
+            chunksize = math.ceil(size / (4. * self.max_workers))
+        tasks = [(out_shm.name, np.dtype(dtype), lamb_shm.name, M, names,
+                  axes, i0, i1, kwargs) for i0, i1 in shard_ranges(size, chunksize)]
+        try:
+            for _ in self._executor.map(_evaluate_shard, tasks):
+                pass
+        finally:
+            del lamb_buf
+            self._free(lamb_shm)
+        return out
+
+    def _free(self, shm):
+        """ Release a shared memory block of the evaluator """
+        self._blocks.remove(shm)
+        try:
+            shm.close()
+        except BufferError:
+            # arrays still reference the block, its memory is freed with them
+            pass
+        shm.unlink()
+
+    def close(self):
+        """ Stop the workers and free the shared memory (the arrays returned
+        by :func:`evaluate` become invalid) """
+        self._executor.shutdown(wait=True)
+        for shm in list(self._blocks):
+            self._free(shm)
+
+
+def evaluate_grid(law, lamb, max_workers=None, chunksize=None, out=None,
+                  **params):
+    """ Evaluate a law on the cartesian product of parameter axes with a pool
+    of processes (see :class:`GridEvaluator`)
+
+    Parameters
+    ----------
+    law: ExtinctionLaw
+        law to evaluate
+
+    lamb: ndarray or Quantity
+        wavelengths [in Angstroms if no units], flattened
+
+    max_workers: int
+        number of worker processes (default: number of processors)
+
+    chunksize: int
+        number of parameter points per task
+
+    out: ndarray, optional
+        array (or memmap) in which to copy the result
+
+    params: dict
+        parameter axes and options of :func:`GridEvaluator.evaluate`
+
+    Returns
+    -------
+    r: ndarray
+        result of shape (len(axis_1), ..., len(axis_n), M), (M,) without
+        parameter axes
+    """
+    with GridEvaluator(law, max_workers=max_workers, chunksize=chunksize) as ev:
+        r = ev.evaluate(lamb, **params)
+        if out is None:
+            out = np.empty_like(r)
+        out[...] = r
+        del r
+    return out
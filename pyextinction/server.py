@@ -0,0 +1,433 @@
+"""
+Batching evaluation server
+--------------------------
+
+:class:`EvaluationServer` serves law evaluations over a Unix socket or a
+local TCP port.  Concurrent requests for the same law, wavelength grid and
+parameter names are collected during a short time window and evaluated as
+a single broadcast call of :func:`ExtinctionLaw.function`, so that many
+single-star requests share the per-call overhead.
+
+.. example::
+
+    # server process
+    server = EvaluationServer({'F99': Fitzpatrick99()}, max_delay=0.002)
+    asyncio.run(server.serve(path='/tmp/pyextinction.sock'))
+
+    # client
+    async with EvaluationClient(path='/tmp/pyextinction.sock') as client:
+        r = await client.evaluate('F99', lamb, Av=0.3, Rv=3.1)
+
+Messages are frames made of two big-endian uint32 (header and data sizes),
+a JSON header and raw float64 data (wavelengths, parameters or results).
+"""
+import asyncio
+import hashlib
+import json
+import struct
+import numpy as np
+
+from .extinction import WavelengthGrid
+from .helpers import LRUCache
+
+__all__ = ['EvaluationServer', 'EvaluationClient']
+
+_FRAME = struct.Struct('!II')
+
+
+async def _read_frame(reader):
+    """ Read a frame, returns (header, data) or None at the end of stream """
+    try:
+        prefix = await reader.readexactly(_FRAME.size)
+    except asyncio.IncompleteReadError:
+        return None
+    nheader, ndata = _FRAME.unpack(prefix)
+    header = json.loads((await reader.readexactly(nheader)).decode())
+    data = await reader.readexactly(ndata) if ndata else b''
+    return header, data
+
+
+class _UnknownGrid(KeyError):
+    """ The grid of a request is not (or no longer) registered on the server """
+
+
+def _frame(header, data=b''):
+    """ Encode a frame """
+    header = json.dumps(header).encode()
+    return _FRAME.pack(len(header), len(data)) + header + data
+
+
+class _Batch(object):
+    """ Requests waiting to be evaluated together """
+    def __init__(self, grid):
+        self.grid = grid
+        self.requests = []
+        self.size = 0
+        self.timer = None
+
+
+class EvaluationServer(object):
+    """ Evaluate laws for many clients, coalescing concurrent requests
+
+    Attributes
+    ----------
+    laws: dict
+        laws served, indexed by the names used by the clients
+
+    max_batch: int
+        number of curves above which a batch is evaluated without waiting
+
+    max_delay: float
+        maximum time in seconds a request waits for other ones
+
+    max_pending: int
+        maximum number of requests received and not yet answered, clients
+        are not read beyond it (back-pressure)
+
+    grids: LRUCache
+        wavelength grids registered by the clients, indexed by digest
+
+    nrequests: int
+        number of evaluated requests
+
+    nbatches: int
+        number of law evaluations
+    """
+    def __init__(self, laws, max_batch=1024, max_delay=0.001,
+                 max_pending=4096, max_grids=64):
+        """ Constructor
+
+        Parameters
+        ----------
+        laws: dict
+            laws to serve indexed by name
+
+        max_batch: int
+            number of curves above which a batch is evaluated without
+            waiting
+
+        max_delay: float
+            maximum time in seconds a request waits for other ones
+
+        max_pending: int
+            maximum number of requests being processed
+
+        max_grids: int
+            number of registered wavelength grids kept in memory
+        """
+        self.laws = dict(laws)
+        self.max_batch = int(max_batch)
+        self.max_delay = float(max_delay)
+        self.max_pending = int(max_pending)
+        self.grids = LRUCache(max_grids, name='server_grids')
+        self.nrequests = 0
+        self.nbatches = 0
+        self._batches = {}
+        self._pending = None
+        self._server = None
+
+    async def start(self, path=None, host='127.0.0.1', port=0):
+        """ Start listening on a Unix socket (path) or a local TCP port
+
+        Parameters
+        ----------
+        path: str
+            Unix socket path, TCP is used if None
+
+        host: str
+            TCP address (default: localhost)
+
+        port: int
+            TCP port (default: any free port, see :attr:`address`)
+        """
+        self._pending = asyncio.Semaphore(self.max_pending)
+        if path is not None:
+            self._server = await asyncio.start_unix_server(self._handle, path=path)
+        else:
+            self._server = await asyncio.start_server(self._handle, host=host, port=port)
+        return self
+
+    @property
+    def address(self):
+        """ Socket path or (host, port) the server listens on """
+        return self._server.sockets[0].getsockname()
+
+    async def serve(self, path=None, host='127.0.0.1', port=0):
+        """ Start the server and serve until cancelled (see :func:`start`) """
+        await self.start(path=path, host=host, port=port)
+        async with self._server:
+            await self._server.serve_forever()
+
+    def close(self):
+        """ Stop listening """
+        if self._server is not None:
+            self._server.close()
+
+    async def wait_closed(self):
+        """ Wait until the server is closed """
+        if self._server is not None:
+            await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        """ Serve a client connection """
+        lock = asyncio.Lock()
+
+        async def reply(header, data=b''):
+            async with lock:
+                writer.write(_frame(header, data))
+                await writer.drain()
+
+        tasks = set()
+        try:
+            while True:
+                # back-pressure: stop reading when too many requests wait
+                await self._pending.acquire()
+                frame = await _read_frame(reader)
+                if frame is None:
+                    self._pending.release()
+                    break
+                task = asyncio.ensure_future(self._process(frame, reply))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                task.add_done_callback(lambda t: self._pending.release())
+            if tasks:
+                await asyncio.wait(tasks)
+        finally:
+            writer.close()
+
+    async def _process(self, frame, reply):
+        """ Answer a request """
+        header, data = frame
+        rid = header.get('id')
+        try:
+            if header.get('op') == 'grid':
+                lamb = np.frombuffer(data, dtype=float)
+                key = hashlib.sha1(data).hexdigest()
+                self.grids.get(key, lambda: WavelengthGrid(lamb.copy(), unit_policy='assume'))
+                await reply({'id': rid, 'grid': key})
+            else:
+                r = await self._submit(header, data)
+                await reply({'id': rid, 'shape': r.shape}, r.astype(float).tobytes())
+        except Exception as e:
+            await reply({'id': rid, 'error': '{0}: {1}'.format(type(e).__name__, e),
+                         'unknown_grid': isinstance(e, _UnknownGrid)})
+
+    def _submit(self, header, data):
+        """ Add an evaluation request to its batch, returns a future of the
+        result """
+        law = header['law']
+        if law not in self.laws:
+            raise ValueError('Unknown law "{0}"'.format(law))
+        if header['grid'] not in self.grids:
+            raise _UnknownGrid('Unknown grid "{0}"'.format(header['grid']))
+        grid = self.grids.get(header['grid'], None)
+        names = tuple(header['names'])
+        n = int(header.get('n', 1))
+        values = np.frombuffer(data, dtype=float).reshape(len(names), n)
+        key = (law, header['grid'], bool(header.get('Alambda', True)), names)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        batch = self._batches.get(key)
+        if batch is None:
+            batch = self._batches[key] = _Batch(grid)
+            batch.timer = loop.call_later(self.max_delay, self._flush, key)
+        batch.requests.append((values, header.get('scalar', False), future))
+        batch.size += n
+        if batch.size >= self.max_batch:
+            self._flush(key)
+        return future
+
+    def _flush(self, key):
+        """ Evaluate a batch in a thread and dispatch the results """
+        batch = self._batches.pop(key, None)
+        if batch is None:
+            return
+        batch.timer.cancel()
+        asyncio.ensure_future(self._evaluate(key, batch))
+
+    async def _evaluate(self, key, batch):
+        """ Evaluate the requests of a batch in one law call """
+        law, _, Alambda, names = key
+        grid = batch.grid
+        values = np.hstack([v for v, _, _ in batch.requests])
+        params = dict(zip(names, values))
+
+        def evaluate():
+            r = self.laws[law].function(grid, Alambda=Alambda, **params)
+            return np.broadcast_to(r, (values.shape[1], grid.size))
+
+        loop = asyncio.get_running_loop()
+        try:
+            r = await loop.run_in_executor(None, evaluate)
+        except Exception as e:
+            for _, _, future in batch.requests:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.nbatches += 1
+        self.nrequests += len(batch.requests)
+        i0 = 0
+        for v, scalar, future in batch.requests:
+            i1 = i0 + v.shape[1]
+            if not future.done():
+                future.set_result(r[i0] if scalar else r[i0:i1])
+            i0 = i1
+
+
+class EvaluationClient(object):
+    """ Client of an :class:`EvaluationServer`
+
+    Requests of concurrent tasks are multiplexed on a single connection.
+    """
+    def __init__(self, path=None, host='127.0.0.1', port=None):
+        """ Constructor
+
+        Parameters
+        ----------
+        path: str
+            Unix socket path of the server, TCP is used if None
+
+        host: str
+            TCP address of the server
+
+        port: int
+            TCP port of the server
+        """
+        self.path = path
+        self.host = host
+        self.port = port
+        self._reader = None
+        self._writer = None
+        self._futures = {}
+        self._grids = {}
+        self._next_id = 0
+        self._listener = None
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def connect(self):
+        """ Open the connection """
+        if self.path is not None:
+            self._reader, self._writer = await asyncio.open_unix_connection(self.path)
+        else:
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        self._listener = asyncio.ensure_future(self._listen())
+
+    async def close(self):
+        """ Close the connection """
+        if self._writer is not None:
+            self._writer.close()
+        if self._listener is not None:
+            await asyncio.wait([self._listener])
+
+    async def _listen(self):
+        """ Dispatch the replies to the waiting requests """
+        while True:
+            frame = await _read_frame(self._reader)
+            if frame is None:
+                break
+            header, data = frame
+            future = self._futures.pop(header.get('id'), None)
+            if (future is None) or future.done():
+                continue
+            if header.get('unknown_grid'):
+                future.set_exception(_UnknownGrid(header['error']))
+            elif 'error' in header:
+                future.set_exception(ValueError(header['error']))
+            elif 'grid' in header:
+                future.set_result(header['grid'])
+            else:
+                future.set_result(np.frombuffer(data, dtype=float).reshape(header['shape']))
+        for future in self._futures.values():
+            if not future.done():
+                future.set_exception(ConnectionError('connection closed'))
+        self._futures.clear()
+
+    async def _request(self, header, data=b''):
+        """ Send a request and wait for its reply
+
+        Raises
+        ------
+        ConnectionError:
+            if the connection is not open or was closed by the server
+        """
+        if (self._listener is None) or self._listener.done():
+            raise ConnectionError('connection closed')
+        rid = self._next_id
+        self._next_id += 1
+        header['id'] = rid
+        future = asyncio.get_running_loop().create_future()
+        self._futures[rid] = future
+        self._writer.write(_frame(header, data))
+        await self._writer.drain()
+        return await future
+
+    async def register(self, lamb, refresh=False):
+        """ Send a wavelength grid to the server (once per grid)
+
+        Parameters
+        ----------
+        lamb: ndarray
+            wavelengths in Angstroms
+
+        refresh: bool
+            send the grid even if it was already registered (e.g., after
+            the server evicted it)
+
+        Returns
+        -------
+        key: str
+            digest of the grid on the server
+        """
+        data = np.ascontiguousarray(np.ravel(lamb), dtype=float).tobytes()
+        key = hashlib.sha1(data).hexdigest()
+        if refresh or (key not in self._grids):
+            self._grids[key] = await self._request({'op': 'grid'}, data)
+        return self._grids[key]
+
+    async def evaluate(self, law, lamb, Alambda=True, **params):
+        """ Evaluate a law on the server
+
+        Parameters
+        ----------
+        law: str
+            name of the law on the server
+
+        lamb: ndarray
+            wavelengths in Angstroms (registered on first use)
+
+        Alambda: bool
+            if set returns +2.5*1./log(10.)*tau, tau otherwise
+
+        params: dict
+            parameters of the law (Av, Rv, f_A, ...), scalars or 1-d arrays
+            of the same length
+
+        Returns
+        -------
+        r: ndarray
+            law values of shape (len(lamb),) for scalar parameters, (n,
+            len(lamb)) otherwise
+
+        Grids evicted by the server (see :attr:`EvaluationServer.grids`)
+        are registered again.
+        """
+        names = sorted(params)
+        values = [np.atleast_1d(np.asarray(params[k], dtype=float)) for k in names]
+        scalar = all(np.ndim(params[k]) == 0 for k in names)
+        n = max([len(v) for v in values] + [1])
+        values = np.array([np.broadcast_to(v, (n, )) for v in values], dtype=float)
+        header = {'law': law, 'names': names, 'n': n, 'scalar': scalar,
+                  'Alambda': bool(Alambda)}
+        try:
+            header['grid'] = await self.register(lamb)
+            return await self._request(header, values.tobytes())
+        except _UnknownGrid:
+            header['grid'] = await self.register(lamb, refresh=True)
+            return await self._request(header, values.tobytes())
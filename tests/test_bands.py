@@ -0,0 +1,69 @@
+""" Band-integrated extinction against direct integration """
+import numpy as np
+import pytest
+
+from pyextinction import BandExtinction, Cardelli, Fitzpatrick99, unit_policy
+
+LAM = np.linspace(1500., 12000., 800)
+
+# np.trapz before numpy 2.0
+trapezoid = getattr(np, 'trapezoid', None) or np.trapz
+
+
+@pytest.fixture(autouse=True)
+def plain_wavelengths():
+    with unit_policy('assume'):
+        yield
+
+
+def _filters():
+    """ a transmission sampled at LAM and one given on its own wavelengths """
+    T = np.exp(-0.5 * ((LAM - 4500.) / 400.) ** 2)
+    T[T < 1e-4] = 0.
+    lamb_f = np.linspace(7000., 9000., 50)
+    return [(LAM, T), (lamb_f, np.sin(np.pi * (lamb_f - 7000.) / 2000.))]
+
+
+def _seds():
+    return np.array([(LAM / 5000.) ** -2, np.exp(-LAM / 6000.)])
+
+
+def _integrate(law, filters, seds, photon, Av, Rv):
+    """ -2.5 log10(int F T 10^(-0.4 A) w / int F T w), w = lambda or 1 """
+    w = LAM if photon else np.ones_like(LAM)
+    T = np.array([np.interp(LAM, lf, tf, left=0., right=0.) for lf, tf in filters])
+    r = np.empty((len(Av), len(seds), len(T)))
+    for i, (a, rv) in enumerate(zip(Av, Rv)):
+        ext = 10 ** (-0.4 * law.function(LAM, Av=a, Rv=rv))
+        for s, F in enumerate(seds):
+            for b, t in enumerate(T):
+                r[i, s, b] = -2.5 * np.log10(trapezoid(F * t * ext * w, LAM) /
+                                             trapezoid(F * t * w, LAM))
+    return r
+
+
+@pytest.mark.parametrize('photon', [True, False])
+def test_direct_integration(photon):
+    law = Fitzpatrick99()
+    filters, seds = _filters(), _seds()
+    Av = np.array([0.1, 1., 3.])
+    Rv = np.array([2.5, 3.1, 4.5])
+    engine = BandExtinction(law, LAM, filters, seds, photon=photon)
+    assert (engine.nseds, engine.nfilters) == (2, 2)
+    ref = _integrate(law, filters, seds, photon, Av, Rv)
+
+    np.testing.assert_allclose(engine(Av, Rv=Rv), ref, rtol=1e-10)
+    sed = np.array([1, 0, 1])
+    np.testing.assert_allclose(engine(Av, Rv=Rv, sed=sed),
+                               ref[np.arange(3), sed], rtol=1e-10)
+    np.testing.assert_allclose(engine(Av[0], Rv=Rv[0], sed=0), ref[0, 0], rtol=1e-10)
+
+
+def test_tensors_shared_by_laws():
+    filters, seds = _filters(), _seds()
+    a = BandExtinction(Fitzpatrick99(), LAM, filters, seds)
+    b = BandExtinction(Cardelli(), LAM, filters, seds)
+    assert (a.grid is b.grid) and (a.weights is b.weights)
+    assert BandExtinction(Cardelli(), LAM, filters, seds, photon=False).weights is not a.weights
+    ref = _integrate(b.law, filters, seds, True, [1.], [3.1])
+    np.testing.assert_allclose(b(1., Rv=3.1), ref[0], rtol=1e-10)
@@ -0,0 +1,53 @@
+""" Linear basis decomposition of the laws """
+import numpy as np
+import pytest
+
+from pyextinction import (Calzetti, Cardelli, Fitzpatrick99, Gordon03_SMCBar,
+                          MixtureLaw, unit_policy)
+
+LAM = np.linspace(1000., 30000., 300)
+
+CASES = [
+    (Cardelli, dict(Av=1.3, Rv=3.1)),
+    (Calzetti, dict(Av=1.3, Rv=4.05)),
+    (Fitzpatrick99, dict(Av=1.3, Rv=3.1)),
+    (Gordon03_SMCBar, dict(Av=1.3)),
+    (Gordon03_SMCBar, dict(Av=1.3, Rv=3.3)),
+    (lambda: MixtureLaw(Fitzpatrick99(), Gordon03_SMCBar()),
+     dict(Av=1.3, Rv=3.1, f_A=0.4)),
+    (lambda: MixtureLaw(Fitzpatrick99(), Gordon03_SMCBar()),
+     dict(Av=1.3, Rv_A=3.3, Rv_B=2.8, f_A=0.4)),
+    (lambda: MixtureLaw(Fitzpatrick99(), Cardelli()),
+     dict(Av=1.3, Rv=3.1, Rv_B=2.8, f_A=0.4)),
+]
+
+
+@pytest.fixture(autouse=True)
+def plain_wavelengths():
+    with unit_policy('assume'):
+        yield
+
+
+@pytest.mark.parametrize('make, params', CASES)
+def test_coefficients_times_basis(make, params):
+    law = make()
+    B = law.basis(LAM)
+    assert B.shape[1:] == LAM.shape
+
+    # scalar parameters
+    C = law.basis_coefficients(**params)
+    assert C.shape == (len(B), )
+    ref = law.function(LAM, **params)
+    scale = np.abs(ref).max()
+    np.testing.assert_allclose(np.dot(C, B), ref, rtol=1e-10, atol=1e-12 * scale)
+
+    # arrays of parameters, 2-d wavelengths
+    n = 4
+    arrays = dict((k, v * np.linspace(0.9, 1.1, n)) for k, v in params.items())
+    C = law.basis_coefficients(**arrays)
+    assert C.shape == (n, len(B))
+    ref = law.function(LAM, **arrays)
+    np.testing.assert_allclose(np.dot(C, B), ref, rtol=1e-10, atol=1e-12 * scale)
+    B2 = law.basis(LAM.reshape(10, 30))
+    np.testing.assert_allclose(np.tensordot(C, B2, 1), ref.reshape(n, 10, 30),
+                               rtol=1e-10, atol=1e-12 * scale)
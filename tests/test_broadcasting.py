@@ -0,0 +1,59 @@
+""" Curve axes of the law parameters (see helpers.broadcast_parameters) """
+import numpy as np
+import pytest
+
+from pyextinction import (Cardelli, Calzetti, Fitzpatrick99, Gordon03_SMCBar,
+                          MixtureLaw)
+from pyextinction.helpers import broadcast_parameters
+
+LAM = np.linspace(1200., 25000., 40)
+
+LAWS = [Cardelli(), Calzetti(), Fitzpatrick99(), Gordon03_SMCBar()]
+
+
+def _loop(law, Rv, **kwargs):
+    """ Reference: one scalar call per Rv value """
+    return np.array([law.function(LAM, Rv=float(r), unit_policy='assume', **kwargs)
+                     for r in np.ravel(Rv)])
+
+
+@pytest.mark.parametrize('shape, lead', [((5, ), (5, )), ((5, 1), (5, )),
+                                         ((1, ), (1, )), ((1, 1), (1, )),
+                                         ((2, 3), (2, 3))])
+def test_broadcast_parameters(shape, lead):
+    Av, Rv = broadcast_parameters(LAM.shape, 1., np.ones(shape))
+    assert Av.shape == ()
+    assert Rv.shape == lead + (1, )
+
+
+@pytest.mark.parametrize('law', LAWS, ids=lambda law: law.name)
+@pytest.mark.parametrize('shape', [(), (1, ), (4, ), (4, 1)])
+def test_law_shapes(law, shape):
+    Rv = np.linspace(2.6, 4.1, int(np.prod(shape))).reshape(shape)
+    r = law.function(LAM, Av=0.8, Rv=Rv, unit_policy='assume')
+    lead = shape[:1]
+    assert r.shape == lead + LAM.shape
+    np.testing.assert_allclose(r.reshape(-1, len(LAM)), _loop(law, Rv, Av=0.8),
+                               rtol=1e-12, atol=1e-14)
+
+
+@pytest.mark.parametrize('shape', [(), (1, ), (4, ), (4, 1)])
+def test_mixture_shapes(shape):
+    law = MixtureLaw(Fitzpatrick99(), Gordon03_SMCBar())
+    n = int(np.prod(shape))
+    f_A = np.linspace(0.2, 0.9, n).reshape(shape)
+    r = law.function(LAM, Av=0.8, Rv=3.1, f_A=f_A, unit_policy='assume')
+    assert r.shape == shape[:1] + LAM.shape
+    ref = np.array([law.function(LAM, Av=0.8, Rv=3.1, f_A=float(f), unit_policy='assume')
+                    for f in np.ravel(f_A)])
+    np.testing.assert_allclose(r.reshape(-1, len(LAM)), ref, rtol=1e-12, atol=1e-14)
+
+
+def test_mixture_repeated_parameters():
+    """ A single distinct (Av, Rv) pair of a component still gives a curve
+    per parameter value """
+    law = MixtureLaw(Fitzpatrick99(), Gordon03_SMCBar())
+    f_A = np.array([0.3, 0.3, 0.6])
+    r = law.function(LAM, Av=0.8, Rv_A=3.1, f_A=f_A, unit_policy='assume')
+    assert r.shape == (3, ) + LAM.shape
+    np.testing.assert_allclose(r[0], r[1])
@@ -0,0 +1,65 @@
+""" Analytic parameter derivatives against finite differences """
+import numpy as np
+import pytest
+
+from pyextinction import (Calzetti, Cardelli, Fitzpatrick99, Gordon03_SMCBar,
+                          MixtureLaw)
+
+LAM = np.linspace(1200., 25000., 60)
+
+CASES = [
+    (Cardelli, dict(Av=1.3, Rv=3.1)),
+    (Cardelli, dict(Av=np.array([0.5, 2.]), Rv=np.array([2.5, 4.]))),
+    (Calzetti, dict(Av=1.3, Rv=4.05)),
+    (Fitzpatrick99, dict(Av=1.3, Rv=3.1)),
+    (Fitzpatrick99, dict(Av=np.array([0.5, 2.]), Rv=np.array([2.5, 4.]))),
+    (Gordon03_SMCBar, dict(Av=1.3, Rv=2.9)),
+    # derived Rv_A, B at its default R(V)
+    (lambda: MixtureLaw(Fitzpatrick99(), Gordon03_SMCBar()),
+     dict(Av=1.3, Rv=3.1, f_A=0.4)),
+    (lambda: MixtureLaw(Fitzpatrick99(), Gordon03_SMCBar()),
+     dict(Av=1.3, Rv=np.array([2.9, 3.5]), f_A=np.array([0.3, 0.8]))),
+    # derived Rv_B, A at its default R(V)
+    (lambda: MixtureLaw(Gordon03_SMCBar(), Fitzpatrick99()),
+     dict(Av=1.3, Rv=3.1, f_A=0.4)),
+    # both component R(V) given
+    (lambda: MixtureLaw(Fitzpatrick99(), Gordon03_SMCBar()),
+     dict(Av=1.3, Rv_A=3.3, Rv_B=2.8, f_A=0.4)),
+    # one component R(V) fixed, the other derived from Rv
+    (lambda: MixtureLaw(Fitzpatrick99(), Cardelli()),
+     dict(Av=1.3, Rv=3.1, Rv_A=3.6, f_A=0.4)),
+    (lambda: MixtureLaw(Fitzpatrick99(), Cardelli()),
+     dict(Av=1.3, Rv=3.1, Rv_B=2.8, f_A=0.4)),
+]
+
+
+def _default_Rv(law, name):
+    """ Value of a parameter reported by the gradient but not given """
+    component = {'Rv_A': 'A', 'Rv_B': 'B'}[name]
+    return getattr(law, component).Rv
+
+
+@pytest.mark.parametrize('Alambda', [True, False])
+@pytest.mark.parametrize('make, params', CASES)
+def test_finite_differences(make, params, Alambda):
+    law = make()
+    r, grads = law.value_and_grad(LAM, Alambda=Alambda, unit_policy='assume', **params)
+    ref = law.function(LAM, Alambda=Alambda, unit_policy='assume', **params)
+    np.testing.assert_allclose(r, ref, rtol=1e-10, atol=1e-12)
+    expected = {'Av', 'Rv'} if not isinstance(law, MixtureLaw) else {'Av', 'f_A'}
+    assert expected <= set(grads)
+
+    scale = np.max(np.abs(ref))
+    for name, g in grads.items():
+        assert g.shape == r.shape
+        value = params[name] if name in params else _default_Rv(law, name)
+        h = 1e-6 * np.maximum(1., np.abs(value))
+        fd = []
+        for sign in (1., -1.):
+            kw = dict(params)
+            kw[name] = value + sign * h
+            fd.append(law.function(LAM, Alambda=Alambda, unit_policy='assume', **kw))
+        h = np.asarray(h)
+        fd = (fd[0] - fd[1]) / (2. * h.reshape(h.shape + (1, ) * (np.ndim(g) - h.ndim)))
+        np.testing.assert_allclose(g, fd, rtol=1e-5, atol=1e-6 * scale,
+                                   err_msg='d/d{0:s}'.format(name))
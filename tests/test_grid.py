@@ -0,0 +1,66 @@
+""" Reused wavelength grids against plain arrays """
+import numpy as np
+import pytest
+
+from pyextinction import (Calzetti, Cardelli, Fitzpatrick99, Gordon03_SMCBar,
+                          MixtureLaw, WavelengthGrid, unit, unit_policy)
+
+LAM = np.linspace(1000., 30000., 300)
+
+LAWS = [Cardelli, Calzetti, Fitzpatrick99, Gordon03_SMCBar,
+        lambda: MixtureLaw(Fitzpatrick99(), Gordon03_SMCBar())]
+
+CALLS = [dict(Av=1.3, Rv=3.1),
+         dict(Av=0.2, Rv=2.5, Alambda=False),
+         dict(Av=np.array([0.5, 1., 2.]), Rv=np.array([2.5, 3.1, 4.])),
+         dict(Rv=4.5)]
+
+
+@pytest.fixture(autouse=True)
+def plain_wavelengths():
+    with unit_policy('assume'):
+        yield
+
+
+def _calls(law):
+    if isinstance(law, MixtureLaw):
+        return [dict(c, f_A=0.3) for c in CALLS]
+    return CALLS
+
+
+@pytest.mark.parametrize('make', LAWS)
+@pytest.mark.parametrize('lamb', [LAM, LAM.reshape(10, 30), LAM.astype(np.float32)],
+                         ids=['1d', '2d', 'float32'])
+def test_reused_grid(make, lamb):
+    law = make()
+    grid = WavelengthGrid(lamb)
+    assert grid.shape == lamb.shape
+    # the same grid for every call, in both orders
+    for calls in (_calls(law), _calls(law)[::-1]):
+        for kwargs in calls:
+            ref = law.function(lamb, **kwargs)
+            r = law.function(grid, **kwargs)
+            assert r.dtype == ref.dtype
+            np.testing.assert_array_equal(r, ref)
+            np.testing.assert_array_equal(law(grid, **kwargs), ref)
+    np.testing.assert_array_equal(law.domain(grid), law.domain(lamb))
+
+
+def test_grid_shared_by_laws():
+    grid = WavelengthGrid(LAM)
+    laws = [Fitzpatrick99(), Cardelli(), MixtureLaw(Fitzpatrick99(), Cardelli()),
+            Fitzpatrick99()]
+    for law in laws + laws[::-1]:
+        kwargs = dict(f_A=0.4, Rv_B=3.1) if isinstance(law, MixtureLaw) else {}
+        np.testing.assert_array_equal(law(grid, Rv=3.3, **kwargs),
+                                      law(LAM, Rv=3.3, **kwargs))
+
+
+def test_grid_with_units():
+    law = Fitzpatrick99()
+    grid = WavelengthGrid(LAM * unit['angstrom'])
+    np.testing.assert_array_equal(grid.lamb, LAM)
+    np.testing.assert_array_equal(law(grid), law(LAM))
+    grid = WavelengthGrid((LAM * 1e-4) * unit['micron'])
+    np.testing.assert_allclose(law(grid), law(LAM), rtol=1e-12)
+    assert WavelengthGrid.asgrid(grid) is grid
@@ -0,0 +1,27 @@
+""" Tabulated laws """
+import numpy as np
+import pytest
+
+from pyextinction import (Cardelli, Fitzpatrick99, Gordon03_SMCBar,
+                          GriddedLaw, MixtureLaw)
+
+LAM = np.linspace(1200., 25000., 200)
+
+
+def test_mixture_default_Rv_nodes():
+    law = MixtureLaw(Fitzpatrick99(), Gordon03_SMCBar())
+    law.unit_policy = 'assume'
+    g = GriddedLaw(law, LAM)
+    g.unit_policy = 'assume'
+    assert g.Rv_range == law.Rv_range
+    r = g(LAM, Rv=3.1, f_A=0.6)
+    np.testing.assert_allclose(r, law(LAM, Rv=3.1, f_A=0.6), atol=10 * g.max_error)
+    with pytest.raises(ValueError, match='Rv'):
+        g(LAM, f_A=0.6)
+
+
+def test_missing_Rv_nodes():
+    with pytest.raises(ValueError, match='Rv nodes'):
+        GriddedLaw(Cardelli(), LAM)
+    with pytest.raises(ValueError, match='default Rv'):
+        GriddedLaw(MixtureLaw(Fitzpatrick99(), Cardelli()), LAM)
@@ -0,0 +1,81 @@
+""" Caller wavelength arrays are neither copied nor modified """
+import numpy as np
+import pytest
+
+from pyextinction import (Calzetti, Cardelli, Fitzpatrick99, Gordon03_SMCBar,
+                          MixtureLaw, WavelengthGrid, unit, unit_policy)
+
+LAM = np.linspace(1000., 30000., 300)
+
+LAWS = [Cardelli, Calzetti, Fitzpatrick99, Gordon03_SMCBar,
+        lambda: MixtureLaw(Fitzpatrick99(), Gordon03_SMCBar())]
+
+
+@pytest.fixture(autouse=True)
+def plain_wavelengths():
+    with unit_policy('assume'):
+        yield
+
+
+def _evaluate(law, lamb):
+    kwargs = dict(Rv=3.1, f_A=0.3) if isinstance(law, MixtureLaw) else {}
+    return [law(lamb, **kwargs), law(lamb, threads=2, **kwargs),
+            law.function(lamb, Alambda=False, **kwargs), law.domain(lamb),
+            law.basis(lamb)]
+
+
+@pytest.mark.parametrize('make', LAWS)
+def test_read_only_input(make):
+    law = make()
+    lamb = LAM.copy()
+    lamb.flags.writeable = False
+    grid = WavelengthGrid(lamb)
+    assert np.shares_memory(grid.lamb, lamb)
+    refs = _evaluate(law, LAM.copy())
+    for r, ref in zip(_evaluate(law, lamb), refs):
+        np.testing.assert_array_equal(r, ref)
+    np.testing.assert_array_equal(lamb, LAM)
+
+
+@pytest.mark.parametrize('make', LAWS)
+def test_memmap_input(make, tmp_path):
+    law = make()
+    path = str(tmp_path / 'lamb.dat')
+    mm = np.memmap(path, dtype=float, mode='w+', shape=LAM.shape)
+    mm[:] = LAM
+    mm.flush()
+    lamb = np.memmap(path, dtype=float, mode='r', shape=LAM.shape)
+    grid = WavelengthGrid(lamb)
+    assert np.shares_memory(grid.lamb, lamb)
+    assert not grid.lamb.flags.writeable
+    for r, ref in zip(_evaluate(law, lamb), _evaluate(law, LAM)):
+        np.testing.assert_array_equal(r, ref)
+    np.testing.assert_array_equal(np.memmap(path, dtype=float, mode='r',
+                                            shape=LAM.shape), LAM)
+
+
+def test_writable_input_is_not_modified():
+    lamb = LAM.reshape(10, 30).copy()
+    grid = WavelengthGrid(lamb)
+    assert np.shares_memory(grid.lamb, lamb)
+    assert not grid.lamb.flags.writeable
+    # the caller array stays writable
+    assert lamb.flags.writeable
+    for law in LAWS:
+        _evaluate(law(), lamb)
+    np.testing.assert_array_equal(lamb, LAM.reshape(10, 30))
+
+
+def test_quantity_input():
+    law = Fitzpatrick99()
+    lamb = LAM.copy()
+    q = lamb * unit['angstrom']
+    # no conversion needed: the magnitude is used as is
+    assert np.shares_memory(WavelengthGrid(q).lamb, q.magnitude)
+    micron = lamb * 1e-4
+    q = unit.Quantity(micron, 'micron')
+    np.testing.assert_allclose(law(q), law(LAM), rtol=1e-12)
+    np.testing.assert_allclose(q.to('angstrom').magnitude, LAM, rtol=1e-12)
+    q.ito('angstrom')
+    np.testing.assert_allclose(q.magnitude, LAM, rtol=1e-12)
+    np.testing.assert_array_equal(micron, LAM * 1e-4)
@@ -0,0 +1,32 @@
+""" Instrumentation does not change the results of the laws """
+import numpy as np
+import pytest
+
+from pyextinction import Cardelli, Fitzpatrick99, instrument, unit_policy
+
+
+@pytest.fixture
+def enabled():
+    instrument.reset()
+    instrument.enable()
+    try:
+        with unit_policy('assume'):
+            yield
+    finally:
+        instrument.disable()
+        instrument.reset()
+
+
+@pytest.mark.parametrize('lamb', [5500., np.array(5500.), np.array([5500., 6000.])],
+                         ids=['float', '0-d', 'array'])
+def test_same_results(enabled, lamb):
+    for law in (Cardelli(), Fitzpatrick99()):
+        instrument.disable()
+        ref = law(lamb, Rv=3.1)
+        instrument.enable()
+        r = law(lamb, Rv=3.1)
+        assert type(r) is type(ref)
+        np.testing.assert_array_equal(r, ref)
+    laws = instrument.stats()['laws']
+    assert laws['Cardelli']['calls'] == laws['Fitzpatrick99']['calls'] == 1
+    assert laws['Cardelli']['elements'] == np.size(lamb)
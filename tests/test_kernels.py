@@ -0,0 +1,57 @@
+""" Compiled single-pass kernels against the NumPy reference implementation """
+import numpy as np
+import pytest
+
+from pyextinction import (Cardelli, Calzetti, Fitzpatrick99, Gordon03_SMCBar,
+                          MixtureLaw)
+
+pytest.importorskip('numba')
+
+# regular wavenumbers and the region boundaries of the laws
+EDGES = np.array([912., 1e4 / 10., 1e4 / 8., 1e4 / 5.9, 1e4 / 3.3, 2600.,
+                  2700., 6300., 1e4 / 1.1, 22000., 1e4 / 0.3])
+LAM = np.sort(np.concatenate([1e4 / np.linspace(0.2, 11., 2001), EDGES]))
+
+LAWS = [Cardelli, Calzetti, Fitzpatrick99, Gordon03_SMCBar,
+        lambda: MixtureLaw(Fitzpatrick99(), Gordon03_SMCBar())]
+
+
+def _with_backend(law, backend):
+    law.backend = backend
+    for component in (getattr(law, 'A', None), getattr(law, 'B', None)):
+        if component is not None:
+            component.backend = backend
+    return law
+
+
+@pytest.mark.parametrize('make', LAWS, ids=['Cardelli', 'Calzetti', 'F99',
+                                            'Gordon', 'mixture'])
+@pytest.mark.parametrize('Alambda', [True, False])
+@pytest.mark.parametrize('dtype, rtol', [(np.float64, 1e-13), (np.float32, 1e-5)])
+def test_kernel_equivalence(make, Alambda, dtype, rtol):
+    law = make()
+    kwargs = dict(Av=1.3, Rv=3.4, Alambda=Alambda, dtype=dtype,
+                  unit_policy='assume')
+    ref = _with_backend(law, 'numpy').function(LAM, **kwargs)
+    r = _with_backend(law, 'numba').function(LAM, **kwargs)
+    assert r.dtype == ref.dtype == dtype
+    scale = np.abs(ref).max()
+    np.testing.assert_allclose(r, ref, rtol=rtol, atol=rtol * scale)
+
+    edges = np.isin(LAM, EDGES)
+    np.testing.assert_allclose(r[edges], ref[edges], rtol=rtol, atol=rtol * scale)
+
+
+def test_python_helpers_are_kept():
+    from pyextinction import kernels
+    helpers = ('cardelli_point', 'calzetti_point', 'uv_spline_point', '_splev3')
+    before = dict((name, getattr(kernels, name)) for name in helpers)
+    laws = [Cardelli(), Calzetti(), Fitzpatrick99(), Gordon03_SMCBar()]
+    scalars = [law(5500., Rv=3.4, unit_policy='assume') for law in laws]
+    for law in laws:
+        _with_backend(law, 'numba').function(LAM, Rv=3.4, unit_policy='assume')
+    for name in helpers:
+        assert getattr(kernels, name) is before[name]
+        assert not hasattr(getattr(kernels, name), 'py_func')
+        assert hasattr(kernels._jit_globals[name], 'py_func')
+    assert [law(5500., Rv=3.4, unit_policy='assume') for law in laws] == scalars
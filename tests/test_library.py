@@ -0,0 +1,89 @@
+""" Chunked reddening of spectral libraries """
+import numpy as np
+import pytest
+
+from pyextinction import (Fitzpatrick99, Gordon03_SMCBar, MixtureLaw,
+                          redden_library, unit_policy)
+
+LAM = np.linspace(1200., 25000., 64)
+N = 11
+
+
+@pytest.fixture(autouse=True)
+def plain_wavelengths():
+    with unit_policy('assume'):
+        yield
+
+
+def _library():
+    rng = np.random.RandomState(3)
+    flux = rng.uniform(0.5, 2., (N, len(LAM)))
+    # repeated parameter sets, within and across chunks
+    Av = np.array([0.5, 1., 0.5, 2., 1., 0.5, 0.5, 3., 1., 2., 0.5])
+    Rv = np.array([3.1, 2.5, 3.1, 4., 2.5, 3.1, 4., 3.1, 2.5, 4., 3.1])
+    return flux, Av, Rv
+
+
+def _reference(law, flux, **params):
+    """ row by row flux * 10 ** (-0.4 * A(lambda)) """
+    r = np.empty_like(flux)
+    for i in range(len(flux)):
+        kw = dict((k, v[i] if np.ndim(v) else v) for k, v in params.items())
+        r[i] = flux[i] * 10 ** (-0.4 * law.function(LAM, **kw))
+    return r
+
+
+@pytest.mark.parametrize('chunksize', [None, 1, 3, 4, N])
+def test_per_row_parameters(chunksize):
+    law = Fitzpatrick99()
+    flux, Av, Rv = _library()
+    r = redden_library(law, LAM, flux, Av=Av, Rv=Rv, chunksize=chunksize)
+    np.testing.assert_allclose(r, _reference(law, flux, Av=Av, Rv=Rv), rtol=1e-12)
+
+
+def test_fixed_and_mixed_parameters():
+    law = MixtureLaw(Fitzpatrick99(), Gordon03_SMCBar())
+    flux, Av, Rv = _library()
+    # scalar parameters only: the law is evaluated once
+    r = redden_library(law, LAM, flux, Av=1.2, Rv=3.1, f_A=0.4, chunksize=3)
+    np.testing.assert_allclose(r, _reference(law, flux, Av=1.2, Rv=3.1, f_A=0.4),
+                               rtol=1e-12)
+    # a single distinct parameter set per chunk
+    Av = np.repeat([0.5, 2.], [6, 5])
+    r = redden_library(law, LAM, flux, Av=Av, Rv=3.1, f_A=0.4, chunksize=3)
+    np.testing.assert_allclose(r, _reference(law, flux, Av=Av, Rv=3.1, f_A=0.4),
+                               rtol=1e-12)
+
+
+def test_out_buffers(tmp_path):
+    law = Fitzpatrick99()
+    flux, Av, Rv = _library()
+    ref = _reference(law, flux, Av=Av, Rv=Rv)
+
+    out = np.zeros_like(flux)
+    r = redden_library(law, LAM, flux, Av=Av, Rv=Rv, out=out, chunksize=4)
+    assert r is out
+    np.testing.assert_allclose(out, ref, rtol=1e-12)
+
+    mm = np.memmap(str(tmp_path / 'out.dat'), dtype=float, mode='w+', shape=flux.shape)
+    r = redden_library(law, LAM, flux, Av=Av, Rv=Rv, out=mm, chunksize=4)
+    assert r is mm
+    np.testing.assert_allclose(np.memmap(str(tmp_path / 'out.dat'), dtype=float,
+                                         mode='r', shape=flux.shape), ref, rtol=1e-12)
+
+    # .npy file names for the input and the output
+    np.save(str(tmp_path / 'flux.npy'), flux)
+    redden_library(law, LAM, str(tmp_path / 'flux.npy'), Av=Av, Rv=Rv,
+                   out=str(tmp_path / 'red.npy'), chunksize=4)
+    np.testing.assert_allclose(np.load(str(tmp_path / 'red.npy')), ref, rtol=1e-12)
+
+    with pytest.raises(ValueError, match='shape'):
+        redden_library(law, LAM, flux, out=np.empty((N - 1, len(LAM))))
+
+
+def test_float32_library():
+    law = Fitzpatrick99()
+    flux, Av, Rv = _library()
+    r = redden_library(law, LAM, flux.astype(np.float32), Av=Av, Rv=Rv, chunksize=5)
+    assert r.dtype == np.float32
+    np.testing.assert_allclose(r, _reference(law, flux, Av=Av, Rv=Rv), rtol=1e-5)
@@ -0,0 +1,25 @@
+""" MixtureLaw R(V) relations """
+import numpy as np
+
+from pyextinction import Fitzpatrick99, Gordon03_SMCBar, MixtureLaw
+
+LAM = np.linspace(1200., 25000., 40)
+
+
+def test_undetermined_component_Rv():
+    law = MixtureLaw(Fitzpatrick99(), Gordon03_SMCBar())
+    assert np.isnan(law.get_Rv_A(3.1, 0.))
+    np.testing.assert_array_equal(law.isvalid(Rv=3.1, f_A=[0., 0.5]), [False, True])
+
+    law = MixtureLaw(Fitzpatrick99(), Fitzpatrick99())
+    assert np.isnan(law.get_Rv_B(3.1, 3.1, 1.))
+    assert not law.isvalid(Rv=3.1, Rv_A=3.1, f_A=1.)
+    # both component values given: nothing is derived
+    assert law.isvalid(Rv_A=3.1, Rv_B=3.1, f_A=1.)
+
+
+def test_weighted_out_component_stays_finite():
+    law = MixtureLaw(Fitzpatrick99(), Gordon03_SMCBar())
+    r = law.function(LAM, Rv=3.1, f_A=np.array([0., 0.5]), unit_policy='assume')
+    assert np.all(np.isfinite(r))
+    np.testing.assert_allclose(r[0], law.B.function(LAM, unit_policy='assume'))
@@ -0,0 +1,73 @@
+""" MultiMixtureLaw against its components """
+import numpy as np
+import pytest
+
+from pyextinction import (Cardelli, Fitzpatrick99, Gordon03_SMCBar, MixtureLaw,
+                          MultiMixtureLaw, unit_policy)
+
+LAM = np.linspace(1200., 25000., 40)
+
+
+@pytest.fixture(autouse=True)
+def plain_wavelengths():
+    with unit_policy('assume'):
+        yield
+
+
+def test_two_components_equal_mixture():
+    law = MultiMixtureLaw(Fitzpatrick99(), Gordon03_SMCBar())
+    mix = MixtureLaw(Fitzpatrick99(), Gordon03_SMCBar())
+    f_A = np.array([0., 0.3, 1.])
+    weights = np.stack([f_A, 1. - f_A], axis=-1)
+    r = law(LAM, weights=weights, Av=1.5, Rv=[3.6, None])
+    ref = mix.function(LAM, Av=1.5, Rv_A=3.6, Rv_B=mix.B.Rv, f_A=f_A[:, None])
+    np.testing.assert_allclose(r, ref, rtol=1e-12)
+    # mixtures given as components are flattened
+    assert len(MultiMixtureLaw(mix)) == 2
+
+
+@pytest.mark.parametrize('Rv', [
+    # same component curves for every model: single matrix product
+    [3.1, None, 2.5],
+    # model dependent component curves: weighted sum per model
+    np.array([[3.1, 2.74, 2.5], [4.0, 2.9, 3.3]])])
+def test_three_components_weighted_sum(Rv):
+    components = (Fitzpatrick99(), Gordon03_SMCBar(), Cardelli())
+    law = MultiMixtureLaw(Fitzpatrick99() + Gordon03_SMCBar() + Cardelli())
+    assert len(law) == 3
+    weights = np.array([[0.2, 0.3, 0.5], [0.5, 0.5, 0.]])
+    Av = 1.2
+    r = law(LAM, weights=weights, Av=Av, Rv=Rv)
+    assert r.shape == (2, len(LAM))
+
+    values = np.broadcast_to(np.array([np.nan if v is None else v for v in Rv]
+                                      if isinstance(Rv, list) else Rv), weights.shape)
+    ref = np.zeros_like(r)
+    for m in range(len(weights)):
+        for k, c in enumerate(components):
+            kw = {} if np.isnan(values[m, k]) else {'Rv': values[m, k]}
+            ref[m] += weights[m, k] * c.function(LAM, Av=Av, **kw)
+    np.testing.assert_allclose(r, ref, rtol=1e-12)
+
+    # basis decomposition of the same models
+    B = law.basis(LAM)
+    np.testing.assert_allclose(np.dot(law.basis_coefficients(weights=weights, Av=Av, Rv=Rv), B),
+                               ref, rtol=1e-10, atol=1e-12)
+
+
+def test_default_weights():
+    law = MultiMixtureLaw(Fitzpatrick99(), Cardelli())
+    ref = 0.5 * (Fitzpatrick99().function(LAM) + Cardelli().function(LAM))
+    np.testing.assert_allclose(law(LAM), ref, rtol=1e-12)
+
+
+def test_unnormalized_weights():
+    law = MultiMixtureLaw(Fitzpatrick99(), Gordon03_SMCBar(), Cardelli())
+    weights = np.array([[0.2, 0.3, 0.5], [0.5, 0.5, 0.5]])
+    with pytest.raises(ValueError, match='summing to 1'):
+        law(LAM, weights=weights)
+    with pytest.raises(ValueError, match='summing to 1'):
+        law.basis_coefficients(weights=weights)
+    np.testing.assert_array_equal(law.isvalid(weights=weights), [True, False])
+    with pytest.raises(ValueError, match='shape'):
+        law(LAM, weights=[0.5, 0.5])
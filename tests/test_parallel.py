@@ -0,0 +1,71 @@
+""" Sharded grid evaluation against serial law calls """
+import multiprocessing
+
+import numpy as np
+import pytest
+
+from pyextinction import (Fitzpatrick99, Gordon03_SMCBar, MixtureLaw,
+                          GridEvaluator, evaluate_grid, unit_policy)
+from pyextinction.parallel import shard_ranges
+
+LAM = np.linspace(1200., 25000., 200)
+
+
+@pytest.fixture(autouse=True)
+def plain_wavelengths():
+    with unit_policy('assume'):
+        yield
+
+
+def test_shard_ranges():
+    assert shard_ranges(9, 4) == [(0, 4), (4, 8), (8, 9)]
+    assert shard_ranges(3, 1) == [(0, 1), (1, 2), (2, 3)]
+
+
+@pytest.mark.parametrize('chunksize', [None, 1, 4, 100])
+def test_uneven_shards(chunksize):
+    law = Fitzpatrick99()
+    Av = np.array([0.5, 1., 2.])
+    Rv = np.array([2.5, 3.1, 4.])
+    r = evaluate_grid(law, LAM, max_workers=2, chunksize=chunksize, Av=Av, Rv=Rv)
+    ref = law.function(LAM, Av=Av[:, None, None], Rv=Rv[None, :, None],
+                       unit_policy='assume')
+    assert r.shape == (3, 3, len(LAM))
+    np.testing.assert_allclose(r, ref, rtol=1e-12)
+
+
+def test_mixture_axes():
+    law = MixtureLaw(Fitzpatrick99(), Gordon03_SMCBar())
+    Rv = np.linspace(2.5, 4., 3)
+    f_A = np.linspace(0.2, 1., 3)
+    r = evaluate_grid(law, LAM, max_workers=2, chunksize=2, Rv=Rv, f_A=f_A)
+    ref = np.array([[law.function(LAM, Rv=a, f_A=b, unit_policy='assume')
+                     for b in f_A] for a in Rv])
+    np.testing.assert_allclose(r, ref, rtol=1e-12)
+
+
+@pytest.mark.parametrize('Rv, shape', [(np.linspace(2., 5., 5), (5, )),
+                                       (np.array([3.1]), (1, )),
+                                       (3.1, ())])
+def test_axis_sizes(Rv, shape):
+    law = Fitzpatrick99()
+    r = evaluate_grid(law, LAM, max_workers=2, Rv=Rv)
+    assert r.shape == shape + LAM.shape
+    ref = law.function(LAM, Rv=Rv, unit_policy='assume')
+    np.testing.assert_allclose(r, ref, rtol=1e-12)
+
+
+@pytest.mark.parametrize('method', ['spawn', 'forkserver'])
+@pytest.mark.parametrize('make', [Fitzpatrick99,
+                                  lambda: MixtureLaw(Fitzpatrick99(), Gordon03_SMCBar())])
+def test_start_methods(method, make):
+    if method not in multiprocessing.get_all_start_methods():
+        pytest.skip('{0:s} start method not available'.format(method))
+    law = make()
+    kwargs = {'f_A': 0.5} if isinstance(law, MixtureLaw) else {}
+    Rv = np.array([2.5, 3.1, 4.])
+    with GridEvaluator(law, max_workers=2, chunksize=2,
+                       mp_context=multiprocessing.get_context(method)) as ev:
+        r = ev.evaluate(LAM, Rv=Rv, **kwargs)
+        ref = law.function(LAM, Rv=Rv[:, None], unit_policy='assume', **kwargs)
+        np.testing.assert_allclose(r, ref, rtol=1e-12)
@@ -0,0 +1,38 @@
+""" Pickling of the laws and of their caches """
+import pickle
+
+import numpy as np
+import pytest
+
+from pyextinction import (Calzetti, Cardelli, Fitzpatrick99, Gordon03_SMCBar,
+                          MixtureLaw, MultiMixtureLaw)
+from pyextinction.helpers import LRUCache, cache_stats
+
+LAM = np.linspace(1200., 25000., 50)
+
+LAWS = [Cardelli, Calzetti, Fitzpatrick99, Gordon03_SMCBar,
+        lambda: MixtureLaw(Fitzpatrick99(), Gordon03_SMCBar()),
+        lambda: MultiMixtureLaw(Fitzpatrick99(), Gordon03_SMCBar(), Cardelli())]
+
+
+@pytest.mark.parametrize('make', LAWS)
+def test_law_round_trip(make):
+    law = make()
+    kwargs = {'Rv': 3.1} if isinstance(law, MixtureLaw) else {}
+    # fill the caches before pickling
+    ref = law.function(LAM, unit_policy='assume', **kwargs)
+    other = pickle.loads(pickle.dumps(law))
+    assert type(other) is type(law)
+    assert other.name == law.name
+    np.testing.assert_array_equal(other.function(LAM, unit_policy='assume', **kwargs), ref)
+
+
+def test_cache_round_trip():
+    cache = LRUCache(4, name='test_pickle')
+    cache.get(1, lambda: 'a')
+    other = pickle.loads(pickle.dumps(cache))
+    assert (other.maxsize, other.name) == (4, 'test_pickle')
+    assert (len(other), other.hits, other.misses) == (0, 0, 0)
+    assert other.get(1, lambda: 'b') == 'b'
+    assert other.get(1, lambda: 'c') == 'b'
+    assert cache_stats()['test_pickle']['count'] == 2
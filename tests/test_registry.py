@@ -0,0 +1,125 @@
+""" Unit registry snapshots and caches """
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import pytest
+
+from pyextinction.ezunits import pint
+from pyextinction.ezunits.pint import AliasDict, UnitRegistry
+
+DEFINITIONS = os.path.join(os.path.dirname(pint.__file__), 'default_en.txt')
+
+
+def _registry(cache_folder, cache_size=256):
+    """ Registry with its own definitions and caches (they are class
+    attributes shared by the registries) """
+    class Registry(UnitRegistry):
+        _UNITS = AliasDict()
+        _PREFIXES = AliasDict({'': 1})
+        _SUFFIXES = AliasDict({'': None, 's': ''})
+        _PARSE_CACHE = OrderedDict()
+        _FACTOR_CACHE = OrderedDict()
+        _CACHE_STATS = dict(parse_hits=0, parse_misses=0, factor_hits=0, factor_misses=0)
+        parse_cache_size = cache_size
+        factor_cache_size = cache_size
+    return Registry(cache_folder=cache_folder)
+
+
+def _state(registry):
+    units = {}
+    for name, value in registry._UNITS.items():
+        if isinstance(value, str):
+            units[name] = value
+        else:
+            units[name] = (value._magnitude, dict(value._units))
+    return (units, registry._UNITS.preferred_alias, dict(registry._PREFIXES),
+            registry._PREFIXES.preferred_alias)
+
+
+def _snapshot(folder):
+    files = [f for f in os.listdir(folder) if f.endswith('.json')]
+    assert len(files) == 1
+    return os.path.join(folder, files[0])
+
+
+def _check(registry):
+    assert registry.get_conversion_factor('micron', 'angstrom') == pytest.approx(1e4)
+    assert registry['3 * km / hour'].to('m / s').magnitude == pytest.approx(3e3 / 3600.)
+
+
+def test_snapshot_round_trip(tmp_path):
+    parsed = _registry(None)
+    saved = _registry(str(tmp_path))
+    path = _snapshot(str(tmp_path))
+    loaded = _registry(str(tmp_path))
+    assert _state(saved) == _state(parsed)
+    assert _state(loaded) == _state(parsed)
+    assert loaded._snapshot_path(DEFINITIONS, str(tmp_path)) == path
+    _check(loaded)
+
+
+@pytest.mark.parametrize('corrupt', [
+    lambda state: 'not json {',
+    lambda state: json.dumps(dict(state, version=0)),
+    lambda state: json.dumps(dict((k, v) for k, v in state.items() if k != 'unit_aliases')),
+    lambda state: json.dumps(dict((k, v) for k, v in state.items() if k != 'units')),
+    lambda state: json.dumps(dict(state, units=dict(state['units'], meter=[1.]))),
+    lambda state: json.dumps(dict(state, units=dict(state['units'], meter=None))),
+    lambda state: json.dumps(dict(state, units=list(state['units']))),
+    lambda state: json.dumps(dict(state, prefixes=dict(state['prefixes'], kilo=[]))),
+    lambda state: json.dumps([]),
+], ids=['json', 'version', 'unit_aliases', 'units', 'entry', 'none', 'list',
+        'prefix', 'array'])
+def test_corrupt_snapshot_is_parsed(tmp_path, corrupt):
+    parsed = _registry(None)
+    _registry(str(tmp_path))
+    path = _snapshot(str(tmp_path))
+    with open(path) as fp:
+        state = json.load(fp)
+    with open(path, 'w') as fp:
+        fp.write(corrupt(state))
+
+    registry = _registry(str(tmp_path))
+    assert _state(registry) == _state(parsed)
+    _check(registry)
+    # the snapshot is written again
+    with open(path) as fp:
+        assert json.load(fp) == state
+
+
+def test_caches_are_bounded_and_thread_safe():
+    registry = _registry(None, cache_size=8)
+    # prefixed units are added to the registry on first use
+    lengths = ['angstrom', 'nm', 'micron', 'mm', 'cm', 'm', 'km', 'inch']
+    for name in lengths:
+        registry[name]
+    factors = dict(((a, b), registry.Quantity(1, a).to(b).magnitude)
+                   for a in lengths for b in lengths)
+    registry.clear_cache()
+    registry.cache_info(reset=True)
+    errors = []
+
+    def work(seed):
+        try:
+            for k in range(300):
+                a = lengths[(seed + k) % len(lengths)]
+                b = lengths[(seed * k) % len(lengths)]
+                q = registry['{0:d} * {1:s}'.format(k % 20, a)]
+                assert q.magnitude == k % 20
+                assert registry.get_conversion_factor(a, b) == pytest.approx(factors[a, b])
+        except Exception as ex:
+            errors.append(ex)
+
+    threads = [threading.Thread(target=work, args=(seed, )) for seed in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    info = registry.cache_info()
+    assert info['parse_size'] <= 8 and info['factor_size'] <= 8
+    # one expression and the 2 units of the conversion factor per iteration
+    assert info['parse_hits'] + info['parse_misses'] == 3 * 8 * 300
+    assert info['factor_hits'] + info['factor_misses'] == 8 * 300
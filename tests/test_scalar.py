@@ -0,0 +1,46 @@
+""" Scalar evaluation path against the vector path """
+import numpy as np
+import pytest
+
+from pyextinction import (Cardelli, Calzetti, Fitzpatrick99, Gordon03_SMCBar,
+                          MixtureLaw, unit_policy)
+
+LAM = np.concatenate([np.geomspace(500., 40000., 300),
+                      [912., 2700., 6300., 22000., 1e4 / 5.9, 1e4 / 3.3, 1e4 / 1.1]])
+
+CASES = [(Cardelli(), dict(Av=0.7, Rv=3.3)),
+         (Calzetti(), dict(Av=0.7, Rv=4.2)),
+         (Fitzpatrick99(), dict(Av=0.7, Rv=2.6)),
+         (Gordon03_SMCBar(), dict(Av=0.7)),
+         (MixtureLaw(Fitzpatrick99(), Gordon03_SMCBar()), dict(Av=0.7, Rv=3.1, f_A=0.3)),
+         (MixtureLaw(Fitzpatrick99(), Cardelli()), dict(Rv_A=3.4, Rv_B=2.9, f_A=0.8))]
+IDS = ['Cardelli', 'Calzetti', 'F99', 'Gordon', 'mixture', 'mixture_AB']
+
+
+@pytest.fixture(autouse=True)
+def plain_wavelengths():
+    with unit_policy('assume'):
+        yield
+
+
+@pytest.mark.parametrize('law, kwargs', CASES, ids=IDS)
+@pytest.mark.parametrize('Alambda', [True, False])
+def test_scalar_matches_vector(law, kwargs, Alambda):
+    ref = law.function(LAM, Alambda=Alambda, **kwargs)
+    r = np.array([law.scalar(lamb, Alambda=Alambda, **kwargs) for lamb in LAM])
+    np.testing.assert_allclose(r, ref, rtol=1e-12, atol=1e-14)
+
+    calls = [law(float(lamb), Alambda=Alambda, **kwargs) for lamb in LAM]
+    assert all(type(c) is np.float64 for c in calls)
+    np.testing.assert_array_equal(calls, r)
+    assert law(np.array(LAM[0]), Alambda=Alambda, **kwargs) == r[0]
+
+
+@pytest.mark.parametrize('law, kwargs', CASES, ids=IDS)
+def test_extra_keywords_are_ignored(law, kwargs):
+    """ Keywords that the law does not use are accepted as on the vector
+    path """
+    extra = dict(kwargs, foo=1, f_A=kwargs.get('f_A', 0.5))
+    assert law(5500., **extra) == law.scalar(5500., **kwargs)
+    np.testing.assert_allclose(law(5500., **extra), law.function(5500., **extra),
+                               rtol=1e-12)
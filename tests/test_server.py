@@ -0,0 +1,118 @@
+""" Batching evaluation server """
+import asyncio
+
+import numpy as np
+import pytest
+
+from pyextinction import Fitzpatrick99, unit_policy
+from pyextinction.server import EvaluationClient, EvaluationServer
+
+LAM = np.linspace(1200., 25000., 100)
+
+
+async def _session(server, requests):
+    await server.start(port=0)
+    try:
+        async with EvaluationClient(port=server.address[1]) as client:
+            return [await request(client) for request in requests]
+    finally:
+        server.close()
+        await server.wait_closed()
+
+
+def test_evicted_grids_are_registered_again():
+    law = Fitzpatrick99()
+    server = EvaluationServer({'F99': law}, max_grids=2)
+    grids = [LAM, LAM[::2], LAM[::3]]
+
+    async def evict(client):
+        server.grids.clear()
+
+    requests = ([lambda c, g=g: c.evaluate('F99', g, Rv=3.1) for g in grids] * 2 +
+                [evict, lambda c: c.evaluate('F99', LAM, Rv=[2.5, 3.1])])
+    r = asyncio.run(_session(server, requests))
+
+    with unit_policy('assume'):
+        for k, g in enumerate(grids * 2):
+            np.testing.assert_allclose(r[k], law.function(g, Rv=3.1))
+        np.testing.assert_allclose(r[-1], law.function(LAM, Rv=[2.5, 3.1]))
+
+
+def _gather(server, calls, timeout=10.):
+    """ Send the requests of calls concurrently on one connection """
+    async def run(client):
+        return await asyncio.wait_for(
+            asyncio.gather(*[call(client) for call in calls]), timeout)
+    return asyncio.run(_session(server, [run]))[0]
+
+
+def _calls(n):
+    Rv = np.linspace(2.5, 4.5, n)
+    calls = [lambda c, r=r: c.evaluate('F99', LAM, Rv=r) for r in Rv[:-1]]
+    # a multi-curve request in the same batch
+    calls.append(lambda c: c.evaluate('F99', LAM, Av=[1., 2.], Rv=Rv[-1]))
+    return Rv, calls
+
+
+def _check(law, Rv, r):
+    with unit_policy('assume'):
+        for k in range(len(Rv) - 1):
+            np.testing.assert_allclose(r[k], law.function(LAM, Rv=Rv[k]))
+        np.testing.assert_allclose(r[-1], law.function(LAM, Av=np.array([1., 2.]),
+                                                       Rv=Rv[-1]))
+
+
+def test_concurrent_requests_are_coalesced():
+    law = Fitzpatrick99()
+    server = EvaluationServer({'F99': law}, max_delay=0.05)
+    Rv, calls = _calls(32)
+    _check(law, Rv, _gather(server, calls))
+    assert server.nrequests == len(calls)
+    assert server.nbatches < server.nrequests
+
+
+def test_full_batches_are_flushed_early():
+    law = Fitzpatrick99()
+    # batches would wait longer than the timeout unless flushed when full
+    server = EvaluationServer({'F99': law}, max_batch=4, max_delay=60.)
+    Rv = np.linspace(2.5, 4.5, 8)
+    r = _gather(server, [lambda c, v=v: c.evaluate('F99', LAM, Rv=v) for v in Rv])
+    with unit_policy('assume'):
+        np.testing.assert_allclose(r, law.function(LAM, Rv=Rv[:, None]))
+    assert server.nbatches == 2
+
+
+def test_back_pressure():
+    law = Fitzpatrick99()
+    server = EvaluationServer({'F99': law}, max_pending=2, max_delay=0.01)
+    Rv, calls = _calls(16)
+    _check(law, Rv, _gather(server, calls))
+    assert server.nrequests == len(calls)
+    # no more than max_pending requests in a batch
+    assert server.nbatches >= len(calls) // 2
+
+
+def test_request_after_server_disconnect():
+    async def run():
+        async def hang_up(reader, writer):
+            writer.close()
+
+        server = await asyncio.start_server(hang_up, host='127.0.0.1', port=0)
+        try:
+            client = EvaluationClient(port=server.sockets[0].getsockname()[1])
+            await client.connect()
+            await asyncio.wait_for(asyncio.wait([client._listener]), 5.)
+            with pytest.raises(ConnectionError):
+                await asyncio.wait_for(client.evaluate('F99', LAM), 5.)
+            await client.close()
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    asyncio.run(run())
+
+
+def test_unknown_law():
+    server = EvaluationServer({'F99': Fitzpatrick99()})
+    with pytest.raises(ValueError, match='Unknown law'):
+        asyncio.run(_session(server, [lambda c: c.evaluate('XX', LAM)]))
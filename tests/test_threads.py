@@ -0,0 +1,76 @@
+""" Evaluation of long wavelength arrays on threads """
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from pyextinction import (Calzetti, Cardelli, Fitzpatrick99, Gordon03_SMCBar,
+                          MixtureLaw, WavelengthGrid, extinction, unit_policy)
+from pyextinction.helpers import shutdown_thread_pools, thread_pool
+
+LAWS = [Cardelli, Calzetti, Fitzpatrick99, Gordon03_SMCBar,
+        lambda: MixtureLaw(Fitzpatrick99(), Gordon03_SMCBar())]
+
+PARAMS = [dict(Av=1.3, Rv=3.1),
+          dict(Av=np.array([0.5, 1., 2.]), Rv=np.array([2.5, 3.1, 4.])),
+          dict(Av=np.array([0.5, 2.])[:, None, None], Rv=np.array([2.5, 3.1, 4.]))]
+
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+    # many chunks for short arrays
+    monkeypatch.setattr(extinction, 'THREAD_CHUNK_SIZE', 16)
+    with unit_policy('assume'):
+        yield
+
+
+@pytest.mark.parametrize('size', [15, 16, 32, 97, 250])
+@pytest.mark.parametrize('params', PARAMS, ids=['scalar', 'array', '2d'])
+@pytest.mark.parametrize('make', LAWS)
+def test_threads_match_serial(make, params, size):
+    law = make()
+    if isinstance(law, MixtureLaw):
+        params = dict(params, f_A=0.3)
+    lamb = np.linspace(1200., 25000., size)
+    ref = law(lamb, **params)
+    np.testing.assert_array_equal(law(lamb, threads=3, **params), ref)
+
+    out = np.full_like(ref, np.nan)
+    r = law(lamb, threads=3, out=out, **params)
+    assert r is out
+    np.testing.assert_array_equal(out, ref)
+
+
+def test_grid_executor_and_dtype():
+    law = Fitzpatrick99()
+    lamb = np.linspace(1200., 25000., 120).reshape(4, 30)
+    ref = law(lamb, Rv=np.array([2.5, 3.1])[:, None, None])
+    with ThreadPoolExecutor(2) as executor:
+        r = law(WavelengthGrid(lamb), threads=executor,
+                Rv=np.array([2.5, 3.1])[:, None, None])
+    assert r.shape == (2, 4, 30)
+    np.testing.assert_array_equal(r, ref)
+
+    lamb = lamb.astype(np.float32)
+    r = law(lamb, threads=2)
+    assert r.dtype == np.float32
+    np.testing.assert_array_equal(r, law(lamb))
+
+
+def test_default_chunk_size(monkeypatch):
+    monkeypatch.undo()
+    law = Cardelli()
+    lamb = np.linspace(1200., 25000., 2 * extinction.THREAD_CHUNK_SIZE + 3)
+    with unit_policy('assume'):
+        np.testing.assert_array_equal(law(lamb, threads=2, Rv=2.7), law(lamb, Rv=2.7))
+
+
+def test_shutdown_thread_pools():
+    pool = thread_pool(2)
+    assert thread_pool(2) is pool
+    shutdown_thread_pools()
+    with pytest.raises(RuntimeError):
+        pool.submit(int)
+    other = thread_pool(2)
+    assert other is not pool
+    assert other.submit(int, '3').result() == 3
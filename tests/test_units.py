@@ -0,0 +1,18 @@
+""" Missing unit warnings point to the caller of the package """
+import numpy as np
+import pytest
+
+from pyextinction import Cardelli, Fitzpatrick99, WavelengthGrid, unit_policy
+
+
+@pytest.mark.parametrize('call', [
+    lambda: Cardelli()(np.array([5500., 6000.])),
+    lambda: Cardelli()(5500.),
+    lambda: Fitzpatrick99().function(np.array([5500., 6000.])),
+    lambda: Fitzpatrick99()(np.array([5500., 6000.]), threads=2),
+    lambda: WavelengthGrid(np.array([5500., 6000.])),
+], ids=['call', 'scalar', 'function', 'threads', 'grid'])
+def test_warning_location(call):
+    with unit_policy('warn'), pytest.warns(UserWarning, match='explicit units') as record:
+        call()
+    assert record[0].filename == __file__
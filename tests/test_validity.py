@@ -0,0 +1,115 @@
+""" Vectorized isvalid and domain against element by element evaluation """
+import math
+
+import numpy as np
+import pytest
+
+from pyextinction import (Calzetti, Cardelli, Fitzpatrick99, Gordon03_SMCBar,
+                          MixtureLaw, unit_policy)
+
+AV = [1., -0.5, np.nan, np.inf]
+RV = [3.1, 2., 6., 1.5, 6.5, np.nan]
+F_A = [0.3, 0., 1., -0.1, 1.2, np.nan]
+
+
+def _scalar_mixture(law, Av=None, Rv=None, f_A=0.5, Rv_A=None, Rv_B=None):
+    """ validity of a single parameter set with float arithmetic """
+    if Rv_A is None:
+        Rv_A = getattr(law.A, 'Rv', None)
+    if Rv_B is None:
+        Rv_B = getattr(law.B, 'Rv', None)
+    if sum([Rv is None, Rv_A is None, Rv_B is None]) >= 2:
+        return False
+    try:
+        if Rv_A is None:
+            Rv_A = 1. / (1. / (Rv * f_A) - (1. - f_A) / (f_A * Rv_B))
+        if Rv is None:
+            Rv = 1. / (f_A / Rv_A + (1. - f_A) / Rv_B)
+        if Rv_B is None:
+            Rv_B = (1. - f_A) / (1. / Rv - f_A / Rv_A)
+    except ZeroDivisionError:
+        # undetermined component R(V)
+        return False
+    lo, hi = law.Rv_range
+    return ((Av is None or math.isfinite(Av)) and (0. <= f_A <= 1.) and
+            all(lo <= v <= hi for v in (Rv, Rv_A, Rv_B)))
+
+
+def _grid(**values):
+    """ broadcast arrays spanning every combination of the values """
+    names = sorted(values)
+    arrays = np.meshgrid(*[np.array(values[k], dtype=float) for k in names],
+                         indexing='ij')
+    return dict(zip(names, arrays))
+
+
+def _loop(func, arrays):
+    names = sorted(arrays)
+    r = np.empty(arrays[names[0]].shape, dtype=bool)
+    for index in np.ndindex(r.shape):
+        r[index] = func(**dict((k, float(arrays[k][index])) for k in names))
+    return r
+
+
+@pytest.mark.parametrize('make', [Cardelli, Calzetti, Fitzpatrick99, Gordon03_SMCBar])
+def test_single_laws(make):
+    law = make()
+    arrays = _grid(Av=AV, Rv=RV)
+    r = law.isvalid(**arrays)
+    ref = _loop(lambda Av, Rv: math.isfinite(Av) and math.isfinite(Rv), arrays)
+    np.testing.assert_array_equal(r, ref)
+    for index in np.ndindex(r.shape):
+        assert law.isvalid(Av=arrays['Av'][index], Rv=arrays['Rv'][index]) == r[index]
+    assert law.isvalid()
+
+
+@pytest.mark.parametrize('make, values', [
+    # derived Rv_A, B at its default R(V)
+    (lambda: MixtureLaw(Fitzpatrick99(), Gordon03_SMCBar()),
+     dict(Av=AV, Rv=RV, f_A=F_A)),
+    # derived Rv_B, A at its default R(V)
+    (lambda: MixtureLaw(Gordon03_SMCBar(), Fitzpatrick99()),
+     dict(Rv=RV, f_A=F_A)),
+    # derived Rv
+    (lambda: MixtureLaw(Fitzpatrick99(), Cardelli()),
+     dict(Rv_A=RV, Rv_B=RV[:4], f_A=F_A)),
+    # derived Rv_B from Rv and Rv_A, and Rv_A from Rv and Rv_B
+    (lambda: MixtureLaw(Fitzpatrick99(), Cardelli()),
+     dict(Rv=RV, Rv_A=RV[:4], f_A=F_A)),
+    (lambda: MixtureLaw(Fitzpatrick99(), Cardelli()),
+     dict(Av=AV[:3], Rv=RV, Rv_B=RV[:4], f_A=F_A)),
+    # nothing derived
+    (lambda: MixtureLaw(Fitzpatrick99(), Cardelli()),
+     dict(Rv=RV[:3], Rv_A=RV, Rv_B=RV, f_A=F_A[:3])),
+])
+def test_mixture(make, values):
+    law = make()
+    arrays = _grid(**values)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r = law.isvalid(**arrays)
+    ref = _loop(lambda **kw: _scalar_mixture(law, **kw), arrays)
+    assert r.shape == ref.shape
+    np.testing.assert_array_equal(r, ref)
+    assert np.any(ref) and not np.all(ref)
+
+
+def test_mixture_missing_Rv():
+    law = MixtureLaw(Fitzpatrick99(), Cardelli())
+    assert not law.isvalid(Rv=3.1, f_A=0.5)
+    assert not law.isvalid(Rv=np.array([3.1, 3.3]), f_A=0.5)
+
+
+@pytest.mark.parametrize('make', [Cardelli, Calzetti, Fitzpatrick99, Gordon03_SMCBar,
+                                  lambda: MixtureLaw(Cardelli(), Calzetti())])
+def test_domain(make):
+    law = make()
+    # regular and boundary wavelengths of the laws
+    edges = [912., 1e3, 1e4 / 10., 1e4 / 8., 6300., 22000., 1e4 / 0.3]
+    lamb = np.sort(np.concatenate([np.logspace(2.5, 5.5, 200), edges]))
+    # mixtures are defined where both components are
+    components = (law.A, law.B) if isinstance(law, MixtureLaw) else (law, )
+    with unit_policy('assume'):
+        mask = law.domain(lamb)
+        ref = np.array([all(c(float(l)) != 0 for c in components) for l in lamb])
+        np.testing.assert_array_equal(mask, ref)
+        np.testing.assert_array_equal(law.domain(lamb.reshape(-1, 1)), ref[:, None])